@@ -1,3 +1,9 @@
-from .main import main
+__all__ = ['main']
 
-__all__ = ['main']
\ No newline at end of file
+def __getattr__(name):
+    # Imported on first use, so importing the package stays cheap
+    if name == 'main':
+        from .main import main
+        globals()['main'] = main
+        return main
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
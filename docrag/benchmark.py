@@ -0,0 +1,391 @@
+import os
+import sys
+import json
+import time
+import base64
+import random
+import asyncio
+import argparse
+import contextlib
+import resource
+import tempfile
+import threading
+import statistics
+import subprocess
+from dataclasses import dataclass, asdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+from token_counter import make_token_counter
+import metrics
+
+STUB_MODEL = "stub-embedding"
+SYLLABLES = ("ka", "lo", "mi", "ne", "ru", "sa", "to", "vi", "xe", "zu", "pa", "de", "fo", "gi", "ha", "ju")
+COMMON_WORDS = ("the", "a", "to", "of", "and", "is", "in", "for", "with", "when", "this", "you", "can", "be")
+
+@dataclass
+class LabelledQuery:
+    query: str
+    file_path: str
+    kind: str
+
+# Synthetic corpus
+
+def _word(rng: random.Random, syllables: int) -> str:
+    return ''.join(rng.choice(SYLLABLES) for _ in range(syllables))
+
+def _git(repo_dir: str, *args: str):
+    subprocess.run(["git", "-c", "user.name=bench", "-c", "user.email=bench@localhost", *args],
+                   cwd=repo_dir, check=True, capture_output=True)
+
+def generate_corpus(repo_dir: str, files: int = 200, sections: int = 6, paragraphs: int = 3, dirs: int = 8,
+                    code_ratio: float = 0.3, queries: int = 100, seed: int = 0) -> List[LabelledQuery]:
+    """Write a git repository of synthetic markdown docs under `repo_dir/docs` and label queries for it.
+
+    Every section has its own pair of topic words and every code block its
+    own identifier, so each query has exactly one relevant file.
+    """
+    rng = random.Random(seed)
+    vocabulary = sorted({_word(rng, rng.randint(2, 4)) for _ in range(4000)})
+    # Zipf-like word frequencies, as in natural text
+    weights = [1 / (rank + 1) for rank in range(len(vocabulary))]
+    used_topics = set()
+    candidates: List[LabelledQuery] = []
+
+    os.makedirs(repo_dir, exist_ok=True)
+    for file_index in range(files):
+        relative = os.path.join("docs", f"area{file_index % dirs}", f"page{file_index}.md")
+        title = ' '.join(_word(rng, 3) for _ in range(2)).title()
+        lines = [f"# {title}", ""]
+        for section_index in range(sections):
+            topic = None
+            while topic is None or topic in used_topics:
+                topic = (_word(rng, 4), _word(rng, 4))
+            used_topics.add(topic)
+            lines += [f"## {topic[0].title()} {topic[1]}", ""]
+            for _ in range(paragraphs):
+                words = rng.choices(vocabulary, weights=weights, k=rng.randint(40, 90))
+                words += rng.choices(COMMON_WORDS, k=len(words) // 3)
+                rng.shuffle(words)
+                for word in topic:
+                    words.insert(rng.randrange(len(words)), word)
+                lines += [' '.join(words) + '.', ""]
+            candidates.append(LabelledQuery(
+                f"how do I {topic[0]} the {topic[1]} {rng.choice(vocabulary[:200])}", relative, "topic"
+            ))
+            if rng.random() < code_ratio:
+                identifier = f"client.{_word(rng, 3)}{_word(rng, 3).title()}"
+                lines += ["```python", f"result = {identifier}(timeout=30)", "print(result)", "```", ""]
+                candidates.append(LabelledQuery(identifier, relative, "identifier"))
+        path = os.path.join(repo_dir, relative)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            f.write('\n'.join(lines))
+
+    _git(repo_dir, "init", "-q")
+    _git(repo_dir, "add", ".")
+    _git(repo_dir, "commit", "-q", "-m", "Synthetic corpus")
+    return rng.sample(candidates, min(queries, len(candidates)))
+
+def change_one_file(repo_dir: str, seed: int = 0) -> str:
+    """Append a section to one file of the corpus and commit it; returns the file's relative path"""
+    rng = random.Random(seed + 1)
+    docs = sorted(os.path.join(root, name) for root, _, names in os.walk(os.path.join(repo_dir, "docs"))
+                  for name in names)
+    path = rng.choice(docs)
+    with open(path, 'a') as f:
+        f.write(f"\n## Changed {_word(rng, 4)}\n\n{' '.join(_word(rng, 3) for _ in range(60))}.\n")
+    _git(repo_dir, "commit", "-q", "-a", "-m", "Change one file")
+    return os.path.relpath(path, repo_dir)
+
+# Stub embeddings API
+
+class StubEmbeddingServer:
+    """OpenAI-compatible /v1/embeddings endpoint on localhost.
+
+    Vectors come from the hashing embedder, so they are deterministic and
+    lexically meaningful. Each request sleeps `latency` seconds, and a
+    `rate_limit_ratio` share of requests is answered with 429.
+    """
+
+    def __init__(self, dimension: int = 256, latency: float = 0.0, rate_limit_ratio: float = 0.0,
+                 retry_after_ms: int = 50, seed: int = 0):
+        from embedding_providers import HashingEmbeddingProvider
+        self.embedder = HashingEmbeddingProvider(dimension)
+        self.latency = latency
+        self.rate_limit_ratio = rate_limit_ratio
+        self.retry_after_ms = retry_after_ms
+        self.rng = random.Random(seed)
+        self.count_tokens = make_token_counter()
+        self.lock = threading.Lock()
+        self.counters = {'requests': 0, 'throttled': 0, 'inputs': 0, 'tokens': 0}
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.server.server_address[1]}/v1"
+
+    def snapshot(self) -> Dict[str, int]:
+        with self.lock:
+            return dict(self.counters)
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def _reply(self, status: int, body: Dict, headers: Optional[Dict[str, str]] = None):
+                data = json.dumps(body).encode('utf-8')
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                texts = body.get("input") or []
+                texts = [texts] if isinstance(texts, str) else texts
+                if stub.latency:
+                    time.sleep(stub.latency)
+                with stub.lock:
+                    stub.counters['requests'] += 1
+                    throttled = stub.rng.random() < stub.rate_limit_ratio
+                    if throttled:
+                        stub.counters['throttled'] += 1
+                if throttled:
+                    self._reply(429, {'error': {'message': "Rate limit exceeded", 'type': "rate_limit_error"}},
+                                {'retry-after-ms': str(stub.retry_after_ms)})
+                    return
+                tokens = sum(stub.count_tokens(text) for text in texts)
+                with stub.lock:
+                    stub.counters['inputs'] += len(texts)
+                    stub.counters['tokens'] += tokens
+                matrix = stub.embedder.encode(texts)
+                if body.get("encoding_format") == "base64":
+                    embeddings = [base64.b64encode(row.astype('<f4').tobytes()).decode('ascii') for row in matrix]
+                else:
+                    embeddings = matrix.tolist()
+                self._reply(200, {
+                    'object': "list",
+                    'model': body.get("model", STUB_MODEL),
+                    'data': [{'object': "embedding", 'index': i, 'embedding': e} for i, e in enumerate(embeddings)],
+                    'usage': {'prompt_tokens': tokens, 'total_tokens': tokens}
+                })
+
+        return Handler
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+
+# Measurements
+
+def _api_delta(before: Dict[str, int], after: Dict[str, int]) -> Dict[str, int]:
+    return {key: after[key] - before[key] for key in after}
+
+def _rate(count: float, seconds: float) -> float:
+    return round(count / seconds, 2) if seconds > 0 else 0.0
+
+def _peak_rss_mb() -> Dict[str, float]:
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return {
+        'main': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale, 1),
+        'workers': round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale, 1),
+    }
+
+def _percentile(values: List[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def evaluate_retrieval(client, collection_name: str, queries: List[LabelledQuery], k: int, state=None) -> Dict:
+    """recall@k, MRR@k and latency of `search_qdrant` over the labelled queries"""
+    from qdrant_query_interface import search_qdrant
+    hits, reciprocal_ranks, latencies = 0, [], []
+    by_kind: Dict[str, List[int]] = {}
+    for labelled in queries:
+        start = time.perf_counter()
+        results = search_qdrant(client, collection_name, labelled.query, limit=k, state=state)
+        latencies.append((time.perf_counter() - start) * 1000)
+        rank = next((i for i, point in enumerate(results, start=1)
+                     if point.payload['file_path'].endswith(labelled.file_path)), None)
+        hits += rank is not None
+        reciprocal_ranks.append(1 / rank if rank else 0.0)
+        by_kind.setdefault(labelled.kind, []).append(rank is not None)
+    return {
+        f'recall@{k}': round(hits / len(queries), 4) if queries else 0.0,
+        'mrr': round(statistics.fmean(reciprocal_ranks), 4) if queries else 0.0,
+        'recall_by_kind': {kind: round(sum(found) / len(found), 4) for kind, found in by_kind.items()},
+        'latency_ms_p50': round(_percentile(latencies, 0.5), 2),
+        'latency_ms_p95': round(_percentile(latencies, 0.95), 2),
+    }
+
+async def _measure_stages(client, markdown_files: List[str], provider, workers: int) -> Dict:
+    """Throughput of each pipeline stage run on its own over the whole corpus"""
+    from markdown_processor import iter_processed_files
+    from qdrant_uploader import setup_qdrant_collection, assign_point_ids, upsert_chunk_batch
+    from chunk_batch import ChunkBatch
+
+    loop = asyncio.get_running_loop()
+    start = time.perf_counter()
+    processed = await loop.run_in_executor(None, lambda: list(iter_processed_files(markdown_files, workers=workers)))
+    chunk_seconds = time.perf_counter() - start
+    chunks = [chunk for file_chunks, _ in processed for chunk in file_chunks]
+    file_hashes = {manifest['file_path']: manifest['file_hash'] for _, manifest in processed}
+
+    texts = [chunk['text'] for chunk in chunks]
+    start = time.perf_counter()
+    result = await provider.embed(texts)
+    embed_seconds = time.perf_counter() - start
+
+    collection_name = "benchmark_upsert"
+    embedded = sorted(result.vectors)
+    batch = ChunkBatch.from_rows(assign_point_ids(collection_name, [chunks[i] for i in embedded]),
+                                 [result.vectors[i] for i in embedded])
+    vectors = batch.vectors
+    setup_qdrant_collection(client, collection_name, batch.dimension)
+    start = time.perf_counter()
+    for offset in range(0, len(batch), 256):
+        upsert_chunk_batch(client, collection_name, batch[offset:offset + 256], file_hashes)
+    upsert_seconds = time.perf_counter() - start
+    client.delete_collection(collection_name=collection_name)
+
+    return {
+        'chunk': {'seconds': round(chunk_seconds, 3), 'files_per_s': _rate(len(markdown_files), chunk_seconds),
+                  'chunks_per_s': _rate(len(chunks), chunk_seconds)},
+        'embed': {'seconds': round(embed_seconds, 3), 'chunks_per_s': _rate(len(vectors), embed_seconds),
+                  'tokens_per_s': _rate(result.tokens, embed_seconds), 'requests': result.requests,
+                  'retries': result.retries, 'failed': len(result.failed)},
+        'upsert': {'seconds': round(upsert_seconds, 3), 'points_per_s': _rate(len(vectors), upsert_seconds)},
+    }
+
+async def run_benchmark(args) -> Dict:
+    # Configure before anything creates the process-wide provider or cache
+    os.environ["DOCRAG_EMBEDDING_CACHE"] = "off"
+    os.environ["DOCRAG_EMBEDDING_PROVIDER"] = "openai"
+    os.environ["DOCRAG_EMBEDDING_MODEL"] = STUB_MODEL
+    os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+
+    from github_docs_extractor import clone_or_pull_repo, find_markdown_files
+    from index_state import IndexState, get_state_path
+    from embedding_providers import get_embedding_provider
+    from repo_indexer import index_repository
+    from vector_store import connect_vector_store
+
+    if not metrics.enabled():
+        metrics.enable()
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="docrag-bench-")
+    source_dir = os.path.join(work_dir, "source")
+    clone_dir = os.path.join(work_dir, "clone")
+    collection_name = "benchmark_docs"
+    report: Dict = {'config': {k: v for k, v in vars(args).items() if k != 'output'}, 'work_dir': work_dir}
+
+    start = time.perf_counter()
+    queries = generate_corpus(source_dir, files=args.files, sections=args.sections, paragraphs=args.paragraphs,
+                              dirs=args.dirs, code_ratio=args.code_ratio, queries=args.queries, seed=args.seed)
+    corpus_files = find_markdown_files(source_dir)
+    report['corpus'] = {
+        'files': len(corpus_files),
+        'bytes': sum(os.path.getsize(f) for f in corpus_files),
+        'queries': len(queries),
+        'generate_seconds': round(time.perf_counter() - start, 3),
+    }
+
+    with StubEmbeddingServer(args.dimension, args.latency, args.rate_limit_ratio, seed=args.seed) as stub:
+        os.environ["OPENAI_BASE_URL"] = stub.base_url
+        client = connect_vector_store(args.vector_store)
+        state = IndexState(get_state_path(clone_dir))
+        provider = get_embedding_provider()
+        repo_url = f"file://{os.path.abspath(source_dir)}"
+
+        async def ingest() -> Dict:
+            """Clone or update, then index: the same path as `async_main`"""
+            before = stub.snapshot()
+            start = time.perf_counter()
+            clone_or_pull_repo(repo_url, clone_dir)
+            stats = await index_repository(client, collection_name, state, repo_url, clone_dir,
+                                           embedding_provider=provider, workers=args.workers)
+            seconds = time.perf_counter() - start
+            run = {'seconds': round(seconds, 3), 'api': _api_delta(before, stub.snapshot())}
+            if stats is not None:
+                run.update(files_indexed=stats.files_indexed, files_skipped=stats.files_skipped,
+                           chunks_embedded=stats.chunks_embedded, chunks_retained=stats.chunks_retained,
+                           failed_chunks=len(stats.failed_chunks),
+                           files_per_s=_rate(stats.files_indexed, seconds),
+                           chunks_per_s=_rate(stats.chunks_embedded, seconds))
+            return run
+
+        report['ingest'] = await ingest()
+        report['reindex_noop'] = await ingest()
+        report['changed_file'] = change_one_file(source_dir, args.seed)
+        report['reindex_one_file'] = await ingest()
+
+        if not args.skip_stages:
+            before = stub.snapshot()
+            report['stages'] = await _measure_stages(client, find_markdown_files(clone_dir), provider, args.workers)
+            report['stages']['embed']['api'] = _api_delta(before, stub.snapshot())
+
+        loop = asyncio.get_running_loop()
+        report['retrieval'] = {}
+        for mode, mode_state in (('hybrid', state), ('vector', None)):
+            before = stub.snapshot()
+            result = await loop.run_in_executor(
+                None, evaluate_retrieval, client, collection_name, queries, args.k, mode_state
+            )
+            result['api'] = _api_delta(before, stub.snapshot())
+            report['retrieval'][mode] = result
+        report['api_total'] = stub.snapshot()
+
+    report['peak_rss_mb'] = _peak_rss_mb()
+    report['metrics'] = metrics.snapshot()
+    report['queries_sample'] = [asdict(q) for q in queries[:5]]
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ingestion and retrieval on a synthetic corpus")
+    parser.add_argument("--files", type=int, default=200, help="Markdown files in the synthetic repository")
+    parser.add_argument("--sections", type=int, default=6, help="Sections per file")
+    parser.add_argument("--paragraphs", type=int, default=3, help="Paragraphs per section")
+    parser.add_argument("--dirs", type=int, default=8, help="Directories the files are spread over")
+    parser.add_argument("--code-ratio", type=float, default=0.3, help="Share of sections with a code block")
+    parser.add_argument("--queries", type=int, default=100, help="Labelled queries to evaluate")
+    parser.add_argument("--k", type=int, default=5, help="Cut-off for recall@k and MRR")
+    parser.add_argument("--dimension", type=int, default=256, help="Dimension of the stub embeddings")
+    parser.add_argument("--latency", type=float, default=0.02, help="Seconds the stub API takes per request")
+    parser.add_argument("--rate-limit-ratio", type=float, default=0.0,
+                        help="Share of stub API requests answered with 429")
+    parser.add_argument("--workers", type=int, default=None, help="Chunking processes (default: CPU count)")
+    parser.add_argument("--vector-store", default=":memory:",
+                        help='":memory:" (in-process Qdrant), "local:<dir>" or a Qdrant "host:port"')
+    parser.add_argument("--skip-stages", action="store_true", help="Do not measure the stages in isolation")
+    parser.add_argument("--work-dir", help="Directory for the corpus and the clone (default: a temporary one)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the JSON report here instead of to stdout")
+    args = parser.parse_args()
+
+    # Keep stdout for the report; progress output of the pipeline goes to stderr
+    with contextlib.redirect_stdout(sys.stderr):
+        report = asyncio.run(run_benchmark(args))
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+        print(f"Report written to {args.output}")
+    else:
+        print(output)
+
+if __name__ == "__main__":
+    main()
@@ -1,110 +1,217 @@
-from typing import List, Dict, Optional
-from dataclasses import dataclass
-from openai import OpenAI
+import asyncio
+import logging
+import time
+from typing import AsyncIterator, List, Dict, Optional
+from openai import OpenAI, AsyncOpenAI
 import os
-from qdrant_query_interface import search_qdrant
-from qdrant_client import QdrantClient
+from qdrant_query_interface import search_qdrant, async_search_qdrant
+from query_cache import QueryCache
+from result_diversity import merge_adjacent_chunks
+from index_state import IndexState
+from conversation_context import ConversationContext, Document, Message
+from qdrant_client import QdrantClient, AsyncQdrantClient
+import metrics
 
-@dataclass
-class Message:
-    role: str  # "system", "user", or "assistant"
-    content: str
+logger = logging.getLogger(__name__)
 
-@dataclass
-class Document:
-    title: str
-    contents: str
+CHAT_MODEL = "gpt-3.5-turbo"
+SYSTEM_PROMPT = "You are a helpful assistant with access to documentation. Use the provided documentation context to give accurate answers. If you're not sure about something, say so."
 
-class ChatInterface:
-    def __init__(self, qdrant_client: QdrantClient, collection_name: str):
-        self.openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-        self.qdrant_client = qdrant_client
+class BaseChatInterface:
+    """Conversation state shared by the sync and async chat interfaces"""
+
+    def __init__(self, collection_name: str, query_cache: Optional[QueryCache] = None,
+                 max_context_tokens: int = 3000, summarize_history: bool = False,
+                 state: Optional[IndexState] = None, mmr_lambda: Optional[float] = 0.5,
+                 merge_adjacent: bool = False):
         self.collection_name = collection_name
-        self.conversation_history: List[Message] = []
-        self.context_documents: List[Document] = []
+        self.query_cache = query_cache
+        # With the index state, retrieval is hybrid lexical + vector search
+        self.state = state
+        # Retrieved chunks are diversified with MMR unless this is None
+        self.mmr_lambda = mmr_lambda
+        # Consecutive chunks of one file are sent as one passage
+        self.merge_adjacent = merge_adjacent
+        self.context = ConversationContext(
+            SYSTEM_PROMPT, max_tokens=max_context_tokens, summarize=summarize_history
+        )
+
+    @property
+    def context_documents(self) -> List[Document]:
+        return self.context.context_documents
+
+    def _prepare_messages(self, user_input: str, results) -> List[Dict]:
+        """Add the retrieved documents to the context and build the API messages"""
+        if self.merge_adjacent:
+            results = merge_adjacent_chunks(results)
+        new_docs = self.context.add_results(results)
         
-        # Initialize with system message
-        self.conversation_history.append(Message(
-            role="system",
-            content="You are a helpful assistant with access to documentation. Use the provided documentation context to give accurate answers. If you're not sure about something, say so."
-        ))
+        # Log the files being used for context
+        if new_docs:
+            logger.info("Relevant documentation files:\n%s", '\n'.join(f"- {doc.title}" for doc in new_docs))
+
+        return self.context.build_messages(user_input)
 
-    def _get_relevant_docs(self, query: str) -> List[Document]:
+class ChatInterface(BaseChatInterface):
+    def __init__(self, qdrant_client: QdrantClient, collection_name: str, query_cache: Optional[QueryCache] = None,
+                 max_context_tokens: int = 3000, summarize_history: bool = False,
+                 state: Optional[IndexState] = None, mmr_lambda: Optional[float] = 0.5,
+                 merge_adjacent: bool = False):
+        super().__init__(collection_name, query_cache, max_context_tokens, summarize_history, state,
+                         mmr_lambda, merge_adjacent)
+        self.openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        self.qdrant_client = qdrant_client
+
+    def _search(self, query: str):
         """Search for relevant documents based on the query"""
-        results = search_qdrant(
+        return search_qdrant(
             self.qdrant_client, 
             self.collection_name, 
             query,
-            limit=3
+            limit=3,
+            cache=self.query_cache,
+            state=self.state,
+            mmr_lambda=self.mmr_lambda
         )
-        
-        docs = []
-        for result in results:
-            doc = Document(
-                title=result.payload['file_path'],
-                contents=result.payload['text']
-            )
-            # Only add if not already in context
-            if not any(d.title == doc.title and d.contents == doc.contents 
-                      for d in self.context_documents):
-                docs.append(doc)
-        
-        return docs
 
-    def _format_context(self, docs: List[Document]) -> str:
-        """Format documents into a string context"""
-        context = []
-        for doc in docs:
-            context.append(f"<title>{doc.title}</title>")
-            context.append(f"<contents>{doc.contents}</contents>")
-        return "\n\n".join(context)
+    def _summarize(self):
+        """Fold turns that no longer fit the budget into the running summary"""
+        turns = self.context.turns_to_summarize()
+        if not turns:
+            return
+        try:
+            response = self.openai_client.chat.completions.create(
+                model=CHAT_MODEL,
+                messages=self.context.summary_messages(turns),
+                temperature=0,
+                max_tokens=300
+            )
+            self.context.set_summary(response.choices[0].message.content, turns)
+        except Exception as e:
+            logger.warning("Error summarizing conversation: %s", e)
 
     def chat(self, user_input: str) -> str:
         """Process user input and return assistant's response"""
-        # Get relevant documents
-        new_docs = self._get_relevant_docs(user_input)
-        self.context_documents.extend(new_docs)
-        
-        # Print the files being used for context
-        print("\nRelevant documentation files:")
-        for doc in new_docs:
-            print(f"- {doc.title}")
-        
-        # Format context from all documents
-        context = self._format_context(self.context_documents)
-        
-        # Add user message with context
-        user_message = (
-            f"Context:\n{context}\n\n"
-            f"User Question: {user_input}"
-        )
-        self.conversation_history.append(Message(role="user", content=user_message))
-        
-        # Create messages for API
-        messages = [
-            {"role": msg.role, "content": msg.content}
-            for msg in self.conversation_history
-        ]
+        messages = self._prepare_messages(user_input, self._search(user_input))
         
         # Get completion from OpenAI
         try:
-            response = self.openai_client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=messages,
-                temperature=0.7,
-                max_tokens=1000
-            )
+            with metrics.span('completion', model=CHAT_MODEL):
+                response = self.openai_client.chat.completions.create(
+                    model=CHAT_MODEL,
+                    messages=messages,
+                    temperature=0.7,
+                    max_tokens=1000
+                )
+            metrics.incr('api_requests_total', api='chat', status='ok')
             
             assistant_response = response.choices[0].message.content
             
-            # Add assistant's response to history
-            self.conversation_history.append(
-                Message(role="assistant", content=assistant_response)
-            )
+            # Add the turn to history, without its context
+            self.context.add_turn(user_input, assistant_response)
+            self._summarize()
             
             return assistant_response
             
         except Exception as e:
+            metrics.incr('api_requests_total', api='chat', status='error')
+            error_msg = f"Error getting response from OpenAI: {str(e)}"
+            logger.error(error_msg)
+            return error_msg
+
+class AsyncChatInterface(BaseChatInterface):
+    """Non-blocking chat session that streams the completion as it is generated.
+
+    Retrieval goes through an AsyncQdrantClient and the completion is
+    requested with `stream=True`, so the first tokens can be shown while the
+    rest is still being generated. The OpenAI and Qdrant clients can be
+    shared, so one process can serve many sessions concurrently; each
+    session only owns its conversation state.
+    """
+
+    def __init__(self, qdrant_client: AsyncQdrantClient, collection_name: str,
+                 query_cache: Optional[QueryCache] = None, openai_client: Optional[AsyncOpenAI] = None,
+                 max_context_tokens: int = 3000, summarize_history: bool = False,
+                 state: Optional[IndexState] = None, mmr_lambda: Optional[float] = 0.5,
+                 merge_adjacent: bool = False):
+        super().__init__(collection_name, query_cache, max_context_tokens, summarize_history, state,
+                         mmr_lambda, merge_adjacent)
+        self.openai_client = openai_client or AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        self.qdrant_client = qdrant_client
+        self._summary_task: Optional[asyncio.Future] = None
+
+    async def _search(self, query: str):
+        """Search for relevant documents based on the query"""
+        return await async_search_qdrant(
+            self.qdrant_client,
+            self.collection_name,
+            query,
+            limit=3,
+            cache=self.query_cache,
+            state=self.state,
+            mmr_lambda=self.mmr_lambda
+        )
+
+    async def _summarize(self):
+        """Fold turns that no longer fit the budget into the running summary"""
+        turns = self.context.turns_to_summarize()
+        if not turns:
+            return
+        try:
+            response = await self.openai_client.chat.completions.create(
+                model=CHAT_MODEL,
+                messages=self.context.summary_messages(turns),
+                temperature=0,
+                max_tokens=300
+            )
+            self.context.set_summary(response.choices[0].message.content, turns)
+        except Exception as e:
+            logger.warning("Error summarizing conversation: %s", e)
+
+    async def chat_stream(self, user_input: str) -> AsyncIterator[str]:
+        """Yield the assistant's response piece by piece; it is added to the history once complete"""
+        results = await self._search(user_input)
+        if self._summary_task is not None:
+            # Usually finished while the user was typing
+            await self._summary_task
+            self._summary_task = None
+        messages = self._prepare_messages(user_input, results)
+        
+        parts = []
+        start = time.perf_counter()
+        try:
+            stream = await self.openai_client.chat.completions.create(
+                model=CHAT_MODEL,
+                messages=messages,
+                temperature=0.7,
+                max_tokens=1000,
+                stream=True
+            )
+            async for event in stream:
+                if not event.choices:
+                    continue
+                delta = event.choices[0].delta.content
+                if delta:
+                    if not parts:
+                        metrics.record('completion_first_token', time.perf_counter() - start, model=CHAT_MODEL)
+                    parts.append(delta)
+                    yield delta
+            metrics.record('completion', time.perf_counter() - start, model=CHAT_MODEL)
+            metrics.incr('api_requests_total', api='chat', status='ok')
+        except Exception as e:
+            metrics.incr('api_requests_total', api='chat', status='error')
             error_msg = f"Error getting response from OpenAI: {str(e)}"
-            print(error_msg)
-            return error_msg
\ No newline at end of file
+            logger.error(error_msg)
+            if not parts:
+                yield error_msg
+                return
+        
+        # Add the turn to history without its context, even a partial response
+        self.context.add_turn(user_input, "".join(parts))
+        if self.context.turns_to_summarize():
+            # Summarize in the background rather than delay the end of this response
+            self._summary_task = asyncio.ensure_future(self._summarize())
+
+    async def chat(self, user_input: str) -> str:
+        """Process user input and return assistant's complete response"""
+        return "".join([part async for part in self.chat_stream(user_input)])
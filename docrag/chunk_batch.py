@@ -0,0 +1,100 @@
+from typing import Dict, Iterator, List, Optional, Sequence, Union
+
+# A dependency of qdrant-client, so always present where chunks are upserted
+import numpy as np
+
+class Chunk:
+    """One chunk of a markdown file: its text, its metadata and, once embedded, its float32 vector.
+
+    Readable like the chunk dicts the chunker produces (`chunk['metadata']`),
+    so the functions that plan and record updates take either.
+    """
+
+    __slots__ = ('text', 'metadata', 'vector')
+
+    def __init__(self, text: str, metadata: Dict, vector: Optional[np.ndarray] = None):
+        self.text = text
+        self.metadata = metadata
+        self.vector = vector
+
+    def __getitem__(self, key: str):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key: str, default=None):
+        return getattr(self, key) if key in self.__slots__ else default
+
+    def __repr__(self) -> str:
+        return f"Chunk({self.metadata.get('file_path')!r}, #{self.metadata.get('chunk_id')})"
+
+class ChunkBatch:
+    """Embedded chunks stored column-wise.
+
+    Texts and metadata are kept as lists and the vectors as one contiguous
+    (n, dimension) float32 matrix, about 6 KB per 1536-dimensional chunk
+    instead of ~50 KB as a list of Python floats. The matrix is handed to the
+    vector store as is; iterating yields `Chunk`s whose vectors are row views.
+    """
+
+    __slots__ = ('texts', 'metadata', 'vectors')
+
+    def __init__(self, texts: List[str], metadata: List[Dict], vectors: np.ndarray):
+        if len(texts) != len(metadata) or len(texts) != len(vectors):
+            raise ValueError("texts, metadata and vectors must have the same length")
+        self.texts = texts
+        self.metadata = metadata
+        self.vectors = vectors
+
+    @classmethod
+    def empty(cls) -> "ChunkBatch":
+        return cls([], [], np.empty((0, 0), dtype=np.float32))
+
+    @classmethod
+    def from_rows(cls, chunks: Sequence, rows: Sequence) -> "ChunkBatch":
+        """Batch of `chunks` (dicts or Chunks) with their vectors, copied once into a float32 matrix"""
+        if not chunks:
+            return cls.empty()
+        vectors = np.empty((len(rows), len(rows[0])), dtype=np.float32)
+        for i, row in enumerate(rows):
+            vectors[i] = row
+        return cls([chunk['text'] for chunk in chunks], [chunk['metadata'] for chunk in chunks], vectors)
+
+    @classmethod
+    def concat(cls, batches: Sequence["ChunkBatch"]) -> "ChunkBatch":
+        batches = [batch for batch in batches if len(batch)]
+        if not batches:
+            return cls.empty()
+        return cls([text for batch in batches for text in batch.texts],
+                   [metadata for batch in batches for metadata in batch.metadata],
+                   np.concatenate([batch.vectors for batch in batches]))
+
+    def __len__(self) -> int:
+        return len(self.texts)
+
+    def __iter__(self) -> Iterator[Chunk]:
+        for i in range(len(self.texts)):
+            yield Chunk(self.texts[i], self.metadata[i], self.vectors[i])
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[Chunk, "ChunkBatch"]:
+        if isinstance(index, slice):
+            return ChunkBatch(self.texts[index], self.metadata[index], self.vectors[index])
+        return Chunk(self.texts[index], self.metadata[index], self.vectors[index])
+
+    def take(self, rows: Sequence[int]) -> "ChunkBatch":
+        """Batch of the chunks at `rows`"""
+        return ChunkBatch([self.texts[i] for i in rows], [self.metadata[i] for i in rows],
+                          self.vectors[np.asarray(rows, dtype=np.intp)])
+
+    @property
+    def dimension(self) -> int:
+        return self.vectors.shape[1]
+
+    @property
+    def point_ids(self) -> List[str]:
+        return [metadata['point_id'] for metadata in self.metadata]
+
+    @property
+    def nbytes(self) -> int:
+        """Size of the vector matrix"""
+        return self.vectors.nbytes
@@ -0,0 +1,105 @@
+import os
+from dataclasses import dataclass, asdict
+from typing import Dict, Optional, Tuple
+
+from qdrant_client.models import (
+    Distance, VectorParams, VectorParamsDiff, HnswConfigDiff, CollectionParamsDiff, SearchParams,
+    QuantizationSearchParams, ScalarQuantization, ScalarQuantizationConfig, ScalarType,
+    BinaryQuantization, BinaryQuantizationConfig, PayloadSchemaType, Disabled
+)
+
+@dataclass(frozen=True)
+class CollectionProfile:
+    """Storage and search settings of a Qdrant collection.
+
+    `quantization` is None, "int8" (scalar, ~4x less RAM) or "binary"
+    (~32x less, for high-dimensional embeddings); quantized vectors are kept
+    in RAM and, with `rescore`, the top `oversampling` x limit candidates
+    are rescored against the original vectors. `on_disk` keeps the original
+    vectors memory-mapped on disk instead of in RAM.
+    """
+    name: str
+    payload_indexes: Tuple[str, ...] = ('file_path', 'file_hash')
+    quantization: Optional[str] = None
+    rescore: bool = True
+    oversampling: float = 2.0
+    on_disk: bool = False
+    on_disk_payload: bool = False
+    hnsw_m: int = 16
+    hnsw_ef_construct: int = 100
+    search_ef: Optional[int] = None
+    prefer_grpc: bool = False
+
+    def signature(self) -> str:
+        """Recorded with the collection to detect profile changes"""
+        fields = asdict(self)
+        return ';'.join(f"{key}={fields[key]}" for key in sorted(fields))
+
+PROFILES: Dict[str, CollectionProfile] = {
+    # Full float32 vectors in RAM, as before, plus payload indexes
+    'default': CollectionProfile('default'),
+    # int8 vectors in RAM, originals and payloads on disk
+    'memory': CollectionProfile('memory', quantization='int8', on_disk=True, on_disk_payload=True,
+                                search_ef=128, prefer_grpc=True),
+    # Binary vectors in RAM with heavier rescoring, for large multi-repo deployments
+    'compact': CollectionProfile('compact', quantization='binary', oversampling=3.0, on_disk=True,
+                                 on_disk_payload=True, search_ef=128, prefer_grpc=True),
+}
+
+def get_collection_profile(name: Optional[str] = None) -> CollectionProfile:
+    """Profile named by `name` or DOCRAG_QDRANT_PROFILE (default "default")"""
+    name = name or os.getenv("DOCRAG_QDRANT_PROFILE", "default")
+    if name not in PROFILES:
+        raise ValueError(f"Unknown collection profile: {name} (expected one of {', '.join(PROFILES)})")
+    return PROFILES[name]
+
+def quantization_config(profile: CollectionProfile):
+    if profile.quantization is None:
+        return None
+    if profile.quantization == 'int8':
+        return ScalarQuantization(scalar=ScalarQuantizationConfig(type=ScalarType.INT8, quantile=0.99, always_ram=True))
+    if profile.quantization == 'binary':
+        return BinaryQuantization(binary=BinaryQuantizationConfig(always_ram=True))
+    raise ValueError(f"Unknown quantization: {profile.quantization}")
+
+def create_collection_params(profile: CollectionProfile, vector_size: int) -> Dict:
+    """Keyword arguments for `create_collection` / `recreate_collection`"""
+    return {
+        'vectors_config': VectorParams(size=vector_size, distance=Distance.COSINE, on_disk=profile.on_disk),
+        'hnsw_config': HnswConfigDiff(m=profile.hnsw_m, ef_construct=profile.hnsw_ef_construct),
+        'quantization_config': quantization_config(profile),
+        'on_disk_payload': profile.on_disk_payload,
+    }
+
+def search_params(profile: CollectionProfile) -> Optional[SearchParams]:
+    if profile.quantization is None and profile.search_ef is None:
+        return None
+    quantization = None
+    if profile.quantization is not None:
+        quantization = QuantizationSearchParams(rescore=profile.rescore, oversampling=profile.oversampling)
+    return SearchParams(hnsw_ef=profile.search_ef, quantization=quantization)
+
+def ensure_payload_indexes(client, collection_name: str, profile: CollectionProfile):
+    """Create the profile's keyword payload indexes that the collection does not have yet"""
+    existing = getattr(client.get_collection(collection_name=collection_name), 'payload_schema', None) or {}
+    for field_name in profile.payload_indexes:
+        if field_name not in existing:
+            client.create_payload_index(
+                collection_name=collection_name, field_name=field_name, field_schema=PayloadSchemaType.KEYWORD
+            )
+
+def apply_collection_profile(client, collection_name: str, profile: CollectionProfile):
+    """Migrate an existing collection to `profile` in place.
+
+    Qdrant rebuilds the quantized vectors and moves data between RAM and
+    disk in the background; the collection stays searchable meanwhile.
+    """
+    client.update_collection(
+        collection_name=collection_name,
+        vectors_config={'': VectorParamsDiff(on_disk=profile.on_disk)},
+        hnsw_config=HnswConfigDiff(m=profile.hnsw_m, ef_construct=profile.hnsw_ef_construct),
+        # None would leave existing quantization in place
+        quantization_config=quantization_config(profile) or Disabled.DISABLED,
+        collection_params=CollectionParamsDiff(on_disk_payload=profile.on_disk_payload),
+    )
+    ensure_payload_indexes(client, collection_name, profile)
@@ -0,0 +1,159 @@
+import hashlib
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+
+from token_counter import make_token_counter
+
+# Rough per-message overhead of the chat format (role, separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+@dataclass
+class Message:
+    role: str  # "system", "user", or "assistant"
+    content: str
+
+@dataclass
+class Document:
+    title: str
+    contents: str
+
+@dataclass
+class ContextDocument:
+    document: Document
+    tokens: int
+    relevance: float
+    last_turn: int
+
+def document_key(title: str, contents: str) -> str:
+    return hashlib.sha256(f"{title}\0{contents}".encode('utf-8')).hexdigest()
+
+def format_context(docs: List[Document]) -> str:
+    """Format documents into a string context"""
+    context = []
+    for doc in docs:
+        context.append(f"<title>{doc.title}</title>")
+        context.append(f"<contents>{doc.contents}</contents>")
+    return "\n\n".join(context)
+
+class ConversationContext:
+    """Token-budgeted conversation state for a chat session.
+
+    Retrieved documents are kept in a dict keyed by a hash of their title and
+    contents. Each document carries a relevance: its best search score,
+    multiplied by `decay` on every turn that does not retrieve it again. When
+    the documents exceed `max_document_tokens`, the least relevant ones are
+    evicted (and can be retrieved again later).
+
+    Past turns are stored without their context: the documents are only sent
+    once, in front of the current question. The most recent turns that fit
+    the remaining budget are sent; older ones are dropped, or folded into a
+    running summary when `summarize` is enabled (see `turns_to_summarize`).
+    """
+
+    def __init__(self, system_prompt: str, max_tokens: int = 3000, max_document_tokens: Optional[int] = None,
+                 decay: float = 0.8, summarize: bool = False,
+                 count_tokens: Optional[Callable[[str], int]] = None):
+        self.system_prompt = system_prompt
+        self.max_tokens = max_tokens
+        self.max_document_tokens = max_document_tokens if max_document_tokens is not None else max_tokens * 3 // 5
+        self.decay = decay
+        self.summarize = summarize
+        self.count_tokens = count_tokens or make_token_counter("gpt-3.5-turbo")
+        self.documents: Dict[str, ContextDocument] = {}
+        self.turns: List[Message] = []
+        self.summary: Optional[str] = None
+        # turns[:summarized] are covered by the summary, turns[:first_sent] were left out of the last request
+        self.summarized = 0
+        self.first_sent = 0
+        self.turn = 0
+
+    def _tokens(self, text: str) -> int:
+        return self.count_tokens(text) + MESSAGE_OVERHEAD_TOKENS
+
+    def add_results(self, results) -> List[Document]:
+        """Add search results for a new turn and return the documents that were not in context yet"""
+        self.turn += 1
+        for doc in self.documents.values():
+            doc.relevance *= self.decay
+
+        new_docs = []
+        for result in results:
+            title, contents = result.payload['file_path'], result.payload['text']
+            score = getattr(result, 'score', None) or 0.0
+            key = document_key(title, contents)
+            known = self.documents.get(key)
+            if known is not None:
+                known.relevance = max(known.relevance, score)
+                known.last_turn = self.turn
+                continue
+            doc = Document(title=title, contents=contents)
+            self.documents[key] = ContextDocument(doc, self.count_tokens(contents), score, self.turn)
+            new_docs.append(doc)
+
+        self._evict()
+        return [doc for doc in new_docs if document_key(doc.title, doc.contents) in self.documents]
+
+    def _evict(self):
+        """Keep the most relevant documents that fit `max_document_tokens`"""
+        ranked = sorted(self.documents.items(), key=lambda item: (item[1].relevance, item[1].last_turn), reverse=True)
+        kept, used = {}, 0
+        for key, doc in ranked:
+            if used + doc.tokens <= self.max_document_tokens:
+                kept[key] = doc
+                used += doc.tokens
+        self.documents = kept
+
+    @property
+    def context_documents(self) -> List[Document]:
+        """Documents in context, most relevant first"""
+        ranked = sorted(self.documents.values(), key=lambda doc: (doc.relevance, doc.last_turn), reverse=True)
+        return [doc.document for doc in ranked]
+
+    def build_messages(self, user_input: str) -> List[Dict]:
+        """API messages for a new question: system prompt, summary, recent turns, then context and question"""
+        system = [Message(role="system", content=self.system_prompt)]
+        if self.summary:
+            system.append(Message(role="system", content=f"Summary of the earlier conversation:\n{self.summary}"))
+        question = Message(
+            role="user",
+            content=f"Context:\n{format_context(self.context_documents)}\n\nUser Question: {user_input}"
+        )
+
+        budget = self.max_tokens - sum(self._tokens(m.content) for m in system + [question])
+        start = len(self.turns)
+        # Walk back over whole question/answer pairs that still fit
+        while start >= 2:
+            cost = self._tokens(self.turns[start - 2].content) + self._tokens(self.turns[start - 1].content)
+            if cost > budget:
+                break
+            budget -= cost
+            start -= 2
+        self.first_sent = max(start, self.summarized)
+        history = self.turns[self.first_sent:]
+        return [{"role": msg.role, "content": msg.content} for msg in system + history + [question]]
+
+    def add_turn(self, user_input: str, assistant_response: str):
+        """Record a completed turn, without its context"""
+        self.turns.append(Message(role="user", content=user_input))
+        self.turns.append(Message(role="assistant", content=assistant_response))
+
+    def turns_to_summarize(self) -> List[Message]:
+        """Turns that fell out of the last request and are not in the summary yet"""
+        if not self.summarize:
+            return []
+        return self.turns[self.summarized:self.first_sent]
+
+    def summary_messages(self, turns: List[Message]) -> List[Dict]:
+        """Messages asking the chat model to fold `turns` into the running summary"""
+        transcript = "\n".join(f"{msg.role}: {msg.content}" for msg in turns)
+        previous = f"Current summary:\n{self.summary}\n\n" if self.summary else ""
+        return [
+            {"role": "system", "content": "Summarize the conversation so far in a few sentences. "
+                                          "Keep the facts, names and decisions needed to answer follow-up questions."},
+            {"role": "user", "content": f"{previous}New turns:\n{transcript}"}
+        ]
+
+    def set_summary(self, summary: str, turns: List[Message]):
+        """Store a summary that now also covers `turns` (as returned by `turns_to_summarize`)"""
+        self.summary = summary
+        self.summarized += len(turns)
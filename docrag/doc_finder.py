@@ -1,6 +1,52 @@
+import os
+import re
+import json
+import time
+import asyncio
 import requests
-from github_docs_extractor import clone_or_pull_repo, find_markdown_files
+from github_docs_extractor import clone_docs_repo, find_markdown_files
+from index_state import IndexState, get_state_path
+from site_crawler import SiteCrawler
 from urllib.parse import urlparse
+from typing import Dict, List, Optional
+
+try:
+    import httpx
+except ImportError:  # pragma: no cover - optional dependency
+    httpx = None
+
+REQUEST_TIMEOUT = 10
+DISCOVERY_TTL = 7 * 24 * 3600
+# Packages without documentation are retried sooner, in case discovery failed transiently
+NEGATIVE_DISCOVERY_TTL = 24 * 3600
+DEFAULT_DISCOVERY_CACHE = os.path.join(os.path.expanduser("~"), ".cache", "docrag", "discovery.json")
+
+GITHUB_REPO_RE = re.compile(r"^https?://(?:www\.)?github\.com/([\w.-]+)/([\w.-]+?)(?:\.git)?(?:[/#?].*)?$")
+# Project URL labels that usually point at the source repository, in order of preference
+SOURCE_URL_LABELS = ("source", "source code", "repository", "code", "github", "homepage", "home")
+DOCS_URL_LABELS = ("documentation", "docs")
+
+def normalize_package_name(requirement: str) -> Optional[str]:
+    """PEP 503 name of a requirement line, without extras, version specifiers or markers"""
+    requirement = requirement.strip()
+    if not requirement or requirement.startswith(('-', '#')) or '://' in requirement:
+        return None
+    match = re.match(r"[A-Za-z0-9][A-Za-z0-9._-]*", requirement)
+    if match is None:
+        return None
+    return re.sub(r"[-_.]+", "-", match.group()).lower()
+
+def package_collection_name(package_name: str) -> str:
+    """Collection holding the documentation of one package"""
+    return "docs_" + normalize_package_name(package_name).replace('-', '_')
+
+def _classify_url(url: str) -> Dict:
+    github = GITHUB_REPO_RE.match(url)
+    if github:
+        return {"type": "github", "url": f"https://github.com/{github.group(1)}/{github.group(2)}"}
+    if 'readthedocs.io' in urlparse(url).netloc:
+        return {"type": "readthedocs", "url": url}
+    return {"type": "custom", "url": url}
 
 def find_package_docs(package_info):
     if package_info['doc_url']:
@@ -18,13 +64,13 @@ def find_package_docs(package_info):
     
     # Try to find documentation on ReadTheDocs
     rtd_url = f"https://{package_name}.readthedocs.io/en/latest/"
-    response = requests.get(rtd_url)
+    response = requests.get(rtd_url, timeout=REQUEST_TIMEOUT)
     if response.status_code == 200:
         return {"type": "readthedocs", "url": rtd_url}
 
     # If not on ReadTheDocs, try GitHub
     github_api_url = f"https://api.github.com/search/repositories?q={package_name}"
-    response = requests.get(github_api_url)
+    response = requests.get(github_api_url, timeout=REQUEST_TIMEOUT)
     if response.status_code == 200:
         data = response.json()
         if data["total_count"] > 0:
@@ -34,22 +80,146 @@ def find_package_docs(package_info):
     # If no documentation found
     return None
 
-def process_package_docs(package_info, target_dir):
-    doc_info = find_package_docs(package_info)
+class DiscoveryCache:
+    """Discovery results per package, kept in a JSON file and expired after a TTL"""
+
+    def __init__(self, path: str = DEFAULT_DISCOVERY_CACHE, ttl: float = DISCOVERY_TTL,
+                 negative_ttl: float = NEGATIVE_DISCOVERY_TTL):
+        self.path = path
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.entries: Dict[str, Dict] = {}
+        if os.path.exists(path):
+            try:
+                with open(path, 'r') as f:
+                    self.entries = json.load(f)
+            except (OSError, ValueError):
+                self.entries = {}
+
+    def get(self, key: str):
+        """(True, result) for a fresh entry, (False, None) otherwise; a fresh result may be None"""
+        entry = self.entries.get(key)
+        if entry is None:
+            return False, None
+        ttl = self.ttl if entry['result'] is not None else self.negative_ttl
+        if time.time() - entry['stored_at'] > ttl:
+            return False, None
+        return True, entry['result']
+
+    def set(self, key: str, result: Optional[Dict]):
+        self.entries[key] = {'result': result, 'stored_at': time.time()}
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.entries, f)
+        os.replace(tmp_path, self.path)
+
+async def _pypi_docs(http: "httpx.AsyncClient", name: str) -> Optional[Dict]:
+    response = await http.get(f"https://pypi.org/pypi/{name}/json")
+    if response.status_code != 200:
+        return None
+    info = response.json().get('info') or {}
+    urls = {label.strip().lower(): url for label, url in (info.get('project_urls') or {}).items() if url}
+    if info.get('home_page'):
+        urls.setdefault('homepage', info['home_page'])
+    # A GitHub repository can be indexed directly, so it wins over a docs site
+    for url in urls.values():
+        if GITHUB_REPO_RE.match(url):
+            return _classify_url(url)
+    for label in DOCS_URL_LABELS + SOURCE_URL_LABELS:
+        if label in urls:
+            return _classify_url(urls[label])
+    return None
+
+async def async_find_package_docs(package_info: Dict, http: "httpx.AsyncClient") -> Optional[Dict]:
+    """Like `find_package_docs`, but non-blocking and consulting PyPI project URLs first"""
+    if package_info['doc_url']:
+        return _classify_url(package_info['doc_url'])
+    name = normalize_package_name(package_info['name'])
+    if name is None:
+        return None
+
+    docs = await _pypi_docs(http, name)
+    if docs is not None:
+        return docs
+
+    rtd_url = f"https://{name}.readthedocs.io/en/latest/"
+    response = await http.head(rtd_url, follow_redirects=True)
+    if response.status_code == 200:
+        return {"type": "readthedocs", "url": rtd_url}
+
+    headers = {}
+    if os.getenv("GITHUB_TOKEN"):
+        headers['Authorization'] = f"Bearer {os.getenv('GITHUB_TOKEN')}"
+    response = await http.get("https://api.github.com/search/repositories",
+                              params={'q': f"{name} in:name", 'per_page': 1}, headers=headers)
+    if response.status_code == 200:
+        data = response.json()
+        if data["total_count"] > 0:
+            return {"type": "github", "url": data["items"][0]["html_url"]}
+    return None
+
+async def resolve_package_docs(packages: List[Dict], concurrency: int = 16,
+                               cache: Optional[DiscoveryCache] = None,
+                               timeout: float = REQUEST_TIMEOUT) -> Dict[str, Optional[Dict]]:
+    """Find documentation for many packages at once over one pooled HTTP client.
+
+    Returns the discovery result (or None) per package name. Results are
+    cached in `cache`; packages whose lookup failed are left out of it and
+    come back as None.
+    """
+    if httpx is None:
+        raise ImportError("Concurrent package discovery requires httpx")
+    results: Dict[str, Optional[Dict]] = {}
+    pending = []
+    for package_info in packages:
+        key = f"{package_info['name']}|{package_info['doc_url'] or ''}"
+        hit, result = cache.get(key) if cache is not None else (False, None)
+        if hit:
+            results[package_info['name']] = result
+        else:
+            pending.append((key, package_info))
+
+    semaphore = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(timeout=timeout, limits=limits,
+                                 headers={'User-Agent': 'docrag'}) as http:
+        async def resolve(key: str, package_info: Dict):
+            async with semaphore:
+                try:
+                    result = await async_find_package_docs(package_info, http)
+                except (httpx.HTTPError, ValueError) as e:
+                    print(f"Discovery failed for {package_info['name']}: {e}")
+                    results[package_info['name']] = None
+                    return
+            results[package_info['name']] = result
+            if cache is not None:
+                cache.set(key, result)
+
+        await asyncio.gather(*(resolve(key, package_info) for key, package_info in pending))
+
+    if cache is not None and pending:
+        cache.save()
+    return results
+
+async def process_package_docs(package_info: Dict, target_dir: str,
+                               cache: Optional[DiscoveryCache] = None) -> List[str]:
+    """Find, fetch and mirror one package's documentation; returns its markdown files"""
+    doc_info = (await resolve_package_docs([package_info], cache=cache))[package_info['name']]
     if doc_info is None:
         print(f"No documentation found for {package_info['name']}")
         return []
 
+    loop = asyncio.get_running_loop()
     if doc_info["type"] == "github":
-        clone_or_pull_repo(doc_info["url"], target_dir)
-        return find_markdown_files(target_dir)
-    elif doc_info["type"] == "readthedocs":
-        # For ReadTheDocs, we'd need to implement a web scraper
-        # This is a placeholder for now
-        print(f"ReadTheDocs scraping not implemented for {package_info['name']}")
-        return []
-    elif doc_info["type"] == "custom":
-        print(f"Custom documentation URL provided for {package_info['name']}: {doc_info['url']}")
-        # Here you could implement custom handling for different types of documentation sites
-        # For now, we'll just print the URL
-        return []
\ No newline at end of file
+        docs_paths = await loop.run_in_executor(None, clone_docs_repo, doc_info["url"], target_dir)
+        return await loop.run_in_executor(None, find_markdown_files, target_dir, docs_paths)
+    # ReadTheDocs and other documentation sites are mirrored as markdown
+    state = IndexState(get_state_path(target_dir))
+    try:
+        await SiteCrawler(doc_info["url"], target_dir, state, package_collection_name(package_info['name'])).crawl()
+    finally:
+        state.close()
+    return await loop.run_in_executor(None, find_markdown_files, target_dir)
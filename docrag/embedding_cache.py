@@ -0,0 +1,159 @@
+import os
+import sqlite3
+import hashlib
+import threading
+import time
+from array import array
+from typing import Dict, List, Optional, Sequence
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - optional dependency
+    np = None
+
+import metrics
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "docrag", "embeddings.sqlite")
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024  # 1 GiB of float32 vectors
+
+def text_key(text: str) -> str:
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+def _vector_bytes(vector: Sequence[float]) -> bytes:
+    # float32 NumPy rows are stored without a round trip through Python floats
+    if getattr(vector, 'dtype', None) == 'float32':
+        return vector.tobytes()
+    return array('f', vector).tobytes()
+
+class EmbeddingCache:
+    """Persistent embedding cache keyed by (model, sha256 of text).
+
+    Vectors are stored as float32 blobs in SQLite. When the stored vectors
+    exceed `max_bytes`, the least recently used entries are evicted.
+    """
+
+    def __init__(self, db_path: str = DEFAULT_CACHE_PATH, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.db_path = db_path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self.conn = sqlite3.connect(db_path, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " model TEXT NOT NULL, text_hash TEXT NOT NULL, vector BLOB NOT NULL, last_used REAL NOT NULL,"
+            " PRIMARY KEY (model, text_hash))"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS embeddings_lru ON embeddings (last_used)")
+        self._bytes = self.conn.execute("SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings").fetchone()[0]
+
+    def close(self):
+        self.conn.close()
+
+    def get_many(self, model: str, texts: Sequence[str], as_arrays: bool = False) -> List[Optional[Sequence[float]]]:
+        """Look up several texts at once; misses are returned as None.
+
+        With `as_arrays` (and NumPy installed), hits are float32 NumPy rows instead of lists.
+        """
+        keys = [text_key(text) for text in texts]
+        found: Dict[str, bytes] = {}
+        with self._lock:
+            # Stay well below SQLite's bound-parameter limit
+            for i in range(0, len(keys), 500):
+                part = keys[i:i + 500]
+                placeholders = ','.join('?' * len(part))
+                found.update(self.conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN ({placeholders})",
+                    (model, *part)
+                ))
+            if found:
+                now = time.time()
+                self.conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE model = ? AND text_hash = ?",
+                    ((now, model, key) for key in found)
+                )
+            hits = sum(1 for key in keys if key in found)
+            self.hits += hits
+            self.misses += len(keys) - hits
+        metrics.incr('cache_lookups_total', hits, cache='embedding', result='hit')
+        metrics.incr('cache_lookups_total', len(keys) - hits, cache='embedding', result='miss')
+
+        decode = (lambda blob: np.frombuffer(blob, dtype=np.float32)) if as_arrays and np is not None \
+            else (lambda blob: array('f', blob).tolist())
+        results = []
+        for key in keys:
+            blob = found.get(key)
+            results.append(decode(blob) if blob is not None else None)
+        return results
+
+    def get(self, model: str, text: str) -> Optional[List[float]]:
+        return self.get_many(model, [text])[0]
+
+    def put_many(self, model: str, texts: Sequence[str], vectors: Sequence[Sequence[float]]):
+        now = time.time()
+        rows = [(model, text_key(text), _vector_bytes(vector), now) for text, vector in zip(texts, vectors)]
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                for row in rows:
+                    old = self.conn.execute(
+                        "SELECT LENGTH(vector) FROM embeddings WHERE model = ? AND text_hash = ?", row[:2]
+                    ).fetchone()
+                    self.conn.execute(
+                        "INSERT OR REPLACE INTO embeddings (model, text_hash, vector, last_used) VALUES (?, ?, ?, ?)", row
+                    )
+                    self._bytes += len(row[2]) - (old[0] if old else 0)
+                self._evict()
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.conn.execute("COMMIT")
+
+    def put(self, model: str, text: str, vector: Sequence[float]):
+        self.put_many(model, [text], [vector])
+
+    def _evict(self):
+        """Drop least recently used entries until the cache is 10% below its bound"""
+        if self._bytes <= self.max_bytes:
+            return
+        target = int(self.max_bytes * 0.9)
+        while self._bytes > target:
+            rows = self.conn.execute(
+                "SELECT model, text_hash, LENGTH(vector) FROM embeddings ORDER BY last_used LIMIT 1000"
+            ).fetchall()
+            if not rows:
+                self._bytes = 0
+                break
+            for model, key, size in rows:
+                self.conn.execute("DELETE FROM embeddings WHERE model = ? AND text_hash = ?", (model, key))
+                self._bytes -= size
+                if self._bytes <= target:
+                    break
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        with self._lock:
+            entries = self.conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'entries': entries,
+            'bytes': self._bytes
+        }
+
+_default_cache: Optional[EmbeddingCache] = None
+
+def get_default_cache() -> Optional[EmbeddingCache]:
+    """Process-wide cache, configured by DOCRAG_EMBEDDING_CACHE (path, or "off")"""
+    global _default_cache
+    path = os.getenv("DOCRAG_EMBEDDING_CACHE", DEFAULT_CACHE_PATH)
+    if path.lower() in ("off", "none", "0", ""):
+        return None
+    if _default_cache is None:
+        max_bytes = int(os.getenv("DOCRAG_EMBEDDING_CACHE_MAX_BYTES", DEFAULT_MAX_BYTES))
+        _default_cache = EmbeddingCache(path, max_bytes=max_bytes)
+    return _default_cache
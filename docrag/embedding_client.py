@@ -0,0 +1,272 @@
+import os
+import time
+import base64
+import random
+import asyncio
+from email.utils import parsedate_to_datetime
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Sequence
+
+import openai
+from openai import AsyncOpenAI
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - optional dependency
+    np = None
+
+import metrics
+from token_counter import make_token_counter
+
+RETRYABLE_ERRORS = (openai.RateLimitError, openai.APIConnectionError, openai.APITimeoutError, openai.InternalServerError)
+
+class EmbeddingAborted(RuntimeError):
+    """The API rejected a request for a reason no retry or smaller batch can fix (e.g. a bad key or model)"""
+
+def is_input_error(error: openai.APIStatusError) -> bool:
+    """Whether the request was rejected for its inputs (400, 413), so a smaller batch may succeed"""
+    return isinstance(error, openai.BadRequestError) or error.status_code == 413
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """Read `retry-after-ms` / `Retry-After` from an API error response, if any"""
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None)
+    if not headers:
+        return None
+    value = headers.get('retry-after-ms')
+    if value:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+    value = headers.get('retry-after')
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+def decode_embedding(embedding) -> Sequence[float]:
+    """An embedding from the API as a float32 NumPy row: decoded straight from base64, or
+    converted from a list of floats. Without NumPy, lists are returned as they are."""
+    if isinstance(embedding, str):
+        return np.frombuffer(base64.b64decode(embedding), dtype='<f4')
+    if np is not None:
+        return np.asarray(embedding, dtype=np.float32)
+    return embedding
+
+def vector_list(vector: Sequence[float]) -> List[float]:
+    """Plain list of floats, e.g. for a query vector or JSON"""
+    return vector.tolist() if hasattr(vector, 'tolist') else list(vector)
+
+class RateLimiter:
+    """Token buckets for requests per minute and tokens per minute"""
+
+    def __init__(self, requests_per_minute: float, tokens_per_minute: float):
+        self.rpm = requests_per_minute
+        self.tpm = tokens_per_minute
+        self.request_budget = requests_per_minute
+        self.token_budget = tokens_per_minute
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self.updated
+        self.updated = now
+        self.request_budget = min(self.rpm, self.request_budget + elapsed * self.rpm / 60)
+        self.token_budget = min(self.tpm, self.token_budget + elapsed * self.tpm / 60)
+
+    async def acquire(self, tokens: int):
+        # A single request larger than the whole per-minute budget waits for a full bucket
+        tokens = min(tokens, self.tpm)
+        async with self.lock:
+            while True:
+                self._refill()
+                if self.request_budget >= 1 and self.token_budget >= tokens:
+                    self.request_budget -= 1
+                    self.token_budget -= tokens
+                    return
+                wait = max(
+                    (1 - self.request_budget) * 60 / self.rpm,
+                    (tokens - self.token_budget) * 60 / self.tpm
+                )
+                await asyncio.sleep(max(wait, 0.01))
+
+class AdaptiveConcurrency:
+    """AIMD limit on in-flight requests: +1 after a run of successes, halved on throttling"""
+
+    def __init__(self, initial: int, maximum: int, increase_every: int = 4):
+        self.limit = max(1, initial)
+        self.maximum = max(self.limit, maximum)
+        self.increase_every = increase_every
+        self.in_flight = 0
+        self.successes = 0
+        self.condition = asyncio.Condition()
+
+    async def __aenter__(self):
+        async with self.condition:
+            await self.condition.wait_for(lambda: self.in_flight < self.limit)
+            self.in_flight += 1
+        return self
+
+    async def __aexit__(self, *exc_info):
+        async with self.condition:
+            self.in_flight -= 1
+            self.condition.notify_all()
+
+    def on_success(self):
+        self.successes += 1
+        if self.successes >= self.increase_every and self.limit < self.maximum:
+            self.limit += 1
+            self.successes = 0
+
+    def on_throttle(self):
+        self.limit = max(1, self.limit // 2)
+        self.successes = 0
+
+@dataclass
+class EmbeddingResult:
+    # float32 NumPy rows when NumPy is installed, lists of floats otherwise
+    vectors: Dict[int, Sequence[float]] = field(default_factory=dict)
+    failed: Dict[int, str] = field(default_factory=dict)
+    requests: int = 0
+    retries: int = 0
+    tokens: int = 0
+
+class EmbeddingEngine:
+    """Batched embedding client that stays under the API rate limits.
+
+    Inputs are packed into requests up to `max_batch_tokens` / `max_batch_inputs`,
+    sent with adaptive concurrency under RPM/TPM buckets, and retried with
+    exponential backoff and full jitter that honors `Retry-After`. A batch
+    rejected for its inputs is bisected to isolate the bad ones. Inputs that
+    still fail are reported in `EmbeddingResult.failed` rather than dropped.
+    Any other rejection (401, 403, 404, ...) would fail every request alike:
+    the remaining requests are not sent and `embed` raises `EmbeddingAborted`.
+    """
+
+    def __init__(self, client: Optional[AsyncOpenAI] = None, model: str = "text-embedding-ada-002",
+                 max_batch_tokens: int = 100_000, max_batch_inputs: int = 1000,
+                 requests_per_minute: float = 3000, tokens_per_minute: float = 1_000_000,
+                 max_concurrency: int = 8, max_retries: int = 6, base_delay: float = 1.0, max_delay: float = 60.0,
+                 base_url: Optional[str] = None):
+        # Retries are handled here, so the SDK's own retry loop is disabled
+        self.client = client or AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), base_url=base_url, max_retries=0)
+        self.model = model
+        self.max_batch_tokens = max_batch_tokens
+        self.max_batch_inputs = max_batch_inputs
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.count_tokens = make_token_counter(model)
+        # Base64 is a quarter of the JSON size and decodes without creating a Python float per value
+        self.request_options = {'encoding_format': 'base64'} if np is not None else {}
+        # Shared by all concurrent embed() calls, created on first use inside the event loop
+        self.limiter: Optional[RateLimiter] = None
+        self.concurrency: Optional[AdaptiveConcurrency] = None
+
+    def pack_batches(self, texts: Sequence[str], token_counts: Optional[List[int]] = None) -> List[List[int]]:
+        """Group input indexes into requests that fit the token and input budgets"""
+        if token_counts is None:
+            token_counts = [self.count_tokens(text) for text in texts]
+        batches, current, current_tokens = [], [], 0
+        for i, tokens in enumerate(token_counts):
+            if current and (current_tokens + tokens > self.max_batch_tokens or len(current) >= self.max_batch_inputs):
+                batches.append(current)
+                current, current_tokens = [], 0
+            current.append(i)
+            current_tokens += tokens
+        if current:
+            batches.append(current)
+        return batches
+
+    def _backoff(self, attempt: int, error: Exception) -> float:
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        retry_after = retry_after_seconds(error)
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+    async def embed(self, texts: Sequence[str], progress: Optional[Callable[[int], None]] = None) -> EmbeddingResult:
+        result = EmbeddingResult()
+        if not texts:
+            return result
+        if self.limiter is None:
+            self.limiter = RateLimiter(self.requests_per_minute, self.tokens_per_minute)
+            self.concurrency = AdaptiveConcurrency(min(4, self.max_concurrency), self.max_concurrency)
+        limiter, concurrency = self.limiter, self.concurrency
+        token_counts = [self.count_tokens(text) for text in texts]
+        aborted: List[openai.APIStatusError] = []
+
+        async def send(indexes: List[int]):
+            tokens = sum(token_counts[i] for i in indexes)
+            attempt = 0
+            while True:
+                if aborted:
+                    for i in indexes:
+                        result.failed[i] = str(aborted[0])
+                    break
+                await limiter.acquire(tokens)
+                try:
+                    async with concurrency:
+                        result.requests += 1
+                        with metrics.span('embed_request', model=self.model):
+                            response = await self.client.embeddings.create(
+                                input=[texts[i] for i in indexes],
+                                model=self.model,
+                                **self.request_options
+                            )
+                except RETRYABLE_ERRORS as e:
+                    throttled = isinstance(e, openai.RateLimitError)
+                    metrics.incr('api_requests_total', api='embeddings', status='throttled' if throttled else 'error')
+                    if throttled:
+                        concurrency.on_throttle()
+                    if attempt >= self.max_retries:
+                        for i in indexes:
+                            result.failed[i] = str(e)
+                        break
+                    result.retries += 1
+                    metrics.incr('api_retries_total', api='embeddings')
+                    await asyncio.sleep(self._backoff(attempt, e))
+                    attempt += 1
+                    continue
+                except openai.APIStatusError as e:
+                    metrics.incr('api_requests_total', api='embeddings', status='error')
+                    if not is_input_error(e):
+                        aborted.append(e)
+                        for i in indexes:
+                            result.failed[i] = str(e)
+                        break
+                    # Rejected for its inputs (e.g. one input too long): isolate the bad input
+                    if len(indexes) > 1:
+                        middle = len(indexes) // 2
+                        await asyncio.gather(send(indexes[:middle]), send(indexes[middle:]))
+                        return
+                    result.failed[indexes[0]] = str(e)
+                    break
+
+                concurrency.on_success()
+                metrics.incr('api_requests_total', api='embeddings', status='ok')
+                metrics.incr('api_tokens_total', tokens, api='embeddings')
+                result.tokens += tokens
+                for item in response.data:
+                    result.vectors[indexes[item.index]] = decode_embedding(item.embedding)
+                for i in indexes:
+                    if i not in result.vectors:
+                        result.failed[i] = "No embedding returned for input"
+                break
+            if progress is not None:
+                progress(len(indexes))
+
+        await asyncio.gather(*(send(batch) for batch in self.pack_batches(texts, token_counts)))
+        if aborted:
+            raise EmbeddingAborted(f"Embedding requests rejected: {aborted[0]}") from aborted[0]
+        return result
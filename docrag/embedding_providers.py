@@ -0,0 +1,271 @@
+import os
+import re
+import asyncio
+import hashlib
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Sequence
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - optional dependency
+    np = None
+
+from embedding_client import EmbeddingEngine, EmbeddingResult, vector_list
+
+DEFAULT_OPENAI_MODEL = "text-embedding-ada-002"
+OPENAI_DIMENSIONS = {
+    "text-embedding-ada-002": 1536,
+    "text-embedding-3-small": 1536,
+    "text-embedding-3-large": 3072,
+}
+
+class EmbeddingProvider:
+    """Turns texts into vectors for both the indexer and the query path.
+
+    `name`, `model` and `dimension` are recorded with the collection, so an
+    index is never queried or extended with vectors from another provider.
+    `cache_key` names the provider's entries in the embedding cache; None
+    disables caching for providers that are cheaper to run than to look up.
+    """
+
+    name = "base"
+
+    def __init__(self, model: str, dimension: Optional[int] = None, cache_key: Optional[str] = None):
+        self.model = model
+        self.dimension = dimension
+        self.cache_key = cache_key
+
+    def signature(self) -> Dict:
+        """Collection fields describing the vectors this provider produces"""
+        return {
+            'embedding_provider': self.name,
+            'embedding_model': self.model,
+            'embedding_dimension': self.dimension
+        }
+
+    async def embed(self, texts: Sequence[str], progress: Optional[Callable[[int], None]] = None) -> EmbeddingResult:
+        raise NotImplementedError
+
+    def embed_query(self, text: str) -> List[float]:
+        raise NotImplementedError
+
+    async def aembed_query(self, text: str) -> List[float]:
+        raise NotImplementedError
+
+    def embed_queries(self, texts: Sequence[str]) -> List[List[float]]:
+        """Embed several queries; providers override this to make a single call"""
+        return [self.embed_query(text) for text in texts]
+
+class OpenAIEmbeddingProvider(EmbeddingProvider):
+    """OpenAI embeddings through the batched, rate-limit aware EmbeddingEngine"""
+
+    name = "openai"
+
+    def __init__(self, model: str = DEFAULT_OPENAI_MODEL, engine: Optional[EmbeddingEngine] = None,
+                 base_url: Optional[str] = None):
+        # Plain model name as cache key, so entries cached before providers existed stay valid
+        super().__init__(model, OPENAI_DIMENSIONS.get(model), cache_key=model)
+        self.base_url = base_url
+        self._engine = engine
+        self._client = None
+
+    @property
+    def engine(self) -> EmbeddingEngine:
+        # Created on first use, so merely configuring this provider needs no API key
+        if self._engine is None:
+            self._engine = EmbeddingEngine(model=self.model, base_url=self.base_url)
+        return self._engine
+
+    async def embed(self, texts: Sequence[str], progress: Optional[Callable[[int], None]] = None) -> EmbeddingResult:
+        result = await self.engine.embed(texts, progress=progress)
+        if self.dimension is None and result.vectors:
+            self.dimension = len(next(iter(result.vectors.values())))
+        return result
+
+    @property
+    def client(self):
+        """Blocking client for the query path; its connection pool is kept for the life of the provider"""
+        if self._client is None:
+            from openai import OpenAI
+            self._client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"), base_url=self.base_url)
+        return self._client
+
+    def embed_query(self, text: str) -> List[float]:
+        response = self.client.embeddings.create(input=text, model=self.model)
+        return response.data[0].embedding
+
+    def embed_queries(self, texts: Sequence[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        response = self.client.embeddings.create(input=list(texts), model=self.model)
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        result = await self.engine.embed([text])
+        if result.failed:
+            raise RuntimeError(f"Failed to embed query: {result.failed[0]}")
+        return vector_list(result.vectors[0])
+
+class LocalEmbeddingProvider(EmbeddingProvider):
+    """Base for providers that run on the local CPU with NumPy batch inference"""
+
+    def __init__(self, model: str, dimension: Optional[int] = None, cache_key: Optional[str] = None,
+                 batch_size: int = 64):
+        if np is None:
+            raise ImportError(f"The {self.name} embedding provider requires numpy")
+        super().__init__(model, dimension, cache_key)
+        self.batch_size = batch_size
+
+    def encode(self, texts: Sequence[str]) -> "np.ndarray":
+        """L2-normalized float32 matrix with one row per text"""
+        raise NotImplementedError
+
+    def _embed_sync(self, texts: Sequence[str], progress: Optional[Callable[[int], None]]) -> EmbeddingResult:
+        result = EmbeddingResult()
+        for start in range(0, len(texts), self.batch_size):
+            batch = texts[start:start + self.batch_size]
+            result.requests += 1
+            try:
+                matrix = self.encode(batch)
+            except Exception as e:
+                for i in range(start, start + len(batch)):
+                    result.failed[i] = str(e)
+            else:
+                for offset, row in enumerate(matrix):
+                    result.vectors[start + offset] = row
+            if progress is not None:
+                progress(len(batch))
+        return result
+
+    async def embed(self, texts: Sequence[str], progress: Optional[Callable[[int], None]] = None) -> EmbeddingResult:
+        if not texts:
+            return EmbeddingResult()
+        # Inference runs on a worker thread; NumPy and ONNX Runtime release the GIL
+        return await asyncio.get_running_loop().run_in_executor(None, self._embed_sync, list(texts), progress)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.encode([text])[0].tolist()
+
+    def embed_queries(self, texts: Sequence[str]) -> List[List[float]]:
+        return self.encode(texts).tolist() if texts else []
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return await asyncio.get_running_loop().run_in_executor(None, self.embed_query, text)
+
+TOKEN_RE = re.compile(r"\w+")
+
+@lru_cache(maxsize=1 << 16)
+def _hash_feature(feature: str, dimension: int):
+    digest = hashlib.blake2b(feature.encode('utf-8'), digest_size=8).digest()
+    value = int.from_bytes(digest, 'little')
+    return value % dimension, 1.0 if value >> 63 else -1.0
+
+class HashingEmbeddingProvider(LocalEmbeddingProvider):
+    """Deterministic feature-hashing embedder: signed, log-scaled counts of words and word pairs.
+
+    Needs no model files and no network, so it suits tests, CI and offline
+    indexing. Its vectors capture lexical overlap only.
+    """
+
+    name = "hashing"
+
+    def __init__(self, dimension: int = 384, batch_size: int = 256):
+        super().__init__(f"hashing-{dimension}", dimension, cache_key=None, batch_size=batch_size)
+
+    def encode(self, texts: Sequence[str]) -> "np.ndarray":
+        rows, columns, signs = [], [], []
+        for row, text in enumerate(texts):
+            tokens = TOKEN_RE.findall(text.lower())
+            features = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+            for feature in features:
+                column, sign = _hash_feature(feature, self.dimension)
+                rows.append(row)
+                columns.append(column)
+                signs.append(sign)
+        matrix = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        np.add.at(matrix, (np.asarray(rows, dtype=np.intp), np.asarray(columns, dtype=np.intp)),
+                  np.asarray(signs, dtype=np.float32))
+        matrix = np.sign(matrix) * np.log1p(np.abs(matrix))
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return matrix / np.maximum(norms, 1e-12)
+
+class OnnxEmbeddingProvider(LocalEmbeddingProvider):
+    """Sentence-embedding model exported to ONNX (e.g. all-MiniLM-L6-v2), mean-pooled.
+
+    `model_dir` must contain `model.onnx` and a Hugging Face `tokenizer.json`.
+    Requires the optional `onnxruntime` and `tokenizers` packages.
+    """
+
+    name = "onnx"
+
+    def __init__(self, model_dir: str, batch_size: int = 32, max_length: int = 256):
+        try:
+            import onnxruntime
+            from tokenizers import Tokenizer
+        except ImportError as e:
+            raise ImportError("The onnx embedding provider requires onnxruntime and tokenizers") from e
+        model = os.path.basename(os.path.normpath(model_dir))
+        super().__init__(model, cache_key=f"onnx:{model}", batch_size=batch_size)
+        self.session = onnxruntime.InferenceSession(
+            os.path.join(model_dir, "model.onnx"), providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=max_length)
+        self.tokenizer.enable_padding()
+        output_shape = self.session.get_outputs()[0].shape
+        if isinstance(output_shape[-1], int):
+            self.dimension = output_shape[-1]
+
+    def encode(self, texts: Sequence[str]) -> "np.ndarray":
+        encodings = self.tokenizer.encode_batch(list(texts))
+        input_ids = np.array([e.ids for e in encodings], dtype=np.int64)
+        attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        inputs = {'input_ids': input_ids, 'attention_mask': attention_mask}
+        if 'token_type_ids' in self.input_names:
+            inputs['token_type_ids'] = np.zeros_like(input_ids)
+        hidden = self.session.run(None, inputs)[0]
+        mask = attention_mask[..., None].astype(np.float32)
+        pooled = (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+        norms = np.linalg.norm(pooled, axis=1, keepdims=True)
+        if self.dimension is None:
+            self.dimension = pooled.shape[1]
+        return (pooled / np.maximum(norms, 1e-12)).astype(np.float32)
+
+PROVIDERS = {
+    'openai': lambda model: OpenAIEmbeddingProvider(model or DEFAULT_OPENAI_MODEL, base_url=os.getenv("OPENAI_BASE_URL")),
+    'hashing': lambda model: HashingEmbeddingProvider(int(os.getenv("DOCRAG_EMBEDDING_DIMENSION", 384))),
+    'onnx': lambda model: OnnxEmbeddingProvider(model or os.getenv("DOCRAG_ONNX_MODEL_DIR", "models/all-MiniLM-L6-v2")),
+}
+
+_default_provider: Optional[EmbeddingProvider] = None
+
+def create_embedding_provider(name: str, model: Optional[str] = None) -> EmbeddingProvider:
+    if name not in PROVIDERS:
+        raise ValueError(f"Unknown embedding provider: {name} (expected one of {', '.join(PROVIDERS)})")
+    return PROVIDERS[name](model)
+
+def get_embedding_provider() -> EmbeddingProvider:
+    """Process-wide provider, configured by DOCRAG_EMBEDDING_PROVIDER and DOCRAG_EMBEDDING_MODEL"""
+    global _default_provider
+    if _default_provider is None:
+        _default_provider = create_embedding_provider(
+            os.getenv("DOCRAG_EMBEDDING_PROVIDER", "openai"), os.getenv("DOCRAG_EMBEDDING_MODEL")
+        )
+    return _default_provider
+
+class EmbeddingMismatch(ValueError):
+    """A collection was embedded with another provider, model or dimension than the configured one"""
+
+def embedding_mismatch(info: Optional[Dict], provider: EmbeddingProvider) -> Optional[str]:
+    """Describe how a collection's recorded embeddings differ from `provider`, or None if compatible"""
+    if not info or not info.get('embedding_model'):
+        return None
+    # Collections indexed before providers were recorded were built with OpenAI
+    recorded = (info.get('embedding_provider') or 'openai', info['embedding_model'])
+    if recorded != (provider.name, provider.model):
+        return f"built with {recorded[0]}:{recorded[1]}, configured {provider.name}:{provider.model}"
+    dimension = info.get('embedding_dimension')
+    if dimension and provider.dimension and int(dimension) != provider.dimension:
+        return f"built with {dimension}-dimensional vectors, configured {provider.dimension}"
+    return None
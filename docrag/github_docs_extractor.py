@@ -1,38 +1,157 @@
 import os
 import subprocess
-from pathlib import Path
+from typing import Dict, List, Optional
 
-def clone_or_pull_repo(repo_url, target_dir):
+import metrics
+
+# Top-level directory names (lowercased) that hold a repository's documentation
+DOCS_DIRECTORIES = ("docs", "doc", "documentation")
+
+def _git(args: List[str], cwd: Optional[str] = None) -> str:
+    """Run a git command and return its stripped stdout"""
+    result = subprocess.run(["git", *args], cwd=cwd, check=True, capture_output=True, text=True)
+    return result.stdout.strip()
+
+def clone_or_pull_repo(repo_url, target_dir, docs_paths: Optional[List[str]] = None, depth: int = 1):
+    """Shallow-clone or update a repository, checking out only `docs_paths` when given.
+
+    Updates fetch the latest commit of the default branch and hard-reset the
+    working tree to it; the clone is treated as a read-only mirror.
+    """
+    if os.path.exists(target_dir):
+        print(f"Directory {target_dir} already exists. Updating instead of cloning...")
+        with metrics.span('clone', mode='update'):
+            if docs_paths:
+                _git(["sparse-checkout", "set", *docs_paths], cwd=target_dir)
+            _git(["fetch", f"--depth={depth}", "origin", "HEAD"], cwd=target_dir)
+            _git(["reset", "--hard", "FETCH_HEAD"], cwd=target_dir)
+    else:
+        print(f"Cloning repository to {target_dir}...")
+        clone_args = ["clone", f"--depth={depth}", "--filter=blob:none"]
+        if docs_paths:
+            clone_args.append("--sparse")
+        with metrics.span('clone', mode='clone'):
+            _git([*clone_args, repo_url, target_dir])
+            if docs_paths:
+                _git(["sparse-checkout", "set", *docs_paths], cwd=target_dir)
+
+def find_docs_paths(repo_dir: str, commit: str = "HEAD") -> List[str]:
+    """Top-level documentation directories of `commit`, read from its tree without checking it out"""
+    names = _git(["ls-tree", "-d", "--name-only", commit], cwd=repo_dir).splitlines()
+    return [name for name in names if name.lower() in DOCS_DIRECTORIES]
+
+def _set_sparse_checkout(repo_dir: str, docs_paths: List[str]):
+    if docs_paths:
+        _git(["sparse-checkout", "set", *docs_paths], cwd=repo_dir)
+    else:
+        _git(["sparse-checkout", "disable"], cwd=repo_dir)
+
+def clone_docs_repo(repo_url: str, target_dir: str, depth: int = 1) -> Optional[List[str]]:
+    """Clone or update a repository, checking out only its documentation directories.
+
+    The directories are found in the fetched commit's tree (`find_docs_paths`),
+    so a new clone downloads the blobs of the docs only. Returns the docs
+    paths, or None when the repository has none and is checked out in full.
+    """
     if os.path.exists(target_dir):
         print(f"Directory {target_dir} already exists. Updating instead of cloning...")
-        current_dir = os.getcwd()
-        try:
-            os.chdir(target_dir)
-            subprocess.run(["git", "pull"], check=True)
-        finally:
-            os.chdir(current_dir)
+        with metrics.span('clone', mode='update'):
+            _git(["fetch", f"--depth={depth}", "origin", "HEAD"], cwd=target_dir)
+            docs_paths = find_docs_paths(target_dir, "FETCH_HEAD")
+            _set_sparse_checkout(target_dir, docs_paths)
+            _git(["reset", "--hard", "FETCH_HEAD"], cwd=target_dir)
     else:
         print(f"Cloning repository to {target_dir}...")
-        subprocess.run(["git", "clone", repo_url, target_dir], check=True)
+        with metrics.span('clone', mode='clone'):
+            _git(["clone", f"--depth={depth}", "--filter=blob:none", "--no-checkout", repo_url, target_dir])
+            docs_paths = find_docs_paths(target_dir)
+            _set_sparse_checkout(target_dir, docs_paths)
+            _git(["checkout"], cwd=target_dir)
+    return docs_paths or None
+
+def get_head_commit(repo_dir: str) -> str:
+    """Return the SHA of the checked out commit"""
+    return _git(["rev-parse", "HEAD"], cwd=repo_dir)
+
+def _ensure_commit(repo_dir: str, commit: str) -> bool:
+    """Make sure `commit` is available locally, fetching just that commit if needed"""
+    try:
+        _git(["cat-file", "-e", f"{commit}^{{commit}}"], cwd=repo_dir)
+        return True
+    except subprocess.CalledProcessError:
+        pass
+    try:
+        _git(["fetch", "--depth=1", "--filter=blob:none", "origin", commit], cwd=repo_dir)
+        return True
+    except subprocess.CalledProcessError:
+        return False
+
+def _in_docs_paths(path: str, docs_paths: Optional[List[str]]) -> bool:
+    if not docs_paths:
+        return True
+    return any(path == p or path.startswith(p.rstrip('/') + '/') for p in docs_paths)
+
+def get_changed_markdown_files(repo_dir: str, old_commit: str, new_commit: str,
+                               docs_paths: Optional[List[str]] = None) -> Optional[Dict[str, List[str]]]:
+    """Diff two commits and return the markdown files to (re)index and to delete.
+
+    Renames are reported as a deletion of the old path plus an addition of the
+    new one. Returns None when the old commit cannot be resolved, in which case
+    the caller should fall back to a full walk.
+    """
+    if not _ensure_commit(repo_dir, old_commit):
+        return None
 
-def find_markdown_files(repo_dir):
+    with metrics.span('walk', mode='diff'):
+        # NUL-separated records keep unusual paths unquoted; the pathspec limits the diff to the docs
+        output = _git(["diff", "-z", "--name-status", "-M", f"{old_commit}..{new_commit}", "--", *(docs_paths or [])],
+                      cwd=repo_dir)
+    changed, deleted = [], []
+    fields = iter(output.split('\0'))
+    for status in fields:
+        if not status:
+            continue
+        if status[0] in 'RC':
+            old_path, new_path = next(fields), next(fields)
+            if status[0] == 'R':
+                deleted.append(old_path)
+            changed.append(new_path)
+        elif status[0] == 'D':
+            deleted.append(next(fields))
+        else:
+            # A (added), M (modified) and T (type change)
+            changed.append(next(fields))
+
+    def keep(paths):
+        return [
+            os.path.join(repo_dir, p) for p in paths
+            if p.endswith('.md') and _in_docs_paths(p, docs_paths)
+        ]
+
+    return {'changed': keep(changed), 'deleted': keep(deleted)}
+
+def find_markdown_files(repo_dir, docs_paths: Optional[List[str]] = None):
+    roots = [os.path.join(repo_dir, p) for p in docs_paths] if docs_paths else [repo_dir]
     markdown_files = []
-    for root, dirs, files in os.walk(repo_dir):
-        for file in files:
-            if file.endswith('.md'):
-                markdown_files.append(os.path.join(root, file))
+    with metrics.span('walk', mode='full'):
+        for start in roots:
+            for root, dirs, files in os.walk(start):
+                dirs[:] = [d for d in dirs if d != '.git']
+                for file in files:
+                    if file.endswith('.md'):
+                        markdown_files.append(os.path.join(root, file))
     return markdown_files
 
 if __name__ == "__main__":
     repo_url = "https://github.com/activeloopai/docs-gitbook"
     target_dir = "docs-gitbook"
-    
+
     # Clone or update the repository
     clone_or_pull_repo(repo_url, target_dir)
-    
+
     # Find all markdown files
     markdown_files = find_markdown_files(target_dir)
-    
+
     print(f"Found {len(markdown_files)} markdown files:")
     for file in markdown_files:
-        print(file)
\ No newline at end of file
+        print(file)
@@ -0,0 +1,452 @@
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS collections (
+    name TEXT PRIMARY KEY,
+    repo_url TEXT,
+    embedding_model TEXT,
+    embedding_provider TEXT,
+    embedding_dimension INTEGER,
+    chunker TEXT,
+    qdrant_profile TEXT,
+    last_commit TEXT,
+    version INTEGER NOT NULL DEFAULT 0,
+    updated_at REAL
+);
+CREATE TABLE IF NOT EXISTS files (
+    collection TEXT NOT NULL,
+    file_path TEXT NOT NULL,
+    file_hash TEXT NOT NULL,
+    chunk_count INTEGER NOT NULL,
+    PRIMARY KEY (collection, file_path)
+);
+CREATE TABLE IF NOT EXISTS chunks (
+    collection TEXT NOT NULL,
+    point_id TEXT NOT NULL,
+    file_path TEXT NOT NULL,
+    chunk_id INTEGER NOT NULL,
+    chunk_hash TEXT,
+    PRIMARY KEY (collection, point_id)
+);
+CREATE INDEX IF NOT EXISTS chunks_by_file ON chunks (collection, file_path);
+CREATE TABLE IF NOT EXISTS lexical_docs (
+    doc_id INTEGER PRIMARY KEY,
+    collection TEXT NOT NULL,
+    point_id TEXT NOT NULL,
+    length INTEGER NOT NULL,
+    UNIQUE (collection, point_id)
+);
+CREATE TABLE IF NOT EXISTS postings (
+    term TEXT NOT NULL,
+    doc_id INTEGER NOT NULL,
+    tf INTEGER NOT NULL,
+    PRIMARY KEY (term, doc_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS postings_by_doc ON postings (doc_id);
+CREATE TABLE IF NOT EXISTS pages (
+    collection TEXT NOT NULL,
+    url TEXT NOT NULL,
+    file_path TEXT NOT NULL,
+    etag TEXT,
+    last_modified TEXT,
+    links TEXT,
+    fetched_at REAL,
+    PRIMARY KEY (collection, url)
+);
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY,
+    collection TEXT NOT NULL,
+    status TEXT NOT NULL,
+    target TEXT,
+    settings TEXT,
+    reindex_all INTEGER NOT NULL DEFAULT 0,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS runs_by_collection ON runs (collection, run_id);
+CREATE TABLE IF NOT EXISTS run_files (
+    run_id INTEGER NOT NULL,
+    file_path TEXT NOT NULL,
+    deleted INTEGER NOT NULL DEFAULT 0,
+    status TEXT NOT NULL,
+    PRIMARY KEY (run_id, file_path)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS run_failures (
+    run_id INTEGER NOT NULL,
+    file_path TEXT NOT NULL,
+    chunk_id INTEGER,
+    point_id TEXT,
+    error TEXT,
+    failed_at REAL
+);
+CREATE INDEX IF NOT EXISTS run_failures_by_run ON run_failures (run_id);
+"""
+
+COLLECTION_FIELDS = ('repo_url', 'embedding_model', 'embedding_provider', 'embedding_dimension', 'chunker',
+                     'qdrant_profile', 'last_commit')
+COLUMN_TYPES = {'embedding_dimension': 'INTEGER'}
+
+def get_state_path(target_dir: str) -> str:
+    """Path of the index state database kept next to a clone"""
+    target = Path(target_dir).resolve()
+    return str(target.parent / f".{target.name}.docrag_index.sqlite")
+
+def _locked(method):
+    """Run an IndexState method under the state's lock"""
+    @wraps(method)
+    def locked(self, *args, **kwargs):
+        with self._lock:
+            return method(self, *args, **kwargs)
+    return locked
+
+class IndexState:
+    """Local record of what has been indexed into each collection.
+
+    Tracks file hashes, the point IDs of every chunk, the embedding provider,
+    model and dimension, and the last indexed commit, so a run can decide what
+    changed without reading the vector store. It also holds the BM25 postings
+    of every chunk for lexical search, the validators of crawled pages, and a
+    journal of indexing runs. Writes should be made inside
+    `transaction()` right after the corresponding upsert or delete succeeds.
+
+    The connection is shared by the threads of the pipeline's executor; every
+    method, and every transaction as a whole, runs under one reentrant lock.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._lock = threading.RLock()
+        parent = os.path.dirname(os.path.abspath(db_path))
+        os.makedirs(parent, exist_ok=True)
+        self.conn = sqlite3.connect(db_path, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self._migrate()
+
+    def _migrate(self):
+        """Add columns introduced after a state database was created"""
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(collections)")}
+        for column in COLLECTION_FIELDS:
+            if column not in columns:
+                self.conn.execute(f"ALTER TABLE collections ADD COLUMN {column} {COLUMN_TYPES.get(column, 'TEXT')}")
+        if 'version' not in columns:
+            self.conn.execute("ALTER TABLE collections ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+
+    @_locked
+    def close(self):
+        self.conn.close()
+
+    @contextmanager
+    def transaction(self):
+        """Group several writes into one atomic transaction; other threads wait until it ends"""
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+            else:
+                self.conn.execute("COMMIT")
+
+    # Collections
+
+    @_locked
+    def get_collection_info(self, collection: str) -> Optional[Dict]:
+        columns = ('name', *COLLECTION_FIELDS, 'version', 'updated_at')
+        row = self.conn.execute(
+            f"SELECT {', '.join(columns)} FROM collections WHERE name = ?", (collection,)
+        ).fetchone()
+        if row is None:
+            return None
+        return dict(zip(columns, row))
+
+    def _touch_collection(self, collection: str):
+        """Bump the collection version; every write to a collection goes through here"""
+        self.conn.execute(
+            "INSERT INTO collections (name, version, updated_at) VALUES (?, 1, ?) "
+            "ON CONFLICT(name) DO UPDATE SET version = version + 1, updated_at = excluded.updated_at",
+            (collection, time.time())
+        )
+
+    @_locked
+    def get_version(self, collection: str) -> int:
+        """Changes whenever anything indexed in the collection changes"""
+        row = self.conn.execute("SELECT version FROM collections WHERE name = ?", (collection,)).fetchone()
+        return row[0] if row else 0
+
+    @_locked
+    def set_collection_info(self, collection: str, **fields):
+        """Update any of COLLECTION_FIELDS of a collection"""
+        self._touch_collection(collection)
+        for key, value in fields.items():
+            if key not in COLLECTION_FIELDS:
+                raise ValueError(f"Unknown collection field: {key}")
+            self.conn.execute(f"UPDATE collections SET {key} = ? WHERE name = ?", (value, collection))
+
+    @_locked
+    def get_last_commit(self, collection: str) -> Optional[str]:
+        info = self.get_collection_info(collection)
+        return info['last_commit'] if info else None
+
+    @_locked
+    def set_last_commit(self, collection: str, commit: str, repo_url: Optional[str] = None):
+        fields = {'last_commit': commit}
+        if repo_url is not None:
+            fields['repo_url'] = repo_url
+        self.set_collection_info(collection, **fields)
+
+    # Files and chunks
+
+    @_locked
+    def get_file_hashes(self, collection: str) -> Dict[str, str]:
+        """file_path -> file_hash of every fully indexed file"""
+        return dict(self.conn.execute(
+            "SELECT file_path, file_hash FROM files WHERE collection = ?", (collection,)
+        ))
+
+    @_locked
+    def get_file_paths(self, collection: str) -> List[str]:
+        """Every file with recorded chunks or a recorded hash, including partly indexed ones"""
+        return [row[0] for row in self.conn.execute(
+            "SELECT file_path FROM files WHERE collection = ? UNION SELECT file_path FROM chunks WHERE collection = ?",
+            (collection, collection)
+        )]
+
+    @_locked
+    def get_collection_point_ids(self, collection: str) -> Set[str]:
+        return {row[0] for row in self.conn.execute(
+            "SELECT point_id FROM chunks WHERE collection = ?", (collection,)
+        )}
+
+    @_locked
+    def get_point_ids(self, collection: str, file_path: str) -> List[str]:
+        return [row[0] for row in self.conn.execute(
+            "SELECT point_id FROM chunks WHERE collection = ? AND file_path = ?", (collection, file_path)
+        )]
+
+    @_locked
+    def get_file_chunks(self, collection: str, file_path: str) -> Dict[str, int]:
+        """point_id -> chunk_id of the recorded chunks of a file"""
+        return dict(self.conn.execute(
+            "SELECT point_id, chunk_id FROM chunks WHERE collection = ? AND file_path = ?", (collection, file_path)
+        ))
+
+    @_locked
+    def add_chunks(self, collection: str, chunks: Iterable[Tuple[str, str, int, Optional[str]]]):
+        """Record upserted chunks as (point_id, file_path, chunk_id, chunk_hash)"""
+        self._touch_collection(collection)
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO chunks (collection, point_id, file_path, chunk_id, chunk_hash) "
+            "VALUES (?, ?, ?, ?, ?)",
+            ((collection, str(point_id), file_path, chunk_id, chunk_hash)
+             for point_id, file_path, chunk_id, chunk_hash in chunks)
+        )
+
+    @_locked
+    def delete_chunks(self, collection: str, point_ids: Iterable[str]):
+        point_ids = [str(point_id) for point_id in point_ids]
+        self._touch_collection(collection)
+        self.delete_postings(collection, point_ids)
+        self.conn.executemany(
+            "DELETE FROM chunks WHERE collection = ? AND point_id = ?",
+            ((collection, point_id) for point_id in point_ids)
+        )
+
+    @_locked
+    def set_file(self, collection: str, file_path: str, file_hash: str, chunk_count: int):
+        """Mark a file as fully indexed at `file_hash`"""
+        self._touch_collection(collection)
+        self.conn.execute(
+            "INSERT OR REPLACE INTO files (collection, file_path, file_hash, chunk_count) VALUES (?, ?, ?, ?)",
+            (collection, file_path, file_hash, chunk_count)
+        )
+
+    @_locked
+    def delete_file(self, collection: str, file_path: str):
+        """Forget a file and all of its chunks"""
+        self._touch_collection(collection)
+        self.conn.execute("DELETE FROM files WHERE collection = ? AND file_path = ?", (collection, file_path))
+        self.delete_postings(collection, self.get_point_ids(collection, file_path))
+        self.conn.execute("DELETE FROM chunks WHERE collection = ? AND file_path = ?", (collection, file_path))
+
+    @_locked
+    def clear_collection(self, collection: str):
+        """Forget everything recorded for a collection except its commit and model"""
+        self._touch_collection(collection)
+        self.conn.execute("DELETE FROM files WHERE collection = ?", (collection,))
+        self.conn.execute("DELETE FROM chunks WHERE collection = ?", (collection,))
+        self.conn.execute(
+            "DELETE FROM postings WHERE doc_id IN (SELECT doc_id FROM lexical_docs WHERE collection = ?)", (collection,)
+        )
+        self.conn.execute("DELETE FROM lexical_docs WHERE collection = ?", (collection,))
+
+    @_locked
+    def count_chunks(self, collection: str) -> int:
+        return self.conn.execute(
+            "SELECT COUNT(*) FROM chunks WHERE collection = ?", (collection,)
+        ).fetchone()[0]
+
+    # Lexical postings
+
+    @_locked
+    def add_postings(self, collection: str, docs: Iterable[Tuple[str, Dict[str, int]]]):
+        """Record the term frequencies of chunks as (point_id, {term: tf}); known chunks are left as they are"""
+        for point_id, terms in docs:
+            cursor = self.conn.execute(
+                "INSERT OR IGNORE INTO lexical_docs (collection, point_id, length) VALUES (?, ?, ?)",
+                (collection, str(point_id), sum(terms.values()))
+            )
+            if cursor.rowcount:
+                doc_id = cursor.lastrowid
+                self.conn.executemany(
+                    "INSERT INTO postings (term, doc_id, tf) VALUES (?, ?, ?)",
+                    ((term, doc_id, tf) for term, tf in terms.items())
+                )
+
+    @_locked
+    def delete_postings(self, collection: str, point_ids: Iterable[str]):
+        for point_id in point_ids:
+            row = self.conn.execute(
+                "SELECT doc_id FROM lexical_docs WHERE collection = ? AND point_id = ?", (collection, str(point_id))
+            ).fetchone()
+            if row is not None:
+                self.conn.execute("DELETE FROM postings WHERE doc_id = ?", row)
+                self.conn.execute("DELETE FROM lexical_docs WHERE doc_id = ?", row)
+
+    @_locked
+    def get_lexical_stats(self, collection: str) -> Tuple[int, float]:
+        """Number of chunks with postings and their average length in terms"""
+        count, average = self.conn.execute(
+            "SELECT COUNT(*), AVG(length) FROM lexical_docs WHERE collection = ?", (collection,)
+        ).fetchone()
+        return count, average or 0.0
+
+    @_locked
+    def get_postings(self, collection: str, terms: Iterable[str]) -> Dict[str, List[Tuple[str, int, int]]]:
+        """term -> [(point_id, tf, chunk length)] for the terms that occur in the collection"""
+        terms = list(terms)
+        postings: Dict[str, List[Tuple[str, int, int]]] = {}
+        for i in range(0, len(terms), 500):
+            part = terms[i:i + 500]
+            placeholders = ','.join('?' * len(part))
+            for term, point_id, tf, length in self.conn.execute(
+                "SELECT p.term, d.point_id, p.tf, d.length FROM postings p JOIN lexical_docs d ON d.doc_id = p.doc_id "
+                f"WHERE p.term IN ({placeholders}) AND d.collection = ?", (*part, collection)
+            ):
+                postings.setdefault(term, []).append((point_id, tf, length))
+        return postings
+
+    # Crawled pages
+
+    @_locked
+    def get_pages(self, collection: str) -> Dict[str, Dict]:
+        """url -> {file_path, etag, last_modified, links} of every page crawled for a collection"""
+        columns = ('file_path', 'etag', 'last_modified', 'links')
+        return {row[0]: dict(zip(columns, row[1:])) for row in self.conn.execute(
+            f"SELECT url, {', '.join(columns)} FROM pages WHERE collection = ?", (collection,)
+        )}
+
+    @_locked
+    def set_page(self, collection: str, url: str, file_path: str, etag: Optional[str],
+                 last_modified: Optional[str], links: Optional[str]):
+        """Record a fetched page with its HTTP validators and its links as a JSON list"""
+        self.conn.execute(
+            "INSERT OR REPLACE INTO pages (collection, url, file_path, etag, last_modified, links, fetched_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (collection, url, file_path, etag, last_modified, links, time.time())
+        )
+
+    @_locked
+    def delete_page(self, collection: str, url: str):
+        self.conn.execute("DELETE FROM pages WHERE collection = ? AND url = ?", (collection, url))
+
+    # Indexing runs
+
+    @_locked
+    def start_run(self, collection: str, markdown_files: Iterable[str], deleted_files: Iterable[str],
+                  reindex_all: bool = False, target: Optional[str] = None, settings: Optional[str] = None,
+                  keep: int = 10) -> int:
+        """Journal a run over the given files; earlier unfinished runs of the collection are abandoned"""
+        with self.transaction():
+            self.conn.execute(
+                "UPDATE runs SET status = 'abandoned' WHERE collection = ? AND status IN ('running', 'incomplete')",
+                (collection,)
+            )
+            run_id = self.conn.execute(
+                "INSERT INTO runs (collection, status, target, settings, reindex_all, started_at) "
+                "VALUES (?, 'running', ?, ?, ?, ?)",
+                (collection, target, settings, int(reindex_all), time.time())
+            ).lastrowid
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO run_files (run_id, file_path, deleted, status) VALUES (?, ?, ?, 'pending')",
+                [(run_id, f, 0) for f in markdown_files] + [(run_id, f, 1) for f in deleted_files]
+            )
+            old = [row[0] for row in self.conn.execute(
+                "SELECT run_id FROM runs WHERE collection = ? ORDER BY run_id DESC LIMIT -1 OFFSET ?", (collection, keep)
+            )]
+            for table in ('run_files', 'run_failures', 'runs'):
+                self.conn.executemany(f"DELETE FROM {table} WHERE run_id = ?", ((r,) for r in old))
+        return run_id
+
+    @_locked
+    def get_resumable_run(self, collection: str) -> Optional[Dict]:
+        """The collection's last run if it was interrupted or left files incomplete"""
+        columns = ('run_id', 'status', 'target', 'settings', 'reindex_all', 'started_at')
+        row = self.conn.execute(
+            f"SELECT {', '.join(columns)} FROM runs WHERE collection = ? ORDER BY run_id DESC LIMIT 1", (collection,)
+        ).fetchone()
+        if row is None or row[1] not in ('running', 'incomplete'):
+            return None
+        run = dict(zip(columns, row))
+        run['reindex_all'] = bool(run['reindex_all'])
+        return run
+
+    @_locked
+    def get_run_files(self, run_id: int) -> Tuple[List[str], List[str]]:
+        """(files to index, files to delete) that the run has not finished"""
+        markdown_files, deleted_files = [], []
+        for file_path, deleted in self.conn.execute(
+            "SELECT file_path, deleted FROM run_files WHERE run_id = ? AND status != 'done' ORDER BY file_path",
+            (run_id,)
+        ):
+            (deleted_files if deleted else markdown_files).append(file_path)
+        return markdown_files, deleted_files
+
+    @_locked
+    def set_run_file(self, run_id: int, file_path: str, status: str):
+        """Mark a file of a run 'done', or 'incomplete' when some of its chunks failed"""
+        self.conn.execute(
+            "UPDATE run_files SET status = ? WHERE run_id = ? AND file_path = ?", (status, run_id, file_path)
+        )
+
+    @_locked
+    def add_run_failures(self, run_id: int, failures: Iterable[Tuple[str, Optional[int], Optional[str], str]]):
+        """Journal chunks that failed as (file_path, chunk_id, point_id, error)"""
+        now = time.time()
+        self.conn.executemany(
+            "INSERT INTO run_failures (run_id, file_path, chunk_id, point_id, error, failed_at) VALUES (?, ?, ?, ?, ?, ?)",
+            ((run_id, *failure, now) for failure in failures)
+        )
+
+    @_locked
+    def get_run_failures(self, run_id: int) -> List[Dict]:
+        columns = ('file_path', 'chunk_id', 'point_id', 'error', 'failed_at')
+        return [dict(zip(columns, row)) for row in self.conn.execute(
+            f"SELECT {', '.join(columns)} FROM run_failures WHERE run_id = ? ORDER BY rowid", (run_id,)
+        )]
+
+    @_locked
+    def finish_run(self, run_id: int, status: str):
+        """Close a run as 'complete', or 'incomplete' when files are left to retry"""
+        self.conn.execute(
+            "UPDATE runs SET status = ?, finished_at = ? WHERE run_id = ?", (status, time.time(), run_id)
+        )
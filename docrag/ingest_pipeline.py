@@ -0,0 +1,316 @@
+import os
+import asyncio
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from qdrant_client import QdrantClient
+from tqdm import tqdm
+
+import metrics
+from index_state import IndexState
+from chunk_batch import ChunkBatch
+from markdown_processor import process_file_group, group_files
+from embedding_client import EmbeddingAborted
+from embedding_providers import EmbeddingProvider
+from openai_vector_generator import embed_chunks, report_failed_chunks
+from qdrant_uploader import (
+    setup_qdrant_collection, delete_indexed_files, plan_chunk_updates, upsert_chunk_batch,
+    record_upserted_chunks, refresh_file_points, record_finalized_file, wait_for_collection
+)
+
+_DONE = object()
+# Rejected upserts are retried in halves down to this many chunks
+MIN_UPSERT_BATCH = 10
+
+@dataclass
+class PendingFile:
+    """A changed file whose new chunks are still being embedded or upserted"""
+    file_hash: str
+    retained_chunks: List[Dict]
+    stale_point_ids: List[str]
+    chunk_count: int
+    pending: int
+    failed: bool = False
+
+@dataclass
+class PipelineStats:
+    files_seen: int = 0
+    files_skipped: int = 0
+    files_indexed: int = 0
+    files_incomplete: int = 0
+    files_deleted: int = 0
+    chunks_embedded: int = 0
+    chunks_retained: int = 0
+    points_deleted: int = 0
+    failed_chunks: List[Dict] = field(default_factory=list)
+
+async def run_ingest_pipeline(qdrant_client: QdrantClient, collection_name: str, state: IndexState,
+                              markdown_files: List[str], deleted_files: Optional[List[str]] = None,
+                              embedding_provider: Optional[EmbeddingProvider] = None,
+                              queue_size: int = 8, embed_batch_size: int = 256, max_embed_batches: int = 4,
+                              workers: Optional[int] = None, upsert_workers: int = 4, reindex_all: bool = False,
+                              on_collection_ready=None, run_id: Optional[int] = None) -> PipelineStats:
+    """Stream files through chunk -> embed -> upsert with bounded queues.
+
+    Files are chunked in groups on a pool of `workers` processes, new chunks are grouped
+    into embedding batches of `embed_batch_size` with at most
+    `max_embed_batches` in flight, and embedded batches are upserted while
+    later batches are still being embedded. The chunk queue holds at most one
+    batch and the upsert queue at most `queue_size` batches, so memory stays
+    proportional to the queue depth rather than to the size of the repository.
+
+    `upsert_workers` batches are upserted at once. Upserts do not wait for
+    Qdrant to apply them (it has logged them when it answers); the run waits
+    once at the end until the collection is indexed. A batch Qdrant rejects
+    is retried in halves; chunks that still fail are reported like chunks
+    that failed to embed, and their files stay incomplete. Deleted files are
+    removed with coalesced filtered deletes before anything else.
+
+    With `reindex_all`, files are re-chunked even if their content is
+    unchanged (e.g. after a chunker change); unchanged chunks still keep
+    their points.
+
+    With `run_id`, progress is journaled in the index state as it is made:
+    every finished file is marked done and every chunk that failed to embed
+    or upsert is recorded, so an interrupted run can be resumed with only the files it
+    had not finished. Upserted chunks are recorded batch by batch in any case,
+    so a resumed run does not embed them again.
+    """
+    loop = asyncio.get_running_loop()
+    stats = PipelineStats()
+    pending_files: Dict[str, PendingFile] = {}
+    chunk_queue: asyncio.Queue = asyncio.Queue(maxsize=embed_batch_size)
+    upsert_queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+    collection_lock = asyncio.Lock()
+    collection_ready = False
+    pbar = tqdm(desc="Indexing chunks", unit="chunk")
+
+    # Qdrant requests and index state reads and writes (SQLite) run on the default thread pool,
+    # so the event loop keeps feeding the embedding requests
+    def journal(file_path: str, status: str = 'done'):
+        if run_id is not None:
+            state.set_run_file(run_id, file_path, status)
+
+    def delete_files() -> List[str]:
+        deleted = delete_indexed_files(qdrant_client, collection_name, deleted_files, state)
+        for file_path in deleted:
+            journal(file_path)
+        return deleted
+
+    if deleted_files:
+        # Files whose delete failed stay pending in the run and in the index state, to be retried
+        deleted = await loop.run_in_executor(None, delete_files)
+        stats.files_deleted += len(deleted)
+        stats.files_incomplete += len(deleted_files) - len(deleted)
+    existing_hashes = {} if reindex_all else await loop.run_in_executor(None, state.get_file_hashes,
+                                                                        collection_name)
+
+    def finalize_file(file_path: str, pending: PendingFile):
+        known_chunk_ids = state.get_file_chunks(collection_name, file_path) if pending.retained_chunks else {}
+        refresh_file_points(qdrant_client, collection_name, pending.file_hash, pending.retained_chunks,
+                            pending.stale_point_ids, known_chunk_ids)
+        record_finalized_file(state, collection_name, file_path, pending.file_hash,
+                              pending.retained_chunks, pending.stale_point_ids, pending.chunk_count)
+        journal(file_path)
+
+    async def finalize(file_path: str):
+        pending = pending_files.pop(file_path)
+        if pending.failed:
+            stats.files_incomplete += 1
+            await loop.run_in_executor(None, journal, file_path, 'incomplete')
+            return
+        await loop.run_in_executor(None, finalize_file, file_path, pending)
+        stats.files_indexed += 1
+        stats.points_deleted += len(pending.stale_point_ids)
+
+    async def produce():
+        """Chunk files and queue the chunks that need embedding"""
+        # Keep a bounded window of file groups in flight on the process pool
+        groups = deque(group_files([str(f) for f in markdown_files], workers))
+        in_flight = deque()
+        while groups or in_flight:
+            while groups and len(in_flight) < workers * 2:
+                in_flight.append(loop.run_in_executor(pool, process_file_group, groups.popleft()))
+            for chunks, manifest in await in_flight.popleft():
+                await handle_file(chunks, manifest)
+        await chunk_queue.put(_DONE)
+
+    async def handle_file(chunks: List[Dict], manifest: Dict):
+        file_path = manifest['file_path']
+        stats.files_seen += 1
+        # Chunking ran in a worker process; record its timings here
+        for stage, seconds in manifest['seconds'].items():
+            metrics.record(stage, seconds)
+        if existing_hashes.get(file_path) == manifest['file_hash']:
+            stats.files_skipped += 1
+            metrics.incr('files_indexed_total', result='unchanged')
+            await loop.run_in_executor(None, journal, file_path)
+            return
+        metrics.incr('files_indexed_total', result='changed')
+        new_chunks, retained_chunks, stale_point_ids = await loop.run_in_executor(
+            None, plan_chunk_updates, state, collection_name, chunks, {file_path}
+        )
+        pending_files[file_path] = PendingFile(
+            file_hash=manifest['file_hash'],
+            retained_chunks=retained_chunks,
+            stale_point_ids=stale_point_ids[file_path],
+            chunk_count=len(chunks),
+            pending=len(new_chunks)
+        )
+        stats.chunks_retained += len(retained_chunks)
+        pbar.update(len(retained_chunks))
+        if new_chunks:
+            for chunk in new_chunks:
+                await chunk_queue.put(chunk)
+        else:
+            # Nothing to embed, only payload refreshes and deletions
+            await upsert_queue.put((ChunkBatch.empty(), [], [file_path]))
+
+    async def embed():
+        """Group queued chunks into batches and embed up to `max_embed_batches` at once"""
+        slots = asyncio.Semaphore(max_embed_batches)
+        tasks = set()
+        aborted: List[EmbeddingAborted] = []
+
+        async def embed_batch(batch: List[Dict]):
+            try:
+                try:
+                    embedded, failed = await embed_chunks(batch, embedding_provider, progress=lambda n: None)
+                except EmbeddingAborted as e:
+                    # Every further batch would be rejected too: stop, the run stays resumable
+                    aborted.append(e)
+                    return
+                except Exception as e:
+                    embedded = ChunkBatch.empty()
+                    failed = [{'text': c['text'], 'metadata': c['metadata'], 'error': str(e)} for c in batch]
+                await upsert_queue.put((embedded, failed, []))
+            finally:
+                slots.release()
+
+        async def flush(batch: List[Dict]):
+            await slots.acquire()
+            if aborted:
+                raise aborted[0]
+            task = asyncio.ensure_future(embed_batch(batch))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+        batch = []
+        try:
+            while True:
+                chunk = await chunk_queue.get()
+                if chunk is _DONE:
+                    break
+                batch.append(chunk)
+                if len(batch) >= embed_batch_size:
+                    await flush(batch)
+                    batch = []
+            if batch:
+                await flush(batch)
+            if tasks:
+                await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+        if aborted:
+            raise aborted[0]
+        await upsert_queue.put(_DONE)
+
+    async def upsert_with_retry(batch: ChunkBatch, file_hashes: Dict[str, str]) -> List[Dict]:
+        """Upsert `batch`, splitting it in halves down to `MIN_UPSERT_BATCH` chunks while Qdrant rejects it.
+
+        Each part is recorded as soon as it is upserted, so a resumed run never
+        embeds it again. Returns the chunks that still failed, with their error.
+        """
+        try:
+            await loop.run_in_executor(
+                None, upsert_chunk_batch, qdrant_client, collection_name, batch, file_hashes, False
+            )
+        except Exception as e:
+            if len(batch) <= MIN_UPSERT_BATCH:
+                return [{'text': chunk.text, 'metadata': chunk.metadata, 'error': f"Upsert failed: {e}"}
+                        for chunk in batch]
+            half = len(batch) // 2
+            return [*await upsert_with_retry(batch[:half], file_hashes),
+                    *await upsert_with_retry(batch[half:], file_hashes)]
+        await loop.run_in_executor(None, record_upserted_chunks, state, collection_name, batch)
+        stats.chunks_embedded += len(batch)
+        pbar.update(len(batch))
+        return []
+
+    async def upsert():
+        """Upsert embedded batches and finalize files once all their chunks are in"""
+        nonlocal collection_ready
+        while True:
+            item = await upsert_queue.get()
+            if item is _DONE:
+                # Let the other upsert workers see it too
+                await upsert_queue.put(_DONE)
+                break
+            embedded, failed, finished_files = item
+
+            if len(embedded):
+                async with collection_lock:
+                    if not collection_ready:
+                        await loop.run_in_executor(
+                            None, setup_qdrant_collection, qdrant_client, collection_name, embedded.dimension
+                        )
+                        if on_collection_ready is not None:
+                            await loop.run_in_executor(None, on_collection_ready)
+                        collection_ready = True
+                file_hashes = {
+                    metadata['file_path']: pending_files[metadata['file_path']].file_hash
+                    for metadata in embedded.metadata
+                }
+                upsert_failed = await upsert_with_retry(embedded, file_hashes)
+            else:
+                upsert_failed = []
+
+            # Chunks that failed to embed or to upsert leave their file incomplete, to be retried
+            for chunk in [*failed, *upsert_failed]:
+                pending_files[chunk['metadata']['file_path']].failed = True
+            stats.failed_chunks.extend([*failed, *upsert_failed])
+            if (failed or upsert_failed) and run_id is not None:
+                await loop.run_in_executor(None, state.add_run_failures, run_id, [
+                    (c['metadata']['file_path'], c['metadata'].get('chunk_id'), c['metadata'].get('point_id'), c['error'])
+                    for c in [*failed, *upsert_failed]
+                ])
+
+            for metadata in [*embedded.metadata, *(chunk['metadata'] for chunk in failed)]:
+                file_path = metadata['file_path']
+                pending_files[file_path].pending -= 1
+                if pending_files[file_path].pending == 0:
+                    finished_files.append(file_path)
+            for file_path in finished_files:
+                await finalize(file_path)
+
+    workers = workers if workers is not None else (os.cpu_count() or 1)
+    # Without extra workers, chunk on the default thread pool
+    pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    stages = [asyncio.ensure_future(stage()) for stage in (produce, embed, *[upsert] * max(1, upsert_workers))]
+    try:
+        await asyncio.gather(*stages)
+        if collection_ready:
+            await loop.run_in_executor(None, wait_for_collection, qdrant_client, collection_name)
+    except BaseException:
+        for stage in stages:
+            stage.cancel()
+        raise
+    finally:
+        pbar.close()
+        if pool is not None:
+            pool.shutdown(wait=False)
+
+    report_failed_chunks(stats.failed_chunks)
+    print(f"\nProcessed {stats.files_seen} files:")
+    print(f"- Skipped: {stats.files_skipped}")
+    print(f"- Updated/New: {stats.files_indexed}")
+    if stats.files_incomplete:
+        print(f"- Incomplete (will be retried): {stats.files_incomplete}")
+    if stats.files_deleted:
+        print(f"- Deleted: {stats.files_deleted}")
+    print(f"- Points upserted: {stats.chunks_embedded}, kept: {stats.chunks_retained}, deleted: {stats.points_deleted}")
+    return stats
@@ -0,0 +1,88 @@
+import re
+import math
+import heapq
+from collections import Counter
+from typing import Dict, Hashable, Iterable, List, Optional, Sequence, Tuple
+
+# Identifiers, including dotted member access (page.waitForSelector), and numbers
+WORD_RE = re.compile(r"[A-Za-z_$][\w$]*(?:\.[A-Za-z_$][\w$]*)*|\d+(?:\.\d+)*")
+# Pieces of camelCase and snake_case names
+PART_RE = re.compile(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|\d+")
+IDENTIFIER_QUERY_RE = re.compile(r"^`?([A-Za-z_$][\w$]*(?:\.[A-Za-z_$][\w$]*)*)(?:\(\))?`?$")
+
+STOPWORDS = frozenset(
+    "a an and are as at be by can do for from how i if in into is it its of on or that the this to was what "
+    "when where which who why will with you your".split()
+)
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+RRF_K = 60
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased search terms: whole dotted names, their members and their camel/snake case parts"""
+    tokens = []
+    for match in WORD_RE.finditer(text):
+        word = match.group()
+        parts = word.split('.')
+        if len(parts) > 1:
+            tokens.append(word.lower())
+        for part in parts:
+            lowered = part.lower()
+            if lowered not in STOPWORDS:
+                tokens.append(lowered)
+            pieces = PART_RE.findall(part)
+            if len(pieces) > 1:
+                tokens.extend(p.lower() for p in pieces if p.lower() not in STOPWORDS)
+    return tokens
+
+def chunk_terms(text: str, heading_path: Sequence[str] = ()) -> Dict[str, int]:
+    """Term frequencies of a chunk; headings count as part of the chunk"""
+    return dict(Counter(tokenize(' '.join([*heading_path, text]))))
+
+def identifier_term(query: str) -> Optional[str]:
+    """The index term for a query that is a single code identifier (dotted, camelCase or snake_case)"""
+    match = IDENTIFIER_QUERY_RE.match(query.strip())
+    if match is None:
+        return None
+    name = match.group(1)
+    if '.' in name or '_' in name or re.search(r"[a-z][A-Z]", name):
+        return name.lower()
+    return None
+
+def bm25_search(state, collection_name: str, query: str, limit: int = 10,
+                required_term: Optional[str] = None) -> List[Tuple[str, float]]:
+    """Rank chunks of a collection by BM25 over the postings in the index state.
+
+    With `required_term`, only chunks containing that term are returned.
+    """
+    terms = set(tokenize(query))
+    if required_term is not None:
+        terms.add(required_term)
+    if not terms:
+        return []
+    doc_count, average_length = state.get_lexical_stats(collection_name)
+    if not doc_count:
+        return []
+    postings = state.get_postings(collection_name, terms)
+    if required_term is not None and required_term not in postings:
+        return []
+
+    scores: Dict[str, float] = {}
+    for term, entries in postings.items():
+        idf = math.log(1 + (doc_count - len(entries) + 0.5) / (len(entries) + 0.5))
+        for point_id, tf, length in entries:
+            norm = tf + BM25_K1 * (1 - BM25_B + BM25_B * length / average_length)
+            scores[point_id] = scores.get(point_id, 0.0) + idf * tf * (BM25_K1 + 1) / norm
+    if required_term is not None:
+        allowed = {point_id for point_id, _, _ in postings[required_term]}
+        scores = {point_id: score for point_id, score in scores.items() if point_id in allowed}
+    return heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+
+def reciprocal_rank_fusion(rankings: Iterable[Sequence[Hashable]], k: int = RRF_K) -> List[Tuple[Hashable, float]]:
+    """Fuse ranked ID lists: each ID scores the sum of 1 / (k + rank) over the lists it appears in"""
+    scores: Dict[Hashable, float] = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
@@ -0,0 +1,93 @@
+import os
+import sys
+import json
+import logging
+import argparse
+
+# The modules import each other by plain name, as when the scripts are run from this directory
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# Everything else is imported by the subcommand that needs it, so `docrag search` against a
+# running server only loads the standard library
+
+def _print_results(query: str, results, as_json: bool):
+    if as_json:
+        print(json.dumps({'query': query, 'results': results}))
+        return
+    print(f"# {query}")
+    for result in results:
+        payload = result['payload'] or {}
+        print(f"Score: {result['score']}")
+        print(f"Text: {payload.get('text')}")
+        print(f"File: {payload.get('file_path')}")
+        print(f"Chunk ID: {payload.get('chunk_id')}")
+        print("---")
+
+def search_command(args):
+    server = args.server or os.getenv("DOCRAG_SERVER")
+    if server:
+        from query_client import QueryClient
+        searcher = QueryClient(server)
+    else:
+        import metrics
+        from query_server import QueryService
+        metrics.configure_from_env()
+        searcher = QueryService(target_dir=args.target_dir, docs_dir=args.docs_dir)
+    if len(args.queries) == 1:
+        batches = [searcher.search(args.queries[0], args.collection, args.limit)]
+    else:
+        batches = searcher.search_batch(args.queries, args.collection, args.limit)
+    for query, results in zip(args.queries, batches):
+        _print_results(query, results, args.json)
+
+def serve_command(args):
+    import metrics
+    from query_server import serve
+    metrics.configure_from_env()
+    serve(args.host, args.port, args.socket, args.collection or "github_docs", args.target_dir, args.docs_dir)
+
+def index_command(args):
+    import rag_github_docs_main
+    sys.argv = [f"{sys.argv[0]} index", *args.options]
+    rag_github_docs_main.main()
+
+def main():
+    parser = argparse.ArgumentParser(prog="docrag", description="Index documentation and search it")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    index_parser = subparsers.add_parser("index", help="Index the documentation and chat with it",
+                                         add_help=False)
+    index_parser.add_argument("options", nargs=argparse.REMAINDER,
+                              help="Options of rag_github_docs_main.py")
+    index_parser.set_defaults(func=index_command)
+
+    def add_collection_options(subparser):
+        subparser.add_argument("--collection", help="Collection to search (default: github_docs)")
+        subparser.add_argument("--target-dir", default="docs/src",
+                               help="Clone of the default collection, next to which its index state is kept")
+        subparser.add_argument("--docs-dir", default="package_docs",
+                               help="Directory of the package repositories indexed with --requirements")
+
+    serve_parser = subparsers.add_parser("serve", help="Serve search over HTTP with warm clients and caches")
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=8765)
+    serve_parser.add_argument("--socket", metavar="PATH", help="Listen on this unix socket instead of a port")
+    add_collection_options(serve_parser)
+    serve_parser.set_defaults(func=serve_command)
+
+    search_parser = subparsers.add_parser("search", help="Search the documentation; several queries are batched")
+    search_parser.add_argument("queries", nargs="+", metavar="QUERY")
+    search_parser.add_argument("--limit", type=int, default=5)
+    search_parser.add_argument("--server", help='Running `docrag serve` to query, "host:port" or "unix:<path>" '
+                                                '(default: DOCRAG_SERVER, else search in this process)')
+    search_parser.add_argument("--json", action="store_true", help="Print one JSON object per query")
+    add_collection_options(search_parser)
+    search_parser.set_defaults(func=search_command)
+
+    args = parser.parse_args()
+    # Library modules log; show their messages without decoration, on stderr
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,28 @@
+import os
 import re
+import time
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
+from token_counter import make_token_counter
+from lexical_index import chunk_terms
+from near_duplicates import text_minhash
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+CODE_BLOCK_RE = re.compile(r'```[\s\S]*?```')
+INLINE_CODE_RE = re.compile(r'`[^`\n]+`')
+LINK_RE = re.compile(r'\[([^\]]+)\]\([^\)]+\)')
+SPECIAL_CHARS = str.maketrans('', '', '#*_~')
+
+HEADING_RE = re.compile(r'^ {0,3}(#{1,6})[ \t]+(.*?)(?:[ \t]+#+)?[ \t]*$')
+FENCE_RE = re.compile(r'^ {0,3}(```|~~~)')
+
+# "reference" runs the original regex passes, "fast" produces identical output
+DEFAULT_MODE = os.getenv("DOCRAG_MARKDOWN_MODE", "fast")
+# "headings" packs sections to a token budget, "words" is the original character-based splitter
+DEFAULT_CHUNKER = os.getenv("DOCRAG_CHUNKER", "headings")
+DEFAULT_CHUNK_TOKENS = int(os.getenv("DOCRAG_CHUNK_TOKENS", "512"))
+DEFAULT_CHUNK_OVERLAP = int(os.getenv("DOCRAG_CHUNK_OVERLAP", "0"))
 
 def clean_markdown(content):
     # Remove code blocks
@@ -31,28 +54,306 @@ def split_into_chunks(content, chunk_size=1000):
     
     return chunks
 
-def process_markdown_file(file_path):
-    with open(file_path, 'r', encoding='utf-8') as file:
-        content = file.read()
-    
-    cleaned_content = clean_markdown(content)
-    chunks = split_into_chunks(cleaned_content)
-    
+def clean_markdown_fast(content):
+    """Same output as `clean_markdown`, skipping passes that cannot match.
+
+    Each pass keeps its original order, since removing code can create new
+    link or inline code matches; only passes whose marker characters are
+    absent are skipped, and special characters are dropped with str.translate.
+    """
+    if '`' in content:
+        if '```' in content:
+            content = CODE_BLOCK_RE.sub('', content)
+        if '`' in content:
+            content = INLINE_CODE_RE.sub('', content)
+    if '](' in content:
+        content = LINK_RE.sub(r'\1', content)
+    return content.translate(SPECIAL_CHARS)
+
+PROCESSING_MODES = {
+    'reference': (clean_markdown, split_into_chunks),
+    'fast': (clean_markdown_fast, split_into_chunks),
+}
+
+def split_markdown_sections(content: str) -> List[Tuple[List[str], List[str]]]:
+    """Split raw markdown into sections of (heading path, blocks).
+
+    Blocks are paragraphs separated by blank lines; a fenced code block is
+    kept as one block and `#` lines inside it are not treated as headings.
+    """
+    sections = [([], [])]
+    path: List[Tuple[int, str]] = []
+    block: List[str] = []
+    fence = None
+
+    def end_block():
+        if block:
+            sections[-1][1].append('\n'.join(block))
+            block.clear()
+
+    for line in content.split('\n'):
+        fence_match = FENCE_RE.match(line)
+        if fence is not None:
+            block.append(line)
+            if fence_match and fence_match.group(1) == fence:
+                fence = None
+                end_block()
+            continue
+        if fence_match:
+            end_block()
+            fence = fence_match.group(1)
+            block.append(line)
+            continue
+        heading = HEADING_RE.match(line)
+        if heading:
+            end_block()
+            level = len(heading.group(1))
+            title = ' '.join(clean_markdown_fast(heading.group(2)).split())
+            path = [(l, t) for l, t in path if l < level] + [(level, title)]
+            sections.append(([t for _, t in path], [title] if title else []))
+        elif not line.strip():
+            end_block()
+        else:
+            block.append(line)
+    end_block()
+    return [section for section in sections if section[1]]
+
+def _split_oversized(text: str, tokens: int, target_tokens: int) -> List[str]:
+    """Split a block larger than the budget into roughly equal word windows"""
+    words = text.split()
+    per_piece = max(1, int(len(words) * target_tokens / tokens))
+    return [' '.join(words[i:i + per_piece]) for i in range(0, len(words), per_piece)]
+
+def _split_raw(raw: str, pieces: List[str]) -> List[str]:
+    """Split the raw markdown of an oversized block in proportion to its cleaned pieces,
+    so each piece is indexed with the terms of its own part of the block"""
+    words = raw.split()
+    sizes = [len(piece.split()) for piece in pieces]
+    total = sum(sizes) or 1
+    bounds, seen = [0], 0
+    for size in sizes:
+        seen += size
+        bounds.append(round(len(words) * seen / total))
+    return [' '.join(words[bounds[i]:bounds[i + 1]]) for i in range(len(pieces))]
+
+def chunk_markdown(content: str, target_tokens: int = DEFAULT_CHUNK_TOKENS, overlap_tokens: int = DEFAULT_CHUNK_OVERLAP,
+                   count_tokens: Optional[Callable[[str], int]] = None,
+                   timings: Optional[Dict[str, float]] = None) -> List[Dict]:
+    """Heading-aware chunker that packs cleaned paragraphs up to `target_tokens`.
+
+    Chunks never straddle a section unless the chunk so far is smaller than a
+    quarter of the budget, which keeps short sections from becoming tiny
+    chunks. For the same reason a fragment that small is not flushed before a
+    block that does not fit, but starts the next chunk, which may then exceed
+    the budget by less than a quarter; a small leftover at the end is folded
+    into the previous chunk when it fits.
+    With `overlap_tokens`, a chunk starts with the trailing blocks of
+    the previous chunk of the same section. Returns dicts with 'text',
+    'heading_path' (the path of the chunk's first section) and 'raw', the
+    uncleaned markdown of the chunk's blocks (code included) for the lexical index.
+    With `timings`, the seconds spent cleaning markdown are added to its 'clean' entry.
+    """
+    count_tokens = count_tokens or make_token_counter()
+    min_tokens = target_tokens // 4
+    chunks: List[Dict] = []
+    current: List[Tuple[str, int, str]] = []
+    current_tokens = 0
+    current_path: List[str] = []
+
+    chunk_tokens: List[int] = []
+    carried_count = 0
+    # Code-only blocks waiting for a text block to attach to
+    pending_raw: List[str] = []
+
+    def flush():
+        nonlocal current, current_tokens, carried_count
+        if current:
+            if current_tokens < min_tokens and chunks and chunk_tokens[-1] + current_tokens <= target_tokens:
+                # Fold a small trailing piece into the previous chunk instead of
+                # emitting a tiny one; overlap blocks are already in it
+                folded = current[carried_count:]
+                chunks[-1]['text'] += '\n\n' + '\n\n'.join(text for text, _, _ in folded)
+                chunks[-1]['raw'] += '\n\n' + '\n\n'.join(raw for _, _, raw in folded)
+                chunk_tokens[-1] += sum(tokens for _, tokens, _ in folded)
+            else:
+                chunks.append({
+                    'text': '\n\n'.join(text for text, _, _ in current),
+                    'heading_path': current_path,
+                    'raw': '\n\n'.join(raw for _, _, raw in current)
+                })
+                chunk_tokens.append(current_tokens)
+        current, current_tokens, carried_count = [], 0, 0
+
+    for heading_path, raw_blocks in split_markdown_sections(content):
+        if current and current_tokens >= min_tokens:
+            flush()
+        if not current:
+            current_path = heading_path
+        for raw_block in raw_blocks:
+            if timings is not None:
+                start = time.perf_counter()
+                text = ' '.join(clean_markdown_fast(raw_block).split())
+                timings['clean'] = timings.get('clean', 0.0) + time.perf_counter() - start
+            else:
+                text = ' '.join(clean_markdown_fast(raw_block).split())
+            if not text:
+                # Code blocks are not embedded, but stay in the raw text for the lexical index
+                if raw_block.strip():
+                    if current:
+                        last_text, last_tokens, last_raw = current[-1]
+                        current[-1] = (last_text, last_tokens, f"{last_raw}\n\n{raw_block}")
+                    else:
+                        pending_raw.append(raw_block)
+                continue
+            if pending_raw:
+                raw_block = '\n\n'.join([*pending_raw, raw_block])
+                pending_raw.clear()
+            tokens = count_tokens(text)
+            if tokens <= target_tokens:
+                pieces = [(text, tokens, raw_block)]
+            else:
+                texts = _split_oversized(text, tokens, target_tokens)
+                pieces = [
+                    (piece, count_tokens(piece), raw)
+                    for piece, raw in zip(texts, _split_raw(raw_block, texts))
+                ]
+            for piece, piece_tokens, raw in pieces:
+                if current_tokens >= min_tokens and current_tokens + piece_tokens > target_tokens:
+                    carried = []
+                    if overlap_tokens:
+                        carried_tokens = 0
+                        for block in reversed(current):
+                            if carried_tokens + block[1] > overlap_tokens:
+                                break
+                            carried.insert(0, block)
+                            carried_tokens += block[1]
+                    flush()
+                    current_path = heading_path
+                    current = carried
+                    current_tokens = sum(t for _, t, _ in carried)
+                    carried_count = len(carried)
+                current.append((piece, piece_tokens, raw))
+                current_tokens += piece_tokens
+    flush()
+    if pending_raw and chunks:
+        chunks[-1]['raw'] += '\n\n' + '\n\n'.join(pending_raw)
+    return chunks
+
+def chunker_signature(chunker: Optional[str] = None) -> str:
+    """Identifies the chunking configuration; changing it changes every chunk"""
+    chunker = chunker or DEFAULT_CHUNKER
+    if chunker == 'headings':
+        # v2: fenced code blocks are kept in the raw text of chunks for the lexical index
+        # v3: a fragment under the minimum size starts the next chunk instead of being its own
+        # v4: each piece of an oversized block is indexed with its own part of the raw block
+        return f"headings-v4:{DEFAULT_CHUNK_TOKENS}:{DEFAULT_CHUNK_OVERLAP}"
+    return "words:1000"
+
+def compute_hash(data: bytes) -> str:
+    """Content hash used for files and chunks"""
+    return hashlib.sha256(data).hexdigest()
+
+def process_markdown_file_with_manifest(file_path, mode: Optional[str] = None,
+                                        chunker: Optional[str] = None) -> Tuple[List[Dict], Dict]:
+    """Chunk a markdown file and build its manifest in a single pass.
+
+    The manifest holds the hash of the raw file bytes, the chunk count and the
+    hash of every chunk, so later stages never have to rebuild file content
+    from chunks to detect changes. Each chunk also carries its term
+    frequencies for the lexical index. The manifest's 'seconds' hold the time
+    spent reading, cleaning and chunking, for the caller to report: metrics
+    recorded in a worker process would be lost.
+    """
+    start = time.perf_counter()
+    with open(file_path, 'rb') as file:
+        raw = file.read()
+    # Same newline handling as opening the file in text mode
+    content = raw.decode('utf-8').replace('\r\n', '\n').replace('\r', '\n')
+    timings = {'read': time.perf_counter() - start, 'clean': 0.0}
+
+    start = time.perf_counter()
+    if (chunker or DEFAULT_CHUNKER) == 'headings':
+        sections = chunk_markdown(content, timings=timings)
+        chunks = [section['text'] for section in sections]
+        heading_paths = [section['heading_path'] for section in sections]
+        # Index the raw markdown, so identifiers in code stay searchable
+        raw_texts = [section['raw'] for section in sections]
+    else:
+        clean, split = PROCESSING_MODES[mode or DEFAULT_MODE]
+        cleaned_content = clean(content)
+        timings['clean'] = time.perf_counter() - start
+        chunks = split(cleaned_content)
+        heading_paths = [[] for _ in chunks]
+        raw_texts = chunks
+    # Chunking proper, without the cleaning inside it
+    timings['chunk'] = time.perf_counter() - start - timings['clean']
+
+    file_hash = compute_hash(raw)
+    chunk_hashes = [compute_hash(chunk.encode('utf-8')) for chunk in chunks]
+    manifest = {
+        'file_path': str(file_path),
+        'file_hash': file_hash,
+        'chunk_count': len(chunks),
+        'chunk_hashes': chunk_hashes,
+        'seconds': timings
+    }
+
     return [
         {
             'text': chunk,
             'metadata': {
                 'file_path': str(file_path),
-                'chunk_id': i
+                'chunk_id': i,
+                'file_hash': file_hash,
+                'chunk_hash': chunk_hashes[i],
+                'heading_path': heading_paths[i],
+                'terms': chunk_terms(raw_texts[i], heading_paths[i]),
+                'minhash': text_minhash(chunk)
             }
         }
         for i, chunk in enumerate(chunks)
-    ]
+    ], manifest
+
+def process_markdown_file(file_path, mode: Optional[str] = None):
+    chunks, _ = process_markdown_file_with_manifest(file_path, mode)
+    return chunks
 
-def process_all_markdown_files(markdown_files):
+def process_file_group(file_paths: List[str], mode: Optional[str] = None) -> List[Tuple[List[Dict], Dict]]:
+    """Process several files in one task, to amortize process pool overhead"""
+    return [process_markdown_file_with_manifest(Path(file_path), mode) for file_path in file_paths]
+
+def group_files(markdown_files: List[str], workers: int, files_per_task: Optional[int] = None) -> List[List[str]]:
+    """Split files into task groups, aiming at a few tasks per worker"""
+    if files_per_task is None:
+        files_per_task = max(1, min(64, len(markdown_files) // (workers * 4) or 1))
+    return [markdown_files[i:i + files_per_task] for i in range(0, len(markdown_files), files_per_task)]
+
+def iter_processed_files(markdown_files, workers: Optional[int] = None, files_per_task: Optional[int] = None,
+                         mode: Optional[str] = None) -> Iterator[Tuple[List[Dict], Dict]]:
+    """Yield (chunks, manifest) per file, in order, using a process pool when `workers` > 1"""
+    markdown_files = [str(f) for f in markdown_files]
+    workers = workers if workers is not None else (os.cpu_count() or 1)
+    if workers <= 1 or len(markdown_files) < 2:
+        for file_path in markdown_files:
+            yield process_markdown_file_with_manifest(Path(file_path), mode)
+        return
+    groups = group_files(markdown_files, workers, files_per_task)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for results in pool.map(process_file_group, groups, [mode] * len(groups)):
+            yield from results
+
+def process_markdown_files_with_manifests(markdown_files, workers: Optional[int] = 1,
+                                          mode: Optional[str] = None) -> Tuple[List[Dict], Dict[str, Dict]]:
+    """Chunk all files and return the chunks plus a file_path -> manifest map"""
     all_chunks = []
-    for file_path in markdown_files:
-        all_chunks.extend(process_markdown_file(Path(file_path)))
+    manifests = {}
+    for chunks, manifest in iter_processed_files(markdown_files, workers=workers, mode=mode):
+        all_chunks.extend(chunks)
+        manifests[manifest['file_path']] = manifest
+    return all_chunks, manifests
+
+def process_all_markdown_files(markdown_files, workers: Optional[int] = 1, mode: Optional[str] = None):
+    all_chunks, _ = process_markdown_files_with_manifests(markdown_files, workers=workers, mode=mode)
     return all_chunks
 
 if __name__ == "__main__":
@@ -0,0 +1,248 @@
+import os
+import sys
+import json
+import logging
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, IO, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Latency buckets in seconds, from a cache lookup to a long completion
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+PREFIX = "docrag_"
+
+HELP = {
+    'span_duration_seconds': "Duration of pipeline and query stages",
+    'span_errors_total': "Stages that ended with an exception",
+    'api_requests_total': "Requests sent to external APIs, by API and outcome",
+    'api_retries_total': "Retried API requests",
+    'api_tokens_total': "Tokens sent to external APIs",
+    'cache_lookups_total': "Cache lookups, by cache and result",
+    'points_upserted_total': "Points upserted into the vector store",
+    'points_deleted_total': "Points deleted from the vector store",
+    'files_indexed_total': "Markdown files chunked, by result",
+}
+
+Labels = Tuple[Tuple[str, str], ...]
+
+def _labels(labels: Dict) -> Labels:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+class _Histogram:
+    __slots__ = ('counts', 'sum', 'count')
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """Upper bucket bound below which `q` of the observations fall"""
+        target, seen = q * self.count, 0
+        for i, count in enumerate(self.counts[:-1]):
+            seen += count
+            if seen >= target:
+                return BUCKETS[i]
+        return float('inf')
+
+class MetricsRegistry:
+    """Counters and latency histograms kept in memory, optionally logged as JSON lines"""
+
+    def __init__(self, json_log: Optional[IO[str]] = None):
+        self.counters: Dict[Tuple[str, Labels], float] = {}
+        self.histograms: Dict[Tuple[str, Labels], _Histogram] = {}
+        self.json_log = json_log
+        self.lock = threading.Lock()
+
+    def incr(self, name: str, value: float = 1, labels: Labels = ()):
+        key = (name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name: str, seconds: float, labels: Labels = (), error: bool = False):
+        key = ('span_duration_seconds', (('span', name), *labels))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = _Histogram()
+            histogram.observe(seconds)
+            if error:
+                error_key = ('span_errors_total', (('span', name),))
+                self.counters[error_key] = self.counters.get(error_key, 0) + 1
+        if self.json_log is not None:
+            event = {'ts': round(time.time(), 6), 'event': 'span', 'span': name, 'seconds': round(seconds, 6),
+                     **dict(labels)}
+            if error:
+                event['error'] = True
+            line = json.dumps(event)
+            with self.lock:
+                self.json_log.write(line + '\n')
+                self.json_log.flush()
+
+    def snapshot(self) -> Dict:
+        """Counters and histogram summaries as plain data, e.g. for a JSON report"""
+        with self.lock:
+            counters = [{'name': name, 'labels': dict(labels), 'value': value}
+                        for (name, labels), value in sorted(self.counters.items())]
+            spans = [{
+                'labels': dict(labels), 'count': h.count, 'sum_seconds': round(h.sum, 6),
+                'mean_seconds': round(h.sum / h.count, 6) if h.count else 0.0,
+                'p50_seconds': h.quantile(0.5), 'p95_seconds': h.quantile(0.95), 'p99_seconds': h.quantile(0.99),
+            } for (_, labels), h in sorted(self.histograms.items())]
+        return {'counters': counters, 'spans': spans}
+
+    def render_prometheus(self) -> str:
+        """All metrics in the Prometheus text exposition format"""
+        lines: List[str] = []
+
+        def header(name: str, kind: str):
+            if name in HELP:
+                lines.append(f"# HELP {PREFIX}{name} {HELP[name]}")
+            lines.append(f"# TYPE {PREFIX}{name} {kind}")
+
+        def format_labels(labels, extra: Labels = ()) -> str:
+            pairs = [*labels, *extra]
+            if not pairs:
+                return ''
+            escaped = (value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+            return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(pairs, escaped)) + '}'
+
+        with self.lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted((key, (list(h.counts), h.sum, h.count)) for key, h in self.histograms.items())
+        previous = None
+        for (name, labels), value in counters:
+            if name != previous:
+                header(name, 'counter')
+                previous = name
+            lines.append(f"{PREFIX}{name}{format_labels(labels)} {value:g}")
+        previous = None
+        for (name, labels), (counts, total, count) in histograms:
+            if name != previous:
+                header(name, 'histogram')
+                previous = name
+            cumulative = 0
+            for bound, bucket_count in zip([*BUCKETS, float('inf')], counts):
+                cumulative += bucket_count
+                le = '+Inf' if bound == float('inf') else f"{bound:g}"
+                lines.append(f"{PREFIX}{name}_bucket{format_labels(labels, (('le', le),))} {cumulative}")
+            lines.append(f"{PREFIX}{name}_sum{format_labels(labels)} {total:.6f}")
+            lines.append(f"{PREFIX}{name}_count{format_labels(labels)} {count}")
+        return '\n'.join(lines) + '\n'
+
+class _Span:
+    __slots__ = ('registry', 'name', 'labels', 'start')
+
+    def __init__(self, registry: MetricsRegistry, name: str, labels: Labels):
+        self.registry = registry
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.registry.observe(self.name, time.perf_counter() - self.start, self.labels, error=exc_type is not None)
+        return False
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+_NULL_SPAN = _NullSpan()
+_registry: Optional[MetricsRegistry] = None
+
+def span(name: str, **labels):
+    """Context manager timing a stage into the `span_duration_seconds` histogram; free when metrics are off"""
+    registry = _registry
+    if registry is None:
+        return _NULL_SPAN
+    return _Span(registry, name, _labels(labels) if labels else ())
+
+def record(name: str, seconds: float, **labels):
+    """Record a stage duration measured elsewhere, e.g. in a worker process"""
+    registry = _registry
+    if registry is not None:
+        registry.observe(name, seconds, _labels(labels) if labels else ())
+
+def incr(name: str, value: float = 1, **labels):
+    registry = _registry
+    if registry is not None:
+        registry.incr(name, value, _labels(labels) if labels else ())
+
+def enabled() -> bool:
+    return _registry is not None
+
+def enable(json_log: Optional[IO[str]] = None) -> MetricsRegistry:
+    """Start collecting metrics; with `json_log`, every span is also written there as a JSON line"""
+    global _registry
+    _registry = MetricsRegistry(json_log)
+    return _registry
+
+def disable():
+    global _registry
+    _registry = None
+
+def snapshot() -> Dict:
+    return _registry.snapshot() if _registry is not None else {'counters': [], 'spans': []}
+
+def render_prometheus() -> str:
+    return _registry.render_prometheus() if _registry is not None else ''
+
+def start_prometheus_server(port: int, host: str = "0.0.0.0") -> ThreadingHTTPServer:
+    """Serve `render_prometheus()` at http://host:port/metrics from a daemon thread"""
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            data = render_prometheus().encode('utf-8')
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def configure_from_env():
+    """Enable metrics as configured by DOCRAG_METRICS ("on"), DOCRAG_METRICS_LOG (a path, or "-"
+    for stderr) and DOCRAG_METRICS_PORT (serve Prometheus metrics); metrics stay off otherwise"""
+    log_path = os.getenv("DOCRAG_METRICS_LOG")
+    port = os.getenv("DOCRAG_METRICS_PORT")
+    if os.getenv("DOCRAG_METRICS", "off").lower() in ("off", "0", "false", "") and not log_path and not port:
+        return
+    json_log = None
+    if log_path == "-":
+        json_log = sys.stderr
+    elif log_path:
+        json_log = open(log_path, 'a', buffering=1)
+    enable(json_log)
+    if port:
+        start_prometheus_server(int(port))
+        logger.info("Serving Prometheus metrics at http://localhost:%s/metrics", port)
@@ -0,0 +1,100 @@
+import os
+import asyncio
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from qdrant_client import QdrantClient
+
+from requirements_parser import parse_requirements
+from doc_finder import DiscoveryCache, normalize_package_name, package_collection_name, resolve_package_docs
+from github_docs_extractor import clone_docs_repo
+from index_state import IndexState, get_state_path
+from embedding_providers import EmbeddingProvider, get_embedding_provider
+from repo_indexer import index_repository, index_site
+
+@dataclass
+class PackageResult:
+    name: str
+    collection_name: Optional[str] = None
+    doc_type: Optional[str] = None
+    url: Optional[str] = None
+    status: str = "pending"
+    files_indexed: int = 0
+    error: Optional[str] = None
+
+async def ingest_requirements(requirements_path: str, base_dir: str, qdrant_client: QdrantClient,
+                              discovery_concurrency: int = 16, clone_concurrency: int = 8,
+                              index_concurrency: int = 2,
+                              embedding_provider: Optional[EmbeddingProvider] = None,
+                              discovery_cache: Optional[DiscoveryCache] = None,
+                              resume: bool = False, rebuild: bool = False) -> List[PackageResult]:
+    """Index the documentation of every package in a requirements file.
+
+    Packages are resolved concurrently, their repositories cloned or
+    updated (or their documentation sites crawled) `clone_concurrency` at a
+    time, checking out only their docs directories (`clone_docs_repo`), and
+    each package is indexed into
+    its own collection (`docs_<name>`) with its own index state next to its
+    clone, so later runs only re-index packages whose docs changed. Up to
+    `index_concurrency` packages are indexed at once; they share one
+    embedding provider and with it one rate limit. With `resume`, each
+    package's unfinished run is completed first. With `rebuild`, collections
+    embedded with another provider or model are rebuilt instead of failing.
+    """
+    packages = [p for p in parse_requirements(requirements_path) if normalize_package_name(p['name'])]
+    print(f"Resolving documentation for {len(packages)} packages...")
+    cache = discovery_cache if discovery_cache is not None else DiscoveryCache()
+    discovered = await resolve_package_docs(packages, concurrency=discovery_concurrency, cache=cache)
+
+    provider = embedding_provider or get_embedding_provider()
+    workers = max(1, (os.cpu_count() or 1) // index_concurrency)
+    clone_semaphore = asyncio.Semaphore(clone_concurrency)
+    index_semaphore = asyncio.Semaphore(index_concurrency)
+    loop = asyncio.get_running_loop()
+    results: Dict[str, PackageResult] = {}
+
+    async def ingest(package_info: Dict):
+        name = normalize_package_name(package_info['name'])
+        result = results[name] = PackageResult(name)
+        docs = discovered.get(package_info['name'])
+        if docs is None:
+            result.status = "not found"
+            return
+        result.doc_type, result.url = docs['type'], docs['url']
+        repo_dir = os.path.join(base_dir, name)
+        result.collection_name = package_collection_name(name)
+        state = IndexState(get_state_path(repo_dir))
+        try:
+            if docs['type'] == 'github':
+                async with clone_semaphore:
+                    # git runs as a subprocess, so clones proceed in parallel on the thread pool
+                    docs_paths = await loop.run_in_executor(None, clone_docs_repo, docs['url'], repo_dir)
+                async with index_semaphore:
+                    stats = await index_repository(qdrant_client, result.collection_name, state, docs['url'],
+                                                   repo_dir, docs_paths, embedding_provider=provider,
+                                                   workers=workers, resume=resume, rebuild=rebuild)
+            else:
+                # Crawling is I/O bound like cloning; embedding is bounded by the index slots
+                async with clone_semaphore, index_semaphore:
+                    stats = await index_site(qdrant_client, result.collection_name, state, docs['url'],
+                                             repo_dir, embedding_provider=provider, workers=workers,
+                                             resume=resume, rebuild=rebuild)
+        except Exception as e:
+            result.status, result.error = "failed", str(e)
+            print(f"Failed to index {name}: {e}")
+            return
+        result.status = "indexed" if stats is not None else "up to date"
+        result.files_indexed = stats.files_indexed if stats is not None else 0
+
+    os.makedirs(base_dir, exist_ok=True)
+    await asyncio.gather(*(ingest(package_info) for package_info in packages))
+
+    ordered = [results[normalize_package_name(p['name'])] for p in packages]
+    print(f"\nIngested {len(ordered)} packages:")
+    for result in ordered:
+        detail = f" ({result.files_indexed} files)" if result.files_indexed else ""
+        target = f" -> {result.collection_name}" if result.collection_name else ""
+        print(f"- {result.name}: {result.status}{detail}{target}")
+        if result.error:
+            print(f"    {result.error}")
+    return ordered
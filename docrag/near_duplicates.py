@@ -0,0 +1,68 @@
+import hashlib
+from functools import lru_cache
+from typing import List, Sequence
+
+# A dependency of qdrant-client, so always present where chunks are indexed
+import numpy as np
+
+from lexical_index import tokenize
+
+# Words per shingle: near-duplicate texts share most of their 3-word sequences,
+# merely related chunks share words but few sequences
+SHINGLE_WORDS = 3
+# Hash functions per signature; the Jaccard estimate is within ~0.05 of the truth
+NUM_PERMUTATIONS = 64
+# Texts whose estimated shingle Jaccard similarity reaches this are near-duplicates
+NEAR_DUPLICATE_SIMILARITY = 0.8
+
+_rng = np.random.default_rng(0x5eed)
+# Multiply-add hash family over the 64-bit shingle hashes (odd multipliers, arithmetic mod 2**64)
+_MULTIPLIERS = _rng.integers(1, 2 ** 63, size=NUM_PERMUTATIONS, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+_OFFSETS = _rng.integers(0, 2 ** 63, size=NUM_PERMUTATIONS, dtype=np.uint64)
+
+# Odd constant that mixes the token hashes of a shingle into one hash
+_SHINGLE_MIX = np.uint64(0x9E3779B97F4A7C15)
+
+@lru_cache(maxsize=1 << 16)
+def _token_hash(token: str) -> bytes:
+    return hashlib.blake2b(token.encode('utf-8'), digest_size=8).digest()
+
+def text_minhash(text: str) -> str:
+    """b-bit MinHash of a text's word shingles: the low byte of each of the 64 minima, as hex.
+
+    Computed at chunk time and kept in the chunk payload (128 characters), so
+    near-duplicate results can be told apart without their texts.
+    """
+    tokens = tokenize(text) or ['']
+    words = np.frombuffer(b''.join(_token_hash(token) for token in tokens), dtype='<u8')
+    count = len(words) - SHINGLE_WORDS + 1
+    if count > 0:
+        # Hash of each run of SHINGLE_WORDS tokens, combined from the token hashes (arithmetic mod 2**64)
+        shingles = words[:count]
+        for offset in range(1, SHINGLE_WORDS):
+            shingles = shingles * _SHINGLE_MIX + words[offset:offset + count]
+        words = np.unique(shingles)
+    minima = (words[None, :] * _MULTIPLIERS[:, None] + _OFFSETS[:, None]).min(axis=1)
+    return (minima & np.uint64(0xFF)).astype(np.uint8).tobytes().hex()
+
+def minhash_similarity(a: str, b: str) -> float:
+    """Estimated Jaccard similarity of the shingle sets behind two signatures"""
+    matches = np.count_nonzero(np.frombuffer(bytes.fromhex(a), np.uint8) == np.frombuffer(bytes.fromhex(b), np.uint8))
+    # One byte of two different minima still matches one time in 256
+    return max(0.0, (matches / NUM_PERMUTATIONS - 1 / 256) / (1 - 1 / 256))
+
+def result_minhash(result) -> str:
+    """Signature of a search result: from its payload, or computed for points indexed without one"""
+    payload = result.payload or {}
+    return payload.get('minhash') or text_minhash(payload.get('text', ''))
+
+def collapse_near_duplicates(results: Sequence, threshold: float = NEAR_DUPLICATE_SIMILARITY) -> List:
+    """Keep the best-ranked result of every group of near-identical texts, in rank order"""
+    kept, signatures = [], []
+    for result in results:
+        signature = result_minhash(result)
+        if any(minhash_similarity(signature, other) >= threshold for other in signatures):
+            continue
+        kept.append(result)
+        signatures.append(signature)
+    return kept
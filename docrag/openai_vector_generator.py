@@ -1,53 +1,73 @@
-import os
 import asyncio
-from openai import AsyncOpenAI
-from typing import List, Dict
-import time
+from functools import partial
+from typing import Callable, List, Dict, Optional, Tuple
 from tqdm import tqdm
+import metrics
+from chunk_batch import ChunkBatch
+from embedding_cache import get_default_cache
+from embedding_providers import EmbeddingProvider, get_embedding_provider
 
-# Initialize the OpenAI client
-client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-
-async def generate_embedding(text: str) -> List[float]:
-    try:
-        response = await client.embeddings.create(
-            input=text,
-            model="text-embedding-ada-002"
-        )
-        return response.data[0].embedding
-    except Exception as e:
-        if "Rate limit" in str(e):
-            print("Rate limit exceeded. Waiting for 20 seconds.")
-            await asyncio.sleep(20)
-            return await generate_embedding(text)
-        else:
-            print(f"An error occurred: {e}")
-            return []
-
-async def process_single_chunk(chunk: Dict) -> Dict:
-    embedding = await generate_embedding(chunk['text'])
-    if embedding:
-        return {
-            'text': chunk['text'],
-            'metadata': chunk['metadata'],
-            'vector': embedding
-        }
-    return None
-
-async def process_chunks(chunks: List[Dict]) -> List[Dict]:
-    # Process chunks in batches of 100 for better performance
-    batch_size = 100
-    processed_chunks = []
-    
-    with tqdm(total=len(chunks), desc="Generating embeddings") as pbar:
-        for i in range(0, len(chunks), batch_size):
-            batch = chunks[i:i + batch_size]
-            # Create tasks for the batch
-            tasks = [process_single_chunk(chunk) for chunk in batch]
-            # Process batch concurrently
-            results = await asyncio.gather(*tasks)
-            # Filter out None results and add to processed chunks
-            processed_chunks.extend([r for r in results if r is not None])
-            pbar.update(len(batch))
-    
-    return processed_chunks
\ No newline at end of file
+async def embed_chunks(chunks: List[Dict], provider: Optional[EmbeddingProvider] = None,
+                       progress: Optional[Callable[[int], None]] = None) -> Tuple[ChunkBatch, List[Dict]]:
+    """Embed chunks, returning (a ChunkBatch of the embedded chunks, chunks that ultimately failed).
+
+    Failed chunks carry the last error under 'error'. When a `progress`
+    callback is given it is used instead of a progress bar and nothing is printed.
+    """
+    provider = provider or get_embedding_provider()
+    cache = get_default_cache() if provider.cache_key is not None else None
+    hit_chunks, hit_vectors = [], []
+    # The cache is SQLite: keep its reads and writes off the event loop
+    loop = asyncio.get_running_loop()
+
+    # Serve already embedded texts from the cache
+    if cache is not None and chunks:
+        cached = await loop.run_in_executor(None, partial(
+            cache.get_many, provider.cache_key, [chunk['text'] for chunk in chunks], as_arrays=True
+        ))
+        misses = []
+        for chunk, vector in zip(chunks, cached):
+            if vector is None:
+                misses.append(chunk)
+            else:
+                hit_chunks.append(chunk)
+                hit_vectors.append(vector)
+        if hit_chunks and progress is None:
+            print(f"Embedding cache: {len(hit_chunks)} hits, {len(misses)} misses")
+        chunks = misses
+
+    if progress is not None:
+        progress(len(hit_chunks))
+        with metrics.span('embed', provider=provider.name):
+            result = await provider.embed([chunk['text'] for chunk in chunks], progress=progress)
+    else:
+        with tqdm(total=len(chunks), desc="Generating embeddings") as pbar, metrics.span('embed', provider=provider.name):
+            result = await provider.embed([chunk['text'] for chunk in chunks], progress=pbar.update)
+
+    embedded = [i for i in range(len(chunks)) if i in result.vectors]
+    failed = [
+        {'text': chunk['text'], 'metadata': chunk['metadata'], 'error': result.failed[i]}
+        for i, chunk in enumerate(chunks) if i in result.failed
+    ]
+    embedded_vectors = [result.vectors[i] for i in embedded]
+    if cache is not None and embedded:
+        await loop.run_in_executor(None, cache.put_many, provider.cache_key, [chunks[i]['text'] for i in embedded],
+                                   embedded_vectors)
+
+    if chunks and progress is None:
+        print(f"Embedding requests: {result.requests} ({result.retries} retries, {result.tokens} tokens)")
+    # One float32 matrix for the whole batch; the per-input rows are released with `result`
+    batch = ChunkBatch.from_rows(hit_chunks + [chunks[i] for i in embedded], hit_vectors + embedded_vectors)
+    return batch, failed
+
+def report_failed_chunks(failed: List[Dict]):
+    if not failed:
+        return
+    print(f"Failed to embed or upsert {len(failed)} chunks:")
+    for chunk in failed:
+        print(f"- {chunk['metadata']['file_path']} #{chunk['metadata']['chunk_id']}: {chunk['error']}")
+
+async def process_chunks(chunks: List[Dict]) -> ChunkBatch:
+    processed_chunks, failed = await embed_chunks(chunks)
+    report_failed_chunks(failed)
+    return processed_chunks
@@ -1,27 +1,292 @@
-from qdrant_client import QdrantClient
-from openai import OpenAI
-import os
-from typing import List
-
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+import time
+import asyncio
+from qdrant_client import QdrantClient, AsyncQdrantClient
+from qdrant_client.models import SearchRequest
+from typing import List, Optional, Sequence
+from embedding_cache import get_default_cache
+from embedding_providers import EmbeddingMismatch, embedding_mismatch, get_embedding_provider
+from index_state import IndexState, get_state_path
+from collection_profiles import get_collection_profile, search_params
+from lexical_index import bm25_search, identifier_term, reciprocal_rank_fusion
+from query_cache import QueryCache
+from result_diversity import MMR_CANDIDATES, diversify_results
+from vector_store import ScoredPoint, connect_vector_store
+import metrics
 
 def generate_query_embedding(query: str) -> List[float]:
-    response = client.embeddings.create(
-        input=query,
-        model="text-embedding-ada-002"
-    )
-    return response.data[0].embedding
-
-def search_qdrant(client: QdrantClient, collection_name: str, query: str, limit: int = 5):
-    query_vector = generate_query_embedding(query)
-    
-    search_result = client.search(
-        collection_name=collection_name,
-        query_vector=query_vector,
-        limit=limit
-    )
-    
-    return search_result
+    provider = get_embedding_provider()
+    cache = get_default_cache() if provider.cache_key is not None else None
+    if cache is not None:
+        vector = cache.get(provider.cache_key, query)
+        if vector is not None:
+            return vector
+
+    with metrics.span('query_embed', provider=provider.name):
+        vector = provider.embed_query(query)
+    if cache is not None:
+        cache.put(provider.cache_key, query, vector)
+    return vector
+
+async def async_generate_query_embedding(query: str) -> List[float]:
+    provider = get_embedding_provider()
+    cache = get_default_cache() if provider.cache_key is not None else None
+    # The embedding cache is on disk: read and write it on a worker thread
+    loop = asyncio.get_running_loop()
+    if cache is not None:
+        vector = await loop.run_in_executor(None, cache.get, provider.cache_key, query)
+        if vector is not None:
+            return vector
+
+    with metrics.span('query_embed', provider=provider.name):
+        vector = await provider.aembed_query(query)
+    if cache is not None:
+        await loop.run_in_executor(None, cache.put, provider.cache_key, query, vector)
+    return vector
+
+def generate_query_embeddings(queries: Sequence[str]) -> List[List[float]]:
+    """Embeddings of several queries, with one provider call for all those not in the embedding cache"""
+    provider = get_embedding_provider()
+    cache = get_default_cache() if provider.cache_key is not None else None
+    vectors = cache.get_many(provider.cache_key, queries) if cache is not None else [None] * len(queries)
+    missing = [i for i, vector in enumerate(vectors) if vector is None]
+    if missing:
+        texts = [queries[i] for i in missing]
+        with metrics.span('query_embed', provider=provider.name):
+            embedded = provider.embed_queries(texts)
+        for i, vector in zip(missing, embedded):
+            vectors[i] = vector
+        if cache is not None:
+            cache.put_many(provider.cache_key, texts, embedded)
+    return vectors
+
+# Lexical candidates fetched per requested result for rank fusion
+LEXICAL_CANDIDATES = 4
+
+def _lexical_hits(state: IndexState, collection_name: str, query: str, limit: int):
+    """BM25 hits, and whether they are a confident identifier match that needs no vector search"""
+    with metrics.span('lexical_search'):
+        term = identifier_term(query)
+        if term is not None:
+            hits = bm25_search(state, collection_name, query, limit, required_term=term)
+            if hits:
+                return hits, True
+        return bm25_search(state, collection_name, query, limit * LEXICAL_CANDIDATES), False
+
+def _lexical_results(hits, records) -> List[ScoredPoint]:
+    points = {str(record.id): record for record in records}
+    return [ScoredPoint(id=point_id, score=score, payload=points[point_id].payload, vector=points[point_id].vector)
+            for point_id, score in hits if point_id in points]
+
+def _fuse(vector_results, hits, limit: int):
+    """Reciprocal rank fusion of vector and lexical rankings; returns (fused, known points, IDs to fetch)"""
+    points = {str(result.id): result for result in vector_results}
+    fused = reciprocal_rank_fusion([list(points), [point_id for point_id, _ in hits]])[:limit]
+    missing = [point_id for point_id, _ in fused if point_id not in points]
+    return fused, points, missing
+
+def _fused_results(fused, points, records) -> List[ScoredPoint]:
+    points.update((str(record.id), record) for record in records)
+    return [ScoredPoint(id=point_id, score=score, payload=points[point_id].payload, vector=points[point_id].vector)
+            for point_id, score in fused if point_id in points]
+
+def _results_filter(hybrid: bool, query_filter, mmr_lambda: Optional[float]):
+    """What besides the query and limit the cached results depend on"""
+    key = ('hybrid',) if hybrid else query_filter
+    return key if mmr_lambda is None else (key, 'mmr', mmr_lambda)
+
+def check_query_provider(state: Optional[IndexState], collection_name: str):
+    """Refuse to search a collection embedded with another provider, model or dimension"""
+    if state is None:
+        return
+    mismatch = embedding_mismatch(state.get_collection_info(collection_name), get_embedding_provider())
+    if mismatch:
+        raise EmbeddingMismatch(f"Cannot search collection '{collection_name}': it was {mismatch}.")
+
+def search_qdrant(client: QdrantClient, collection_name: str, query: str, limit: int = 5,
+                  query_filter=None, cache: Optional[QueryCache] = None, state: Optional[IndexState] = None,
+                  mmr_lambda: Optional[float] = None):
+    """Vector search, or hybrid search when `state` holds the collection's lexical postings.
+
+    Hybrid search fuses BM25 and vector rankings with reciprocal rank fusion.
+    A query that is a single code identifier found in the lexical index is
+    answered from the lexical index alone, without embedding the query.
+    Filtered queries always use vector search only.
+
+    With `mmr_lambda`, `MMR_CANDIDATES` times as many results are fetched
+    with their vectors and `diversify_results` picks `limit` of them:
+    near-duplicates are collapsed and maximal marginal relevance trades
+    relevance (weight `mmr_lambda`) against similarity to the results
+    already picked.
+
+    With `state`, a collection recorded with another embedding provider,
+    model or dimension than the configured one raises `EmbeddingMismatch`.
+    """
+    check_query_provider(state, collection_name)
+    hybrid = state is not None and query_filter is None
+    diverse = mmr_lambda is not None
+    fetch = limit * MMR_CANDIDATES if diverse else limit
+
+    def candidates():
+        if hybrid:
+            hits, exact = _lexical_hits(state, collection_name, query, fetch)
+            if exact:
+                return _lexical_results(hits, client.retrieve(
+                    collection_name=collection_name, ids=[point_id for point_id, _ in hits], with_payload=True,
+                    with_vectors=diverse
+                ))
+
+        if cache is not None:
+            query_vector = cache.get_vector(query, generate_query_embedding)
+        else:
+            query_vector = generate_query_embedding(query)
+
+        with metrics.span('vector_search'):
+            results = client.search(
+                collection_name=collection_name,
+                query_vector=query_vector,
+                query_filter=query_filter,
+                search_params=search_params(get_collection_profile()),
+                limit=fetch,
+                with_vectors=diverse
+            )
+        if not hybrid or not hits:
+            return results
+        fused, points, missing = _fuse(results, hits, fetch)
+        records = client.retrieve(collection_name=collection_name, ids=missing, with_payload=True,
+                                  with_vectors=diverse) if missing else []
+        return _fused_results(fused, points, records)
+
+    def run_search():
+        results = candidates()
+        return diversify_results(results, limit, mmr_lambda) if diverse else results
+
+    with metrics.span('search', mode='hybrid' if hybrid else 'vector'):
+        if cache is None:
+            return run_search()
+        return cache.get_results(collection_name, query, limit, _results_filter(hybrid, query_filter, mmr_lambda),
+                                 run_search)
+
+async def async_search_qdrant(client: AsyncQdrantClient, collection_name: str, query: str, limit: int = 5,
+                              query_filter=None, cache: Optional[QueryCache] = None,
+                              state: Optional[IndexState] = None, mmr_lambda: Optional[float] = None):
+    """Non-blocking `search_qdrant` for use with an AsyncQdrantClient"""
+    await asyncio.get_running_loop().run_in_executor(None, check_query_provider, state, collection_name)
+    hybrid = state is not None and query_filter is None
+    diverse = mmr_lambda is not None
+    fetch = limit * MMR_CANDIDATES if diverse else limit
+
+    async def candidates():
+        if hybrid:
+            # BM25 runs on SQLite: keep it off the event loop
+            hits, exact = await asyncio.get_running_loop().run_in_executor(
+                None, _lexical_hits, state, collection_name, query, fetch
+            )
+            if exact:
+                return _lexical_results(hits, await client.retrieve(
+                    collection_name=collection_name, ids=[point_id for point_id, _ in hits], with_payload=True,
+                    with_vectors=diverse
+                ))
+
+        if cache is not None:
+            query_vector = await cache.aget_vector(query, async_generate_query_embedding)
+        else:
+            query_vector = await async_generate_query_embedding(query)
+
+        with metrics.span('vector_search'):
+            results = await client.search(
+                collection_name=collection_name,
+                query_vector=query_vector,
+                query_filter=query_filter,
+                search_params=search_params(get_collection_profile()),
+                limit=fetch,
+                with_vectors=diverse
+            )
+        if not hybrid or not hits:
+            return results
+        fused, points, missing = _fuse(results, hits, fetch)
+        records = await client.retrieve(collection_name=collection_name, ids=missing, with_payload=True,
+                                        with_vectors=diverse) if missing else []
+        return _fused_results(fused, points, records)
+
+    async def run_search():
+        results = await candidates()
+        return diversify_results(results, limit, mmr_lambda) if diverse else results
+
+    with metrics.span('search', mode='hybrid' if hybrid else 'vector'):
+        if cache is None:
+            return await run_search()
+        return await cache.aget_results(collection_name, query, limit,
+                                        _results_filter(hybrid, query_filter, mmr_lambda), run_search)
+
+def search_qdrant_batch(client: QdrantClient, collection_name: str, queries: Sequence[str], limit: int = 5,
+                        cache: Optional[QueryCache] = None, state: Optional[IndexState] = None) -> List[List]:
+    """`search_qdrant` for several queries at once, returning one result list per query.
+
+    Queries that are not cached are embedded with a single embedding call and
+    searched with a single `search_batch` request; the payloads that fusion
+    and identifier matches need are fetched with a single `retrieve`.
+    """
+    check_query_provider(state, collection_name)
+    hybrid = state is not None
+    cache_filter = ('hybrid',) if hybrid else None
+    results: List = [None] * len(queries)
+    with metrics.span('search_batch', mode='hybrid' if hybrid else 'vector'):
+        pending = []
+        for i, query in enumerate(queries):
+            if cache is not None:
+                hit, cached = cache.lookup_results(collection_name, query, limit, cache_filter)
+                if hit:
+                    results[i] = cached
+                    continue
+            pending.append(i)
+        if not pending:
+            return results
+
+        start = time.perf_counter()
+        lexical, exact, vector_queries = {}, {}, []
+        for i in pending:
+            if hybrid:
+                hits, is_exact = _lexical_hits(state, collection_name, queries[i], limit)
+                if is_exact:
+                    exact[i] = hits
+                    continue
+                lexical[i] = hits
+            vector_queries.append(i)
+
+        vector_results = {}
+        if vector_queries:
+            texts = [queries[i] for i in vector_queries]
+            if cache is not None:
+                vectors = cache.get_vectors(texts, generate_query_embeddings)
+            else:
+                vectors = generate_query_embeddings(texts)
+            params = search_params(get_collection_profile())
+            requests = [SearchRequest(vector=vector, limit=limit, params=params, with_payload=True)
+                        for vector in vectors]
+            with metrics.span('vector_search'):
+                batch = client.search_batch(collection_name=collection_name, requests=requests)
+            vector_results = dict(zip(vector_queries, batch))
+
+        fusions, fetch = {}, {point_id for hits in exact.values() for point_id, _ in hits}
+        for i, hits in lexical.items():
+            if hits:
+                fusions[i] = _fuse(vector_results[i], hits, limit)
+                fetch.update(fusions[i][2])
+        records = client.retrieve(collection_name=collection_name, ids=list(fetch), with_payload=True) if fetch else []
+
+        for i in pending:
+            if i in exact:
+                results[i] = _lexical_results(exact[i], records)
+            elif i in fusions:
+                fused, points, _ = fusions[i]
+                results[i] = _fused_results(fused, points, records)
+            else:
+                results[i] = vector_results[i]
+        if cache is not None:
+            elapsed = (time.perf_counter() - start) / len(pending)
+            for i in pending:
+                cache.store_results(collection_name, queries[i], limit, cache_filter, results[i], elapsed)
+    return results
 
 def display_results(results):
     for result in results:
@@ -32,13 +297,17 @@ def display_results(results):
         print("---")
 
 if __name__ == "__main__":
-    qdrant_client = QdrantClient("localhost", port=6333)
+    qdrant_client = connect_vector_store()
     collection_name = "github_docs"
+    state = IndexState(get_state_path("docs/src"))
+    query_cache = QueryCache(version_source=state.get_version)
 
     while True:
         query = input("Enter your query (or 'quit' to exit): ")
         if query.lower() == 'quit':
             break
         
-        results = search_qdrant(qdrant_client, collection_name, query)
-        display_results(results)
\ No newline at end of file
+        results = search_qdrant(qdrant_client, collection_name, query, cache=query_cache, state=state)
+        display_results(results)
+
+    print(query_cache.report())
\ No newline at end of file
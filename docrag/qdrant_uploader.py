@@ -1,47 +1,96 @@
 from qdrant_client import QdrantClient
-from qdrant_client.models import Distance, VectorParams, PointStruct, Filter, FieldCondition, MatchValue
-from typing import List, Dict, Set
-from tqdm import tqdm
+from qdrant_client.models import (
+    PointIdsList, Filter, FieldCondition, MatchAny, OptimizersConfigDiff, SetPayload, SetPayloadOperation, DeleteOperation
+)
+from typing import List, Dict, Iterable, Set, Optional, Tuple
+import os
+import time
 import hashlib
+import uuid
+import metrics
+from index_state import IndexState
+from chunk_batch import ChunkBatch
+from lexical_index import chunk_terms
+from collection_profiles import CollectionProfile, get_collection_profile, create_collection_params, ensure_payload_indexes
 
-def get_file_hash(file_path: str, content: str) -> str:
-    """Generate a hash for a file's content"""
-    return hashlib.md5(content.encode()).hexdigest()
+def scroll_all_points(client: QdrantClient, collection_name: str, limit: int = 256):
+    """Yield every point of a collection (payload only), following the scroll cursor"""
+    offset = None
+    while True:
+        points, offset = client.scroll(
+            collection_name=collection_name,
+            limit=limit,
+            offset=offset,
+            with_payload=True,
+            with_vectors=False
+        )
+        yield from points
+        if offset is None:
+            break
 
 def get_existing_file_hashes(client: QdrantClient, collection_name: str) -> Dict[str, str]:
-    """Retrieve existing file hashes from Qdrant"""
+    """Retrieve existing file hashes from Qdrant by scrolling the whole collection.
+
+    This is O(collection size); the indexer reads hashes from `IndexState`
+    instead and only `reconcile_index_state` needs the full scan.
+    """
     try:
-        # Scroll through all points to get unique file paths and their hashes
         file_hashes = {}
-        offset = 0
-        limit = 100
-        
-        while True:
-            results = client.scroll(
-                collection_name=collection_name,
-                scroll_filter=Filter(),
-                limit=limit,
-                offset=offset
-            )[0]
-            
-            if not results:
-                break
-                
-            for point in results:
-                file_path = point.payload.get('file_path')
-                file_hash = point.payload.get('file_hash')
-                if file_path and file_hash:
-                    file_hashes[file_path] = file_hash
-            
-            offset += limit
-            
+        for point in scroll_all_points(client, collection_name):
+            file_path = point.payload.get('file_path')
+            file_hash = point.payload.get('file_hash')
+            if file_path and file_hash:
+                file_hashes[file_path] = file_hash
         return file_hashes
     except Exception as e:
         print(f"Error getting existing file hashes: {e}")
         return {}
 
-def setup_qdrant_collection(client: QdrantClient, collection_name: str, vector_size: int):
-    """Set up or verify Qdrant collection"""
+def reconcile_index_state(client: QdrantClient, collection_name: str, state: IndexState, repair: bool = False) -> Dict[str, List[str]]:
+    """Compare the local index state with what is actually stored in Qdrant.
+
+    Returns the files whose points are missing from Qdrant, the files Qdrant
+    has points for that the state does not know about, and the files whose
+    hash or point IDs disagree. With `repair=True` the state of the collection,
+    including its lexical postings, is rebuilt from the Qdrant payloads.
+    """
+    remote_files: Dict[str, Dict] = {}
+    for point in scroll_all_points(client, collection_name):
+        file_path = point.payload.get('file_path')
+        if not file_path:
+            continue
+        entry = remote_files.setdefault(file_path, {'file_hash': point.payload.get('file_hash'), 'points': [], 'texts': []})
+        entry['points'].append((str(point.id), file_path, point.payload.get('chunk_id', 0), point.payload.get('chunk_hash')))
+        entry['texts'].append((str(point.id), point.payload.get('text', ''), point.payload.get('heading_path') or []))
+
+    local_hashes = state.get_file_hashes(collection_name)
+    report = {
+        'missing_in_qdrant': sorted(set(local_hashes) - set(remote_files)),
+        'unknown_to_state': sorted(set(remote_files) - set(local_hashes)),
+        'mismatched': sorted(
+            f for f in set(local_hashes) & set(remote_files)
+            if local_hashes[f] != remote_files[f]['file_hash']
+            or set(state.get_point_ids(collection_name, f)) != {p[0] for p in remote_files[f]['points']}
+        )
+    }
+
+    if repair:
+        with state.transaction():
+            state.clear_collection(collection_name)
+            for file_path, entry in remote_files.items():
+                state.add_chunks(collection_name, entry['points'])
+                state.add_postings(collection_name, (
+                    (point_id, chunk_terms(text, heading_path)) for point_id, text, heading_path in entry['texts']
+                ))
+                if entry['file_hash']:
+                    state.set_file(collection_name, file_path, entry['file_hash'], len(entry['points']))
+
+    return report
+
+def setup_qdrant_collection(client: QdrantClient, collection_name: str, vector_size: int,
+                            profile: Optional[CollectionProfile] = None):
+    """Set up or verify Qdrant collection, creating it with the settings of `profile`"""
+    profile = profile or get_collection_profile()
     try:
         # Check if collection exists
         collections = client.get_collections().collections
@@ -50,113 +99,268 @@ def setup_qdrant_collection(client: QdrantClient, collection_name: str, vector_s
         if not exists:
             client.create_collection(
                 collection_name=collection_name,
-                vectors_config=VectorParams(size=vector_size, distance=Distance.COSINE),
+                **create_collection_params(profile, vector_size)
             )
+            ensure_payload_indexes(client, collection_name, profile)
     except Exception as e:
         print(f"Error setting up collection: {e}")
         # Recreate collection if there's an error
         client.recreate_collection(
             collection_name=collection_name,
-            vectors_config=VectorParams(size=vector_size, distance=Distance.COSINE),
+            **create_collection_params(profile, vector_size)
         )
+        ensure_payload_indexes(client, collection_name, profile)
 
-def delete_file_points(client: QdrantClient, collection_name: str, file_path: str):
-    """Delete all points for a specific file"""
-    try:
-        client.delete(
+# File paths matched by one coalesced delete
+DELETE_BATCH_FILES = 256
+
+def delete_files_points(client: QdrantClient, collection_name: str, file_paths: Iterable[str],
+                        wait: bool = True) -> List[str]:
+    """Delete all points of the given files with one filtered delete per `DELETE_BATCH_FILES` files.
+
+    Returns the files whose delete failed; their points may still be stored.
+    """
+    file_paths = list(file_paths)
+    failed: List[str] = []
+    for i in range(0, len(file_paths), DELETE_BATCH_FILES):
+        batch = file_paths[i:i + DELETE_BATCH_FILES]
+        try:
+            with metrics.span('delete'):
+                client.delete(
+                    collection_name=collection_name,
+                    points_selector=Filter(
+                        must=[
+                            FieldCondition(
+                                key="file_path",
+                                match=MatchAny(any=batch)
+                            )
+                        ]
+                    ),
+                    wait=wait
+                )
+        except Exception as e:
+            print(f"Error deleting points for {len(batch)} files: {e}")
+            failed.extend(batch)
+    return failed
+
+def delete_file_points(client: QdrantClient, collection_name: str, file_path: str) -> bool:
+    """Delete all points for a specific file; returns whether the delete succeeded"""
+    return not delete_files_points(client, collection_name, [file_path])
+
+def delete_indexed_files(client: QdrantClient, collection_name: str, file_paths: Iterable[str],
+                         state: Optional[IndexState] = None) -> List[str]:
+    """Delete the files' points with coalesced deletes and forget the files whose delete succeeded.
+
+    Files whose delete failed stay in the index state, so a later run (or
+    `find_removed_files`) retries them. Returns the files that were deleted.
+    """
+    file_paths = list(file_paths)
+    if not file_paths:
+        return []
+    failed = set(delete_files_points(client, collection_name, file_paths))
+    deleted = [f for f in file_paths if f not in failed]
+    if state is not None and deleted:
+        if metrics.enabled():
+            metrics.incr('points_deleted_total', sum(len(state.get_point_ids(collection_name, f)) for f in deleted))
+        with state.transaction():
+            for file_path in deleted:
+                state.delete_file(collection_name, file_path)
+    return deleted
+
+def delete_indexed_file(client: QdrantClient, collection_name: str, file_path: str,
+                        state: Optional[IndexState] = None) -> bool:
+    """Delete a file's points and, once that succeeded, forget it in the index state"""
+    return bool(delete_indexed_files(client, collection_name, [file_path], state))
+
+def find_removed_files(state: IndexState, collection_name: str) -> List[str]:
+    """Files the index state has chunks or a hash for that no longer exist on disk"""
+    return sorted(f for f in state.get_file_paths(collection_name) if not os.path.exists(f))
+
+def wait_for_collection(client: QdrantClient, collection_name: str, timeout: float = 30.0, interval: float = 0.5) -> bool:
+    """Wait until the collection has applied and indexed all writes (status green or grey).
+
+    Upserts during a run are sent with `wait=False`; this is the one barrier
+    at the end of it. Grey means optimizations are pending but will not start
+    before the next update, so there is nothing to wait for. Returns False
+    when `timeout` passed first; searches work meanwhile, only slower.
+    """
+    deadline = time.monotonic() + timeout
+    with metrics.span('wait_for_indexing'):
+        while True:
+            status = client.get_collection(collection_name=collection_name).status
+            status = str(getattr(status, 'value', status)).lower()
+            if status in ('green', 'grey'):
+                return True
+            if status == 'red':
+                raise RuntimeError(f"Collection {collection_name} failed to optimize")
+            if time.monotonic() >= deadline:
+                print(f"Collection {collection_name} is still indexing ({status}); searches may be slower until it is done.")
+                return False
+            time.sleep(interval)
+
+def vacuum_collection(client: QdrantClient, collection_name: str, state: IndexState) -> Dict[str, int]:
+    """Drop points that no live file accounts for, then let the collection reclaim their space.
+
+    Removes the points of indexed files that no longer exist on disk and
+    points the index state does not know about (e.g. left by an older
+    version). Then the optimizers are triggered, which in the local store
+    compacts the files, and the collection is waited on until it is green.
+    """
+    removed_files = delete_indexed_files(client, collection_name, find_removed_files(state, collection_name), state)
+
+    orphan_ids: List[str] = []
+    known_ids = state.get_collection_point_ids(collection_name)
+    # Without recorded chunks every point would look orphaned: rebuild the state with --reconcile --repair first
+    if known_ids:
+        offset = None
+        while True:
+            points, offset = client.scroll(collection_name=collection_name, limit=1024, offset=offset,
+                                           with_payload=False, with_vectors=False)
+            orphan_ids.extend(str(point.id) for point in points if str(point.id) not in known_ids)
+            if offset is None:
+                break
+        for i in range(0, len(orphan_ids), 1024):
+            client.delete(collection_name=collection_name, points_selector=PointIdsList(points=orphan_ids[i:i + 1024]))
+        metrics.incr('points_deleted_total', len(orphan_ids))
+
+    # An empty optimizers config re-runs the optimizers, which vacuum segments with many deleted points
+    client.update_collection(collection_name=collection_name, optimizers_config=OptimizersConfigDiff())
+    wait_for_collection(client, collection_name)
+    return {'removed_files': len(removed_files), 'orphan_points': len(orphan_ids),
+            'points': client.count(collection_name=collection_name).count}
+
+POINT_ID_NAMESPACE = uuid.UUID("6f1c8a52-3d4e-5b7a-9c2d-1e0f4a6b8c3d")
+
+def chunk_point_id(collection_name: str, file_path: str, chunk_hash: str, occurrence: int = 0) -> str:
+    """Content-derived point ID, stable across runs for an unchanged chunk"""
+    return str(uuid.uuid5(POINT_ID_NAMESPACE, f"{collection_name}\0{file_path}\0{chunk_hash}\0{occurrence}"))
+
+def assign_point_ids(collection_name: str, chunks: List[Dict]) -> List[Dict]:
+    """Set `metadata['point_id']` on every chunk.
+
+    Identical chunks within one file are told apart by their occurrence count,
+    so repeated boilerplate does not collapse into a single point.
+    """
+    occurrences: Dict[tuple, int] = {}
+    for chunk in chunks:
+        metadata = chunk['metadata']
+        if 'chunk_hash' not in metadata:
+            metadata['chunk_hash'] = hashlib.sha256(chunk['text'].encode('utf-8')).hexdigest()
+        key = (metadata['file_path'], metadata['chunk_hash'])
+        occurrence = occurrences.get(key, 0)
+        occurrences[key] = occurrence + 1
+        metadata['point_id'] = chunk_point_id(collection_name, metadata['file_path'], metadata['chunk_hash'], occurrence)
+    return chunks
+
+def plan_chunk_updates(state: IndexState, collection_name: str, chunks: List[Dict],
+                       file_paths: Set[str]) -> Tuple[List[Dict], List[Dict], Dict[str, List[str]]]:
+    """Split the current chunks of changed files by what is already indexed.
+
+    Returns the chunks that need embedding, the chunks whose point already
+    exists and the point IDs per file that are no longer part of the file.
+    """
+    assign_point_ids(collection_name, chunks)
+    existing = {file_path: state.get_file_chunks(collection_name, file_path) for file_path in file_paths}
+    current_ids: Dict[str, Set[str]] = {file_path: set() for file_path in file_paths}
+    new_chunks, retained_chunks = [], []
+    for chunk in chunks:
+        file_path = chunk['metadata']['file_path']
+        point_id = chunk['metadata']['point_id']
+        current_ids.setdefault(file_path, set()).add(point_id)
+        if point_id in existing.get(file_path, {}):
+            retained_chunks.append(chunk)
+        else:
+            new_chunks.append(chunk)
+    stale_point_ids = {
+        file_path: [point_id for point_id in existing[file_path] if point_id not in current_ids[file_path]]
+        for file_path in file_paths
+    }
+    return new_chunks, retained_chunks, stale_point_ids
+
+def chunk_payload(chunk: Dict, file_hash: str) -> Dict:
+    return {
+        'text': chunk['text'],
+        'file_path': chunk['metadata']['file_path'],
+        'chunk_id': chunk['metadata']['chunk_id'],
+        'file_hash': file_hash,
+        'chunk_hash': chunk['metadata'].get('chunk_hash'),
+        'heading_path': chunk['metadata'].get('heading_path', []),
+        'minhash': chunk['metadata'].get('minhash')
+    }
+
+def upsert_chunk_batch(client: QdrantClient, collection_name: str, batch: ChunkBatch, file_hashes: Dict[str, str],
+                       wait: bool = True):
+    """Upsert embedded chunks under their point IDs; the batch's float32 matrix is passed to the client as is.
+
+    With `wait=False` the upsert returns once Qdrant has accepted it, before it
+    is applied; `wait_for_collection` waits for all such writes at once.
+    """
+    if not len(batch):
+        return
+    payloads = [
+        chunk_payload(chunk, file_hashes[chunk.metadata['file_path']]) for chunk in batch
+    ]
+    with metrics.span('upsert'):
+        client.upload_collection(
             collection_name=collection_name,
-            points_selector=Filter(
-                must=[
-                    FieldCondition(
-                        key="file_path",
-                        match=MatchValue(value=file_path)
-                    )
-                ]
-            )
+            vectors=batch.vectors,
+            payload=payloads,
+            ids=batch.point_ids,
+            batch_size=len(batch),
+            wait=wait
         )
-    except Exception as e:
-        print(f"Error deleting points for file {file_path}: {e}")
+    metrics.incr('points_upserted_total', len(batch))
 
-def upload_to_qdrant(client: QdrantClient, collection_name: str, chunks: List[Dict], batch_size: int = 100):
-    """Upload chunks to Qdrant with file versioning"""
-    if not chunks:
-        print("No chunks to upload")
-        return
+def refresh_file_points(client: QdrantClient, collection_name: str, file_hash: str, retained_chunks: List[Dict],
+                        stale_point_ids: List[str], known_chunk_ids: Dict[str, int]):
+    """Give kept points the new file hash (and their new `chunk_id` where it moved) and drop stale points.
 
-    total_chunks = len(chunks)
-    processed_files = set()
-    
-    # Get existing file hashes
-    existing_hashes = get_existing_file_hashes(client, collection_name)
-    
-    with tqdm(total=total_chunks, desc="Uploading to Qdrant") as pbar:
-        for i in range(0, total_chunks, batch_size):
-            batch = chunks[i:i + batch_size]
-            current_batch_points = []
-            
-            for idx, chunk in enumerate(batch):
-                file_path = chunk['metadata']['file_path']
-                
-                # Only process each file once
-                if file_path in processed_files:
-                    continue
-                
-                # Calculate hash for the current file content
-                file_content = '\n'.join(c['text'] for c in chunks if c['metadata']['file_path'] == file_path)
-                current_hash = get_file_hash(file_path, file_content)
-                
-                # Skip if file hasn't changed
-                if file_path in existing_hashes and existing_hashes[file_path] == current_hash:
-                    processed_files.add(file_path)
-                    continue
-                
-                # If file has changed or is new, delete old points and add new ones
-                if file_path not in processed_files:
-                    delete_file_points(client, collection_name, file_path)
-                    processed_files.add(file_path)
-                
-                current_batch_points.append(
-                    PointStruct(
-                        id=idx + i,
-                        vector=chunk['vector'],
-                        payload={
-                            'text': chunk['text'],
-                            'file_path': file_path,
-                            'chunk_id': chunk['metadata']['chunk_id'],
-                            'file_hash': current_hash
-                        }
-                    )
-                )
-            
-            if current_batch_points:
-                try:
-                    client.upsert(
-                        collection_name=collection_name,
-                        points=current_batch_points,
-                        wait=True
-                    )
-                except Exception as e:
-                    print(f"Error uploading batch {i//batch_size + 1}: {str(e)}")
-                    if batch_size > 10:
-                        print("Retrying with smaller batch size...")
-                        return upload_to_qdrant(client, collection_name, chunks, batch_size=batch_size//2)
-                    else:
-                        raise e
-            
-            pbar.update(len(batch))
-    
-    print(f"\nProcessed {len(processed_files)} files:")
-    print(f"- Skipped: {len([f for f in processed_files if f in existing_hashes and existing_hashes[f] == get_file_hash(f, ''.join(c['text'] for c in chunks if c['metadata']['file_path'] == f))])}")
-    print(f"- Updated/New: {len([f for f in processed_files if f not in existing_hashes or existing_hashes[f] != get_file_hash(f, ''.join(c['text'] for c in chunks if c['metadata']['file_path'] == f))])}")
-
-if __name__ == "__main__":
-    # Assume vectorized_chunks is the list from the previous script
-    vectorized_chunks = [...]  # List of chunks with embeddings
-
-    client = QdrantClient("localhost", port=6333)
-    collection_name = "github_docs"
-    vector_size = len(vectorized_chunks[0]['vector'])
-
-    setup_qdrant_collection(client, collection_name, vector_size)
-    upload_to_qdrant(client, collection_name, vectorized_chunks)
-    print(f"Uploaded {len(vectorized_chunks)} chunks to Qdrant collection '{collection_name}'")
\ No newline at end of file
+    All of it is one `batch_update_points` request; `known_chunk_ids` maps
+    point IDs to the chunk IDs they are stored with.
+    """
+    operations = []
+    unmoved = []
+    for chunk in retained_chunks:
+        point_id, chunk_id = chunk['metadata']['point_id'], chunk['metadata']['chunk_id']
+        if known_chunk_ids.get(point_id) == chunk_id:
+            unmoved.append(point_id)
+        else:
+            operations.append(SetPayloadOperation(set_payload=SetPayload(
+                payload={'file_hash': file_hash, 'chunk_id': chunk_id}, points=[point_id]
+            )))
+    if unmoved:
+        operations.append(SetPayloadOperation(set_payload=SetPayload(payload={'file_hash': file_hash}, points=unmoved)))
+    if stale_point_ids:
+        operations.append(DeleteOperation(delete=PointIdsList(points=stale_point_ids)))
+    if operations:
+        client.batch_update_points(collection_name=collection_name, update_operations=operations)
+    if stale_point_ids:
+        metrics.incr('points_deleted_total', len(stale_point_ids))
+
+def record_finalized_file(state: IndexState, collection_name: str, file_path: str, file_hash: str,
+                          retained_chunks: List[Dict], stale_point_ids: List[str], chunk_count: int):
+    """Record the kept chunks of a file, forget its stale ones and mark it indexed"""
+    with state.transaction():
+        state.add_chunks(collection_name, (
+            (c['metadata']['point_id'], file_path, c['metadata']['chunk_id'], c['metadata']['chunk_hash'])
+            for c in retained_chunks
+        ))
+        # Kept chunks get fresh postings: the terms of the same text change with the chunker
+        state.delete_postings(collection_name, [c['metadata']['point_id'] for c in retained_chunks])
+        state.add_postings(collection_name, _chunk_postings(retained_chunks))
+        state.delete_chunks(collection_name, stale_point_ids)
+        state.set_file(collection_name, file_path, file_hash, chunk_count)
+
+def _chunk_postings(chunks: List[Dict]):
+    return (
+        (c['metadata']['point_id'], c['metadata'].get('terms') or chunk_terms(c['text'], c['metadata'].get('heading_path', [])))
+        for c in chunks
+    )
+
+def record_upserted_chunks(state: IndexState, collection_name: str, chunks: List[Dict]):
+    with state.transaction():
+        state.add_chunks(collection_name, (
+            (c['metadata']['point_id'], c['metadata']['file_path'], c['metadata']['chunk_id'], c['metadata']['chunk_hash'])
+            for c in chunks
+        ))
+        state.add_postings(collection_name, _chunk_postings(chunks))
@@ -0,0 +1,180 @@
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+import metrics
+
+def normalize_query(query: str) -> str:
+    return ' '.join(query.split()).casefold()
+
+class QueryCache:
+    """In-process cache for the query path of `search_qdrant`.
+
+    Holds an LRU of normalized query text -> embedding and a short-TTL cache
+    of (collection, query, limit, filter) -> search results. Results are
+    tagged with the collection version from `version_source` (e.g.
+    `IndexState.get_version`) and dropped as soon as the indexer bumps it;
+    the version is re-read at most every `version_check_interval` seconds.
+    """
+
+    def __init__(self, max_queries: int = 10_000, max_results: int = 2_000, result_ttl: float = 300.0,
+                 version_source: Optional[Callable[[str], int]] = None, version_check_interval: float = 1.0):
+        self.max_queries = max_queries
+        self.max_results = max_results
+        self.result_ttl = result_ttl
+        self.version_source = version_source
+        self.version_check_interval = version_check_interval
+        self._vectors: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._results: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._versions: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+        self.stats = {
+            'vector_hits': 0, 'vector_misses': 0,
+            'result_hits': 0, 'result_misses': 0,
+            'invalidations': 0, 'embed_seconds': 0.0, 'search_seconds': 0.0, 'saved_seconds': 0.0
+        }
+
+    def collection_version(self, collection_name: str) -> Optional[int]:
+        if self.version_source is None:
+            return None
+        now = time.monotonic()
+        cached = self._versions.get(collection_name)
+        if cached is not None and now - cached[1] < self.version_check_interval:
+            return cached[0]
+        version = self.version_source(collection_name)
+        if cached is not None and cached[0] != version:
+            self.invalidate(collection_name)
+        self._versions[collection_name] = (version, now)
+        return version
+
+    def invalidate(self, collection_name: Optional[str] = None):
+        """Drop cached results, for one collection or all of them"""
+        with self._lock:
+            if collection_name is None:
+                self._results.clear()
+            else:
+                for key in [k for k in self._results if k[0] == collection_name]:
+                    del self._results[key]
+            self.stats['invalidations'] += 1
+
+    def _average(self, total_key: str, misses_key: str) -> float:
+        misses = self.stats[misses_key]
+        return self.stats[total_key] / misses if misses else 0.0
+
+    def _cached_vector(self, key: str) -> Optional[List[float]]:
+        with self._lock:
+            vector = self._vectors.get(key)
+            if vector is not None:
+                self._vectors.move_to_end(key)
+                self.stats['vector_hits'] += 1
+                self.stats['saved_seconds'] += self._average('embed_seconds', 'vector_misses')
+        metrics.incr('cache_lookups_total', cache='query_vector', result='hit' if vector is not None else 'miss')
+        return vector
+
+    def _store_vector(self, key: str, vector: List[float], elapsed: float):
+        with self._lock:
+            self.stats['vector_misses'] += 1
+            self.stats['embed_seconds'] += elapsed
+            self._vectors[key] = vector
+            while len(self._vectors) > self.max_queries:
+                self._vectors.popitem(last=False)
+
+    def _results_key(self, collection_name: str, query: str, limit: int, query_filter: Any) -> Hashable:
+        return (collection_name, normalize_query(query), limit, repr(query_filter))
+
+    def _cached_results(self, key: Hashable, version: Optional[int]) -> Optional[tuple]:
+        with self._lock:
+            entry = self._results.get(key)
+            if entry is not None and entry[0] > time.monotonic() and entry[1] == version:
+                self._results.move_to_end(key)
+                self.stats['result_hits'] += 1
+                self.stats['saved_seconds'] += self._average('search_seconds', 'result_misses')
+            else:
+                entry = None
+        metrics.incr('cache_lookups_total', cache='query_results', result='hit' if entry is not None else 'miss')
+        return entry
+
+    def _store_results(self, key: Hashable, version: Optional[int], results: Any, elapsed: float):
+        with self._lock:
+            self.stats['result_misses'] += 1
+            self.stats['search_seconds'] += elapsed
+            self._results[key] = (time.monotonic() + self.result_ttl, version, results)
+            while len(self._results) > self.max_results:
+                self._results.popitem(last=False)
+
+    def get_vector(self, query: str, embed: Callable[[str], List[float]]) -> List[float]:
+        key = normalize_query(query)
+        vector = self._cached_vector(key)
+        if vector is None:
+            start = time.perf_counter()
+            vector = embed(query)
+            self._store_vector(key, vector, time.perf_counter() - start)
+        return vector
+
+    async def aget_vector(self, query: str, embed: Callable[[str], Awaitable[List[float]]]) -> List[float]:
+        key = normalize_query(query)
+        vector = self._cached_vector(key)
+        if vector is None:
+            start = time.perf_counter()
+            vector = await embed(query)
+            self._store_vector(key, vector, time.perf_counter() - start)
+        return vector
+
+    def get_vectors(self, queries: List[str], embed_many: Callable[[List[str]], List[List[float]]]) -> List[List[float]]:
+        """Vectors for several queries, embedding all the uncached ones with a single `embed_many` call"""
+        keys = [normalize_query(query) for query in queries]
+        vectors = {key: self._cached_vector(key) for key in keys}
+        missing = {key: query for key, query in zip(keys, queries) if vectors[key] is None}
+        if missing:
+            start = time.perf_counter()
+            embedded = embed_many(list(missing.values()))
+            elapsed = (time.perf_counter() - start) / len(missing)
+            for key, vector in zip(missing, embedded):
+                self._store_vector(key, vector, elapsed)
+                vectors[key] = vector
+        return [vectors[key] for key in keys]
+
+    def lookup_results(self, collection_name: str, query: str, limit: int, query_filter: Any) -> Tuple[bool, Any]:
+        """(hit, results) for a query, for callers that run their searches in batches"""
+        key = self._results_key(collection_name, query, limit, query_filter)
+        entry = self._cached_results(key, self.collection_version(collection_name))
+        return (True, entry[2]) if entry is not None else (False, None)
+
+    def store_results(self, collection_name: str, query: str, limit: int, query_filter: Any, results: Any,
+                      elapsed: float):
+        key = self._results_key(collection_name, query, limit, query_filter)
+        self._store_results(key, self.collection_version(collection_name), results, elapsed)
+
+    def get_results(self, collection_name: str, query: str, limit: int, query_filter: Any,
+                    search: Callable[[], Any]) -> Any:
+        """Return cached results for the query, or run `search` and cache what it returns"""
+        version = self.collection_version(collection_name)
+        key = self._results_key(collection_name, query, limit, query_filter)
+        entry = self._cached_results(key, version)
+        if entry is not None:
+            return entry[2]
+        start = time.perf_counter()
+        results = search()
+        self._store_results(key, version, results, time.perf_counter() - start)
+        return results
+
+    async def aget_results(self, collection_name: str, query: str, limit: int, query_filter: Any,
+                           search: Callable[[], Awaitable[Any]]) -> Any:
+        version = self.collection_version(collection_name)
+        key = self._results_key(collection_name, query, limit, query_filter)
+        entry = self._cached_results(key, version)
+        if entry is not None:
+            return entry[2]
+        start = time.perf_counter()
+        results = await search()
+        self._store_results(key, version, results, time.perf_counter() - start)
+        return results
+
+    def report(self) -> Dict[str, float]:
+        """Counters plus hit rates"""
+        report = dict(self.stats)
+        for kind in ('vector', 'result'):
+            lookups = report[f'{kind}_hits'] + report[f'{kind}_misses']
+            report[f'{kind}_hit_rate'] = report[f'{kind}_hits'] / lookups if lookups else 0.0
+        return report
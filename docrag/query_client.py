@@ -0,0 +1,56 @@
+import json
+import socket
+import http.client
+from typing import Dict, List, Optional
+from urllib.parse import urlsplit
+
+# Only the standard library, so a lookup through a running server starts in milliseconds
+DEFAULT_PORT = 8765
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, socket_path: str, timeout: float):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+class QueryClient:
+    """Client of a `docrag serve` process at "http://host:port", "host:port" or "unix:<socket path>"."""
+
+    def __init__(self, server: str, timeout: float = 30.0):
+        self.server = server
+        self.timeout = timeout
+
+    def _connection(self) -> http.client.HTTPConnection:
+        if self.server.startswith("unix:"):
+            return _UnixHTTPConnection(self.server[len("unix:"):], self.timeout)
+        parts = urlsplit(self.server if "://" in self.server else f"http://{self.server}")
+        return http.client.HTTPConnection(parts.hostname or "localhost", parts.port or DEFAULT_PORT,
+                                          timeout=self.timeout)
+
+    def _request(self, method: str, path: str, body: Optional[Dict] = None) -> Dict:
+        connection = self._connection()
+        try:
+            data = json.dumps(body).encode('utf-8') if body is not None else None
+            headers = {"Content-Type": "application/json"} if data is not None else {}
+            connection.request(method, path, body=data, headers=headers)
+            response = connection.getresponse()
+            payload = json.loads(response.read() or b'{}')
+        finally:
+            connection.close()
+        if response.status != 200:
+            raise RuntimeError(f"{self.server}{path} returned {response.status}: {payload.get('error')}")
+        return payload
+
+    def health(self) -> Dict:
+        return self._request("GET", "/health")
+
+    def search(self, query: str, collection: Optional[str] = None, limit: int = 5) -> List[Dict]:
+        return self._request("POST", "/search", {'query': query, 'collection': collection, 'limit': limit})['results']
+
+    def search_batch(self, queries: List[str], collection: Optional[str] = None, limit: int = 5) -> List[List[Dict]]:
+        body = {'queries': queries, 'collection': collection, 'limit': limit}
+        return self._request("POST", "/search/batch", body)['results']
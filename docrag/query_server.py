@@ -0,0 +1,192 @@
+import os
+import json
+import logging
+import threading
+import socketserver
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+import metrics
+from index_state import IndexState, get_state_path
+from doc_finder import package_collection_name
+from embedding_providers import get_embedding_provider
+from query_cache import QueryCache
+from qdrant_query_interface import search_qdrant, search_qdrant_batch
+from query_client import DEFAULT_PORT
+from vector_store import connect_vector_store
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_COLLECTION = "github_docs"
+# Queries accepted in one batch request
+MAX_BATCH_QUERIES = 256
+MAX_LIMIT = 100
+
+class QueryService:
+    """Warm query path shared by every request of a `docrag serve` process.
+
+    Holds one vector store client, one embedding provider (and with it one
+    pooled OpenAI client), one QueryCache and one IndexState per collection,
+    so a request pays for none of their setup.
+    """
+
+    def __init__(self, client=None, default_collection: str = DEFAULT_COLLECTION, target_dir: str = "docs/src",
+                 docs_dir: str = "package_docs", cache: Optional[QueryCache] = None):
+        self.client = client if client is not None else connect_vector_store()
+        self.default_collection = default_collection
+        self.target_dir = target_dir
+        self.docs_dir = docs_dir
+        self.provider = get_embedding_provider()
+        self.states: Dict[str, Optional[IndexState]] = {}
+        self.states_lock = threading.Lock()
+        self.cache = cache or QueryCache(version_source=self._collection_version)
+
+    def _state_path(self, collection_name: str) -> Optional[str]:
+        if collection_name == self.default_collection:
+            return get_state_path(self.target_dir)
+        if os.path.isdir(self.docs_dir):
+            for name in os.listdir(self.docs_dir):
+                if package_collection_name(name) == collection_name:
+                    return get_state_path(os.path.join(self.docs_dir, name))
+        return None
+
+    def state_for(self, collection_name: str) -> Optional[IndexState]:
+        """Index state holding the collection's lexical postings, or None for vector-only search"""
+        with self.states_lock:
+            if collection_name not in self.states:
+                path = self._state_path(collection_name)
+                self.states[collection_name] = IndexState(path) if path and os.path.exists(path) else None
+            return self.states[collection_name]
+
+    def _collection_version(self, collection_name: str) -> int:
+        state = self.state_for(collection_name)
+        return state.get_version(collection_name) if state is not None else 0
+
+    def warm(self):
+        """Open the vector store connection and the default collection's state before the first request"""
+        self.client.get_collections()
+        self.state_for(self.default_collection)
+
+    def search(self, query: str, collection_name: Optional[str] = None, limit: int = 5) -> List[Dict]:
+        collection_name = collection_name or self.default_collection
+        results = search_qdrant(self.client, collection_name, query, limit=limit, cache=self.cache,
+                                state=self.state_for(collection_name))
+        return [_result_dict(result) for result in results]
+
+    def search_batch(self, queries: List[str], collection_name: Optional[str] = None,
+                     limit: int = 5) -> List[List[Dict]]:
+        collection_name = collection_name or self.default_collection
+        batches = search_qdrant_batch(self.client, collection_name, queries, limit=limit, cache=self.cache,
+                                      state=self.state_for(collection_name))
+        return [[_result_dict(result) for result in results] for results in batches]
+
+def _result_dict(result) -> Dict:
+    return {'id': str(result.id), 'score': result.score, 'payload': result.payload}
+
+class BadRequest(ValueError):
+    pass
+
+def _limit(body: Dict) -> int:
+    limit = body.get('limit', 5)
+    if not isinstance(limit, int) or not 1 <= limit <= MAX_LIMIT:
+        raise BadRequest(f"'limit' must be an integer between 1 and {MAX_LIMIT}")
+    return limit
+
+def _collection(body: Dict) -> Optional[str]:
+    collection = body.get('collection')
+    if collection is not None and not isinstance(collection, str):
+        raise BadRequest("'collection' must be a string")
+    return collection
+
+def make_handler(service: QueryService):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def address_string(self) -> str:
+            # Unix socket peers have no host address
+            return self.client_address[0] if isinstance(self.client_address, tuple) else "unix"
+
+        def _send(self, status: int, body, content_type: str = "application/json"):
+            data = body.encode('utf-8') if isinstance(body, str) else json.dumps(body).encode('utf-8')
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            path = self.path.split('?')[0]
+            if path == '/health':
+                self._send(200, {'status': 'ok', 'default_collection': service.default_collection,
+                                 'query_cache': service.cache.report()})
+            elif path == '/metrics':
+                self._send(200, metrics.render_prometheus(), "text/plain; version=0.0.4; charset=utf-8")
+            else:
+                self._send(404, {'error': f"unknown path {path}"})
+
+        def do_POST(self):
+            path = self.path.split('?')[0]
+            try:
+                length = int(self.headers.get('Content-Length') or 0)
+                body = json.loads(self.rfile.read(length) or b'{}')
+                if not isinstance(body, dict):
+                    raise BadRequest("expected a JSON object")
+                if path == '/search':
+                    query = body.get('query')
+                    if not isinstance(query, str) or not query.strip():
+                        raise BadRequest("'query' must be a non-empty string")
+                    results = service.search(query, _collection(body), _limit(body))
+                    self._send(200, {'results': results})
+                elif path == '/search/batch':
+                    queries = body.get('queries')
+                    if (not isinstance(queries, list) or not queries
+                            or not all(isinstance(q, str) and q.strip() for q in queries)):
+                        raise BadRequest("'queries' must be a non-empty list of non-empty strings")
+                    if len(queries) > MAX_BATCH_QUERIES:
+                        raise BadRequest(f"at most {MAX_BATCH_QUERIES} queries per batch")
+                    results = service.search_batch(queries, _collection(body), _limit(body))
+                    self._send(200, {'results': results})
+                else:
+                    self._send(404, {'error': f"unknown path {path}"})
+            except (BadRequest, json.JSONDecodeError) as e:
+                self._send(400, {'error': str(e)})
+            except Exception as e:
+                logger.exception("Error serving %s", path)
+                self._send(500, {'error': str(e)})
+
+    return Handler
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+def make_server(service: QueryService, host: str = "127.0.0.1", port: int = DEFAULT_PORT,
+                socket_path: Optional[str] = None):
+    """HTTP server for `service`, on a TCP port or, with `socket_path`, on a unix socket"""
+    handler = make_handler(service)
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        return UnixHTTPServer(socket_path, handler)
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+def serve(host: str = "127.0.0.1", port: int = DEFAULT_PORT, socket_path: Optional[str] = None,
+          collection_name: str = DEFAULT_COLLECTION, target_dir: str = "docs/src", docs_dir: str = "package_docs"):
+    """Run the query server until interrupted"""
+    service = QueryService(default_collection=collection_name, target_dir=target_dir, docs_dir=docs_dir)
+    service.warm()
+    server = make_server(service, host, port, socket_path)
+    where = f"unix:{socket_path}" if socket_path else f"http://{host}:{port}"
+    logger.info("Serving %s search at %s (POST /search, POST /search/batch, GET /health)", collection_name, where)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if socket_path and os.path.exists(socket_path):
+            os.unlink(socket_path)
@@ -1,84 +1,111 @@
 import os
 import asyncio
-from openai import OpenAI
+import logging
+import argparse
 from qdrant_client import QdrantClient
 
 # Import functions from our previous scripts
-from github_docs_extractor import clone_or_pull_repo, find_markdown_files
-from markdown_processor import process_all_markdown_files
-from openai_vector_generator import process_chunks
-from qdrant_uploader import setup_qdrant_collection, upload_to_qdrant, get_file_hash, get_existing_file_hashes
+from embedding_providers import EmbeddingMismatch
+from github_docs_extractor import clone_or_pull_repo
+from index_state import IndexState, get_state_path
+from repo_indexer import index_repository
+from multi_ingest import ingest_requirements
+from qdrant_uploader import reconcile_index_state, vacuum_collection
 from qdrant_query_interface import search_qdrant, display_results
-from chat_interface import ChatInterface
+from chat_interface import AsyncChatInterface
+from query_cache import QueryCache
+from vector_store import connect_vector_store, connect_async_vector_store
+import metrics
 
-# Initialize the OpenAI client
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-
-async def async_main():
-    # Step 1: Clone or update repository and find markdown files
+async def async_main(args):
+    # Step 1: Clone or update repository and find changed markdown files
     repo_url = "https://github.com/microsoft/playwright"
     target_dir = "docs/src"
-    print("Cloning or updating repository and finding markdown files...")
-    clone_or_pull_repo(repo_url, target_dir)
-    markdown_files = find_markdown_files(target_dir)
-    print(f"Found {len(markdown_files)} markdown files.")
+    docs_paths = ["docs/src"]
+    collection_name = "github_docs"
+    state = IndexState(get_state_path(target_dir))
+    qdrant_client = connect_vector_store()
 
-    # Step 2: Process markdown files
-    print("Processing markdown files...")
-    processed_chunks = process_all_markdown_files(markdown_files)
-    print(f"Processed {len(processed_chunks)} chunks.")
+    if args.requirements:
+        await ingest_requirements(args.requirements, args.docs_dir, qdrant_client,
+                                  clone_concurrency=args.clone_concurrency,
+                                  index_concurrency=args.index_concurrency, resume=args.resume,
+                                  rebuild=args.rebuild)
+        return
 
-    # Step 3 & 4: Set up Qdrant first to check existing files
-    print("Setting up Qdrant...")
-    qdrant_client = QdrantClient("localhost", port=6333)
-    collection_name = "github_docs"
-    
-    # Get existing files from Qdrant
-    existing_hashes = get_existing_file_hashes(qdrant_client, collection_name)
-    
-    # Filter out chunks from unchanged files
-    files_to_process = set()
-    chunks_to_process = []
-    
-    for chunk in processed_chunks:
-        file_path = chunk['metadata']['file_path']
-        if file_path not in files_to_process:
-            file_content = '\n'.join(c['text'] for c in processed_chunks if c['metadata']['file_path'] == file_path)
-            current_hash = get_file_hash(file_path, file_content)
-            
-            if file_path not in existing_hashes or existing_hashes[file_path] != current_hash:
-                files_to_process.add(file_path)
-    
-    chunks_to_process = [chunk for chunk in processed_chunks if chunk['metadata']['file_path'] in files_to_process]
-    
-    if chunks_to_process:
-        print(f"Generating embeddings for {len(chunks_to_process)} chunks from {len(files_to_process)} modified/new files...")
-        vectorized_chunks = await process_chunks(chunks_to_process)
-        
-        # Initialize collection if it doesn't exist
-        if not existing_hashes:
-            vector_size = len(vectorized_chunks[0]["vector"])
-            setup_qdrant_collection(qdrant_client, collection_name, vector_size)
-        
-        # Upload new/modified vectors
-        upload_to_qdrant(qdrant_client, collection_name, vectorized_chunks)
-    else:
-        print("No new or modified files to process.")
+    if args.reconcile:
+        report = reconcile_index_state(qdrant_client, collection_name, state, repair=args.repair)
+        for key, files in report.items():
+            print(f"{key}: {len(files)}")
+            for file_path in files:
+                print(f"  {file_path}")
+        return
+
+    if args.vacuum:
+        report = vacuum_collection(qdrant_client, collection_name, state)
+        print(f"Removed {report['removed_files']} missing files and {report['orphan_points']} orphaned points; "
+              f"{report['points']} points left.")
+        return
+
+    print("Cloning or updating repository and finding markdown files...")
+    clone_or_pull_repo(repo_url, target_dir, docs_paths=docs_paths)
+    await index_repository(qdrant_client, collection_name, state, repo_url, target_dir, docs_paths,
+                           resume=args.resume, rebuild=args.rebuild)
 
     # Step 5: Chat interface
     print("\nRAG system is ready. You can now chat with the documentation.")
-    chat_interface = ChatInterface(qdrant_client, collection_name)
-    
-    while True:
-        user_input = input("\nYou: ")
-        if user_input.lower() == "quit":
-            break
-            
-        response = chat_interface.chat(user_input)
-        print("\nAssistant:", response)
+    query_cache = QueryCache(version_source=state.get_version)
+    async_qdrant_client = connect_async_vector_store()
+    chat_interface = AsyncChatInterface(async_qdrant_client, collection_name, query_cache=query_cache,
+                                        state=state)
+    loop = asyncio.get_running_loop()
+
+    try:
+        while True:
+            # Read input on a worker thread so the event loop keeps running
+            user_input = await loop.run_in_executor(None, input, "\nYou: ")
+            if user_input.lower() == "quit":
+                print(f"Query cache: {query_cache.report()}")
+                break
+
+            first = True
+            async for part in chat_interface.chat_stream(user_input):
+                if first:
+                    print("\nAssistant: ", end="")
+                    first = False
+                print(part, end="", flush=True)
+            print()
+    finally:
+        await async_qdrant_client.close()
 
 def main():
-    asyncio.run(async_main())
+    parser = argparse.ArgumentParser(description="Index GitHub documentation and chat with it")
+    parser.add_argument("--reconcile", action="store_true",
+                        help="Compare the local index state with Qdrant and exit")
+    parser.add_argument("--repair", action="store_true",
+                        help="With --reconcile, rebuild the local index state from Qdrant")
+    parser.add_argument("--vacuum", action="store_true",
+                        help="Remove points of deleted files and unknown points, compact the collection and exit")
+    parser.add_argument("--resume", action="store_true",
+                        help="First finish the last indexing run if it was interrupted or left chunks failed")
+    parser.add_argument("--rebuild", action="store_true",
+                        help="Rebuild collections embedded with another provider, model or dimension than configured")
+    parser.add_argument("--requirements", metavar="PATH",
+                        help="Index the documentation of every package in a requirements file and exit")
+    parser.add_argument("--docs-dir", default="package_docs",
+                        help="With --requirements, directory for the package repositories")
+    parser.add_argument("--clone-concurrency", type=int, default=8,
+                        help="With --requirements, repositories cloned or updated at once")
+    parser.add_argument("--index-concurrency", type=int, default=2,
+                        help="With --requirements, packages indexed at once")
+    args = parser.parse_args()
+    # Library modules log; show their messages without decoration, on stderr
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    metrics.configure_from_env()
+    try:
+        asyncio.run(async_main(args))
+    except EmbeddingMismatch as e:
+        parser.exit(1, f"{e}\n")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,234 @@
+import os
+import asyncio
+from typing import Dict, List, Optional
+
+from qdrant_client import QdrantClient
+
+from github_docs_extractor import find_markdown_files, get_head_commit, get_changed_markdown_files
+from index_state import IndexState
+from collection_profiles import get_collection_profile, apply_collection_profile
+from embedding_providers import EmbeddingMismatch, EmbeddingProvider, get_embedding_provider, embedding_mismatch
+from ingest_pipeline import PipelineStats, run_ingest_pipeline
+from markdown_processor import chunker_signature, compute_hash
+from qdrant_uploader import find_removed_files
+from site_crawler import SiteCrawler
+
+def run_settings(provider: EmbeddingProvider) -> str:
+    """What a run's chunks depend on; a run is only resumed with the same settings"""
+    return f"{chunker_signature()};{provider.name}:{provider.model}"
+
+async def index_markdown_files(qdrant_client: QdrantClient, collection_name: str, state: IndexState,
+                               markdown_files, deleted_files, reindex_all: bool = False,
+                               embedding_provider: Optional[EmbeddingProvider] = None,
+                               workers: Optional[int] = None, target: Optional[str] = None,
+                               run_id: Optional[int] = None) -> PipelineStats:
+    """Chunk, embed and upload `markdown_files`, and drop points of `deleted_files`.
+
+    The work is journaled as a run in `state` (`target` names the commit or
+    URL being indexed); pass the `run_id` of an unfinished run to continue it.
+    """
+    provider = embedding_provider or get_embedding_provider()
+    if run_id is None:
+        run_id = state.start_run(collection_name, [str(f) for f in markdown_files], deleted_files, reindex_all,
+                                 target, run_settings(provider))
+
+    def record_model():
+        with state.transaction():
+            state.set_collection_info(collection_name, qdrant_profile=get_collection_profile().signature(),
+                                      **provider.signature())
+
+    print("Processing markdown files...")
+    stats = await run_ingest_pipeline(qdrant_client, collection_name, state, markdown_files, deleted_files,
+                                      embedding_provider=provider, workers=workers, reindex_all=reindex_all,
+                                      on_collection_ready=record_model, run_id=run_id)
+    with state.transaction():
+        state.set_collection_info(collection_name, chunker=chunker_signature())
+    state.finish_run(run_id, 'incomplete' if stats.files_incomplete else 'complete')
+    if stats.files_incomplete:
+        print(f"{stats.files_incomplete} files could not be fully indexed or deleted; "
+              f"they are journaled and retried with --resume.")
+    return stats
+
+async def resume_run(qdrant_client: QdrantClient, collection_name: str, state: IndexState,
+                     provider: EmbeddingProvider, workers: Optional[int] = None) -> Optional[Dict]:
+    """Continue the collection's last run if it was interrupted or left files incomplete.
+
+    Only the files the run had not finished go through the pipeline again,
+    and of those only the chunks that were not upserted yet are embedded.
+    Returns the resumed run, or None when there was nothing to resume.
+    """
+    run = state.get_resumable_run(collection_name)
+    if run is None:
+        print(f"No unfinished run of '{collection_name}' to resume.")
+        return None
+    if run['settings'] != run_settings(provider):
+        print(f"Not resuming the last run of '{collection_name}': the chunker or embedding model changed since.")
+        return None
+    markdown_files, deleted_files = state.get_run_files(run['run_id'])
+    # Files removed since then are dropped by the run that follows
+    markdown_files = [f for f in markdown_files if os.path.exists(f)]
+    failures = state.get_run_failures(run['run_id'])
+    print(f"Resuming the {run['status']} run of '{collection_name}': {len(markdown_files)} files to index, "
+          f"{len(deleted_files)} to delete, {len(failures)} failed chunks to retry.")
+    await index_markdown_files(qdrant_client, collection_name, state, markdown_files, deleted_files,
+                               run['reindex_all'], embedding_provider=provider, workers=workers,
+                               run_id=run['run_id'])
+    return run
+
+def migrate_collection_profile(qdrant_client: QdrantClient, collection_name: str, state: IndexState, info):
+    """Bring an existing collection to the configured profile (payload indexes, quantization, on-disk storage)"""
+    profile = get_collection_profile()
+    if not info or info.get('qdrant_profile') == profile.signature():
+        return
+    if not any(c.name == collection_name for c in qdrant_client.get_collections().collections):
+        return
+    print(f"Applying collection profile '{profile.name}' to '{collection_name}'...")
+    apply_collection_profile(qdrant_client, collection_name, profile)
+    with state.transaction():
+        state.set_collection_info(collection_name, qdrant_profile=profile.signature())
+
+def prepare_collection(qdrant_client: QdrantClient, collection_name: str, state: IndexState,
+                       provider: EmbeddingProvider, info: Dict, rebuild: bool = False) -> bool:
+    """Rebuild or migrate a collection before indexing; returns whether every file must be re-chunked.
+
+    A collection embedded with another provider, model or dimension is only
+    deleted and rebuilt with `rebuild`; otherwise `EmbeddingMismatch` is
+    raised, since the cause is as likely a missing or mistyped setting.
+    """
+    # A different chunker changes every chunk, so everything is re-chunked.
+    # Collections indexed before the chunker was recorded used the word splitter.
+    recorded_chunker = info.get('chunker') or (chunker_signature('words') if info.get('last_commit') else None)
+    reindex_all = recorded_chunker is not None and recorded_chunker != chunker_signature()
+    # Collections indexed before the lexical index existed are re-chunked once to fill it in;
+    # their embeddings are kept
+    if state.count_chunks(collection_name) and not state.get_lexical_stats(collection_name)[0]:
+        reindex_all = True
+
+    # Vectors from another provider, model or dimension cannot share a collection; only rebuild when asked to
+    mismatch = embedding_mismatch(info, provider)
+    if mismatch and not rebuild:
+        raise EmbeddingMismatch(
+            f"Collection '{collection_name}' was {mismatch}. Configure the provider and model it was built with "
+            f"(DOCRAG_EMBEDDING_PROVIDER, DOCRAG_EMBEDDING_MODEL), or rebuild it with --rebuild."
+        )
+    if mismatch:
+        print(f"Collection '{collection_name}' was {mismatch}; rebuilding it.")
+        qdrant_client.delete_collection(collection_name=collection_name)
+        with state.transaction():
+            state.clear_collection(collection_name)
+        reindex_all = True
+    else:
+        migrate_collection_profile(qdrant_client, collection_name, state, info)
+    return reindex_all
+
+async def index_repository(qdrant_client: QdrantClient, collection_name: str, state: IndexState,
+                           repo_url: str, repo_dir: str, docs_paths: Optional[List[str]] = None,
+                           embedding_provider: Optional[EmbeddingProvider] = None,
+                           workers: Optional[int] = None, resume: bool = False,
+                           rebuild: bool = False) -> Optional[PipelineStats]:
+    """Bring a collection up to date with an already cloned or updated repository.
+
+    Only markdown files changed since the last indexed commit are processed.
+    Everything is re-chunked when the chunker changed or the lexical index
+    is missing. A collection embedded with another provider, model or
+    dimension raises `EmbeddingMismatch`, or is rebuilt with `rebuild`. With
+    `resume`, an unfinished run is first completed. Returns None when
+    nothing had to be done.
+    """
+    provider = embedding_provider or get_embedding_provider()
+    # git, the directory walk and Qdrant's collection calls block: keep them off the event loop
+    loop = asyncio.get_running_loop()
+    head_commit = await loop.run_in_executor(None, get_head_commit, repo_dir)
+    if resume:
+        run = await resume_run(qdrant_client, collection_name, state, provider, workers)
+        if run is not None and run['target']:
+            # Continue from the commit the run indexed
+            with state.transaction():
+                state.set_last_commit(collection_name, run['target'], repo_url=repo_url)
+    elif state.get_resumable_run(collection_name):
+        print(f"The last run of '{collection_name}' did not finish; use --resume to continue it.")
+    info = state.get_collection_info(collection_name) or {}
+    last_commit = info.get('last_commit')
+    reindex_all = await loop.run_in_executor(None, prepare_collection, qdrant_client, collection_name, state,
+                                             provider, info, rebuild)
+
+    if last_commit == head_commit and not reindex_all:
+        print(f"Collection '{collection_name}' is already indexed at {head_commit[:12]}.")
+        return None
+
+    changes = None
+    if last_commit and not reindex_all:
+        changes = await loop.run_in_executor(None, get_changed_markdown_files, repo_dir, last_commit, head_commit,
+                                             docs_paths)
+    if changes is None:
+        markdown_files = await loop.run_in_executor(None, find_markdown_files, repo_dir, docs_paths)
+        deleted_files = []
+        print(f"{collection_name}: found {len(markdown_files)} markdown files.")
+    else:
+        markdown_files = [f for f in changes['changed'] if os.path.exists(f)]
+        deleted_files = changes['deleted']
+        print(f"{collection_name}: {last_commit[:12]}..{head_commit[:12]}: "
+              f"{len(markdown_files)} changed, {len(deleted_files)} deleted markdown files.")
+    # Files removed outside the diffed range (e.g. by a full re-scan or an interrupted run) are collected too
+    known_deleted = set(deleted_files)
+    removed = [f for f in await loop.run_in_executor(None, find_removed_files, state, collection_name)
+               if f not in known_deleted]
+    if removed:
+        print(f"{collection_name}: removing {len(removed)} indexed files that no longer exist.")
+        deleted_files = [*deleted_files, *removed]
+
+    stats = await index_markdown_files(qdrant_client, collection_name, state, markdown_files, deleted_files,
+                                       reindex_all, embedding_provider=provider, workers=workers,
+                                       target=head_commit)
+    with state.transaction():
+        state.set_last_commit(collection_name, head_commit, repo_url=repo_url)
+    return stats
+
+async def index_site(qdrant_client: QdrantClient, collection_name: str, state: IndexState,
+                     site_url: str, site_dir: str, embedding_provider: Optional[EmbeddingProvider] = None,
+                     workers: Optional[int] = None, resume: bool = False, rebuild: bool = False,
+                     **crawl_options) -> Optional[PipelineStats]:
+    """Crawl an HTML documentation site into `site_dir` and bring a collection up to date with it.
+
+    Unchanged pages are answered with 304 and never re-downloaded; of the
+    mirrored markdown files only those whose content differs from what was
+    indexed go through the pipeline. With `resume`, an unfinished run is first
+    completed; `rebuild` is as for `index_repository`. Returns None when
+    nothing had to be done.
+    """
+    provider = embedding_provider or get_embedding_provider()
+    if resume:
+        await resume_run(qdrant_client, collection_name, state, provider, workers)
+    elif state.get_resumable_run(collection_name):
+        print(f"The last run of '{collection_name}' did not finish; use --resume to continue it.")
+    info = state.get_collection_info(collection_name) or {}
+    loop = asyncio.get_running_loop()
+    reindex_all = await loop.run_in_executor(None, prepare_collection, qdrant_client, collection_name, state,
+                                             provider, info, rebuild)
+
+    crawl = await SiteCrawler(site_url, site_dir, state, collection_name, **crawl_options).crawl()
+    print(f"{collection_name}: crawled {site_url}: {len(crawl.changed)} changed, {crawl.not_modified} not modified, "
+          f"{len(crawl.deleted)} removed, {len(crawl.failed)} failed pages.")
+
+    # Compare with the index state rather than with this crawl, so files left over
+    # by an interrupted run are picked up as well
+    def changed_files():
+        indexed = {} if reindex_all else state.get_file_hashes(collection_name)
+        markdown_files = []
+        for file_path in find_markdown_files(site_dir):
+            with open(file_path, 'rb') as f:
+                if indexed.get(file_path) != compute_hash(f.read()):
+                    markdown_files.append(file_path)
+        return markdown_files, find_removed_files(state, collection_name)
+
+    markdown_files, deleted_files = await loop.run_in_executor(None, changed_files)
+    if not markdown_files and not deleted_files:
+        print(f"Collection '{collection_name}' is up to date with {site_url}.")
+        return None
+
+    stats = await index_markdown_files(qdrant_client, collection_name, state, markdown_files, deleted_files,
+                                       reindex_all, embedding_provider=provider, workers=workers,
+                                       target=site_url)
+    with state.transaction():
+        state.set_collection_info(collection_name, repo_url=site_url)
+    return stats
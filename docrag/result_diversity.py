@@ -0,0 +1,94 @@
+from typing import Dict, List, Sequence
+
+# A dependency of qdrant-client, so always present where the vector store is searched
+import numpy as np
+
+from near_duplicates import collapse_near_duplicates
+from vector_store import ScoredPoint
+
+# Candidates fetched per requested result for diversification
+MMR_CANDIDATES = 4
+
+def mmr_select(relevance: np.ndarray, vectors: np.ndarray, k: int, mmr_lambda: float = 0.5) -> List[int]:
+    """Indices of `k` candidates picked by maximal marginal relevance, in pick order.
+
+    Each pick maximizes `mmr_lambda * relevance - (1 - mmr_lambda) * similarity`
+    to the closest candidate already picked. The cosine similarities of all
+    candidates are computed in one matrix product, and the closest picked
+    candidate is tracked as a running maximum, so a pick costs O(n).
+    """
+    n = len(relevance)
+    k = min(k, n)
+    if k == 0:
+        return []
+    unit = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    similarity = unit @ unit.T
+    picked = [int(np.argmax(relevance))]
+    taken = np.zeros(n, dtype=bool)
+    taken[picked[0]] = True
+    closest = similarity[picked[0]].copy()
+    for _ in range(k - 1):
+        scores = mmr_lambda * relevance - (1 - mmr_lambda) * closest
+        scores[taken] = -np.inf
+        j = int(np.argmax(scores))
+        picked.append(j)
+        taken[j] = True
+        np.maximum(closest, similarity[j], out=closest)
+    return picked
+
+def diversify_results(results: Sequence, limit: int, mmr_lambda: float = 0.5) -> List:
+    """Pick `limit` of the over-fetched `results`: near-duplicates are collapsed, then MMR picks among the rest.
+
+    Relevance is the results' own score (cosine or fused), scaled to [0, 1]
+    over the candidates. Results need their vectors for MMR; without them
+    the best-ranked distinct results are kept. Vectors are dropped from the
+    returned results, which may be cached.
+    """
+    candidates = collapse_near_duplicates(results)
+    if len(candidates) > limit and all(result.vector is not None for result in candidates):
+        scores = np.asarray([result.score for result in candidates], dtype=np.float32)
+        span = scores.max() - scores.min()
+        relevance = (scores - scores.min()) / span if span > 0 else np.ones_like(scores)
+        vectors = np.asarray([result.vector for result in candidates], dtype=np.float32)
+        candidates = [candidates[i] for i in mmr_select(relevance, vectors, limit, mmr_lambda)]
+    candidates = candidates[:limit]
+    for result in candidates:
+        result.vector = None
+    return candidates
+
+def merge_adjacent_chunks(results: Sequence) -> List:
+    """Merge results that are consecutive chunks of the same file into one result.
+
+    A merged result takes the place of its best-ranked chunk, with the best
+    score, the texts joined in chunk order and the merged IDs under
+    `chunk_ids`, so the prompt gets one coherent passage instead of pieces.
+    """
+    by_file: Dict[str, List[int]] = {}
+    for i, result in enumerate(results):
+        payload = result.payload or {}
+        if 'file_path' in payload and isinstance(payload.get('chunk_id'), int):
+            by_file.setdefault(payload['file_path'], []).append(i)
+
+    merged_into: Dict[int, int] = {}
+    merged: Dict[int, object] = {}
+    for indices in by_file.values():
+        indices.sort(key=lambda i: results[i].payload['chunk_id'])
+        runs = [[indices[0]]]
+        for i in indices[1:]:
+            if results[i].payload['chunk_id'] - results[runs[-1][-1]].payload['chunk_id'] == 1:
+                runs[-1].append(i)
+            else:
+                runs.append([i])
+        for run in runs:
+            if len(run) == 1:
+                continue
+            first = min(run)
+            best = max(run, key=lambda i: results[i].score)
+            payload = dict(results[run[0]].payload)
+            payload['text'] = '\n\n'.join(results[i].payload['text'] for i in run)
+            payload['chunk_ids'] = [results[i].payload['chunk_id'] for i in run]
+            merged[first] = ScoredPoint(id=str(results[first].id), score=results[best].score, payload=payload)
+            for i in run:
+                merged_into[i] = first
+
+    return [merged.get(i, result) for i, result in enumerate(results) if merged_into.get(i, i) == i]
@@ -1,18 +1,23 @@
-from setuptools import setup, find_packages
+from setuptools import setup
 
 setup(
     name="docrag",
     version="0.1",
-    packages=find_packages(),
+    # This directory is the `docrag` package; its modules import each other by plain name
+    # (main.py puts the package directory on sys.path)
+    package_dir={"docrag": "."},
+    packages=["docrag"],
     install_requires=[
         "openai>=1.0.0",
         "qdrant-client",
         "gitpython",
         "requests",
+        "httpx",
+        "numpy",
     ],
     entry_points={
         "console_scripts": [
             "docrag=docrag.main:main",
         ],
     },
-)
\ No newline at end of file
+)
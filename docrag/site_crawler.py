@@ -0,0 +1,457 @@
+import os
+import re
+import json
+import asyncio
+import posixpath
+import xml.etree.ElementTree as ET
+from dataclasses import dataclass, field
+from html.parser import HTMLParser
+from typing import Dict, List, Optional, Set, Tuple
+from urllib.parse import urljoin, urlparse, urlunparse
+
+try:
+    import httpx
+except ImportError:  # pragma: no cover - optional dependency
+    httpx = None
+
+REQUEST_TIMEOUT = 10
+USER_AGENT = "docrag"
+
+VOID_TAGS = frozenset("area base br col embed hr img input link meta param source track wbr".split())
+SKIPPED_TAGS = frozenset("script style noscript template svg nav header footer aside form button iframe select".split())
+# Theme chrome of Sphinx, MkDocs and similar generators
+SKIPPED_CLASSES = frozenset((
+    "headerlink", "sphinxsidebar", "related", "wy-nav-side", "rst-footer-buttons", "md-sidebar",
+    "md-header", "md-footer", "toc", "breadcrumbs", "wy-breadcrumbs", "edit-this-page", "prev-next-area",
+))
+BLOCK_TAGS = frozenset("p div section blockquote dl dt dd ul ol table tr figure figcaption details summary".split())
+HEADING_TAGS = {f"h{level}": level for level in range(1, 7)}
+# Links to these are assets or generated indexes, not documentation pages
+SKIPPED_EXTENSIONS = frozenset((
+    ".png", ".jpg", ".jpeg", ".gif", ".svg", ".ico", ".webp", ".css", ".js", ".map", ".json", ".xml", ".txt",
+    ".pdf", ".zip", ".gz", ".tar", ".whl", ".epub", ".woff", ".woff2", ".ttf", ".mp4", ".ipynb", ".py",
+))
+SKIPPED_PATH_PARTS = ("/_sources/", "/_static/", "/_images/", "/_downloads/", "/_modules/",
+                      "/genindex", "/search.html", "/py-modindex")
+WHITESPACE_RE = re.compile(r"\s+")
+BLANK_LINES_RE = re.compile(r"\n{3,}")
+CODE_LANGUAGE_RE = re.compile(r"(?:highlight|language|lang)-([\w+-]+)")
+
+class _Node:
+    __slots__ = ('tag', 'attrs', 'children', 'parent')
+
+    def __init__(self, tag: str, attrs: Dict[str, str], parent: Optional["_Node"] = None):
+        self.tag = tag
+        self.attrs = attrs
+        self.children: List = []
+        self.parent = parent
+
+    @property
+    def classes(self) -> Set[str]:
+        return set((self.attrs.get('class') or '').split())
+
+    def iter(self):
+        yield self
+        for child in self.children:
+            if isinstance(child, _Node):
+                yield from child.iter()
+
+class _TreeBuilder(HTMLParser):
+    """Builds a forgiving element tree; unclosed paragraphs and list items are closed implicitly"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.root = _Node('document', {})
+        self.current = self.root
+
+    def handle_starttag(self, tag, attrs):
+        if tag in ('p', 'li', 'dt', 'dd', 'tr', 'td', 'th') and self.current.tag == tag:
+            self.current = self.current.parent
+        node = _Node(tag, {key: value or '' for key, value in attrs}, self.current)
+        self.current.children.append(node)
+        if tag not in VOID_TAGS:
+            self.current = node
+
+    def handle_startendtag(self, tag, attrs):
+        self.current.children.append(_Node(tag, {key: value or '' for key, value in attrs}, self.current))
+
+    def handle_endtag(self, tag):
+        node = self.current
+        while node is not self.root and node.tag != tag:
+            node = node.parent
+        if node is not self.root:
+            self.current = node.parent
+
+    def handle_data(self, data):
+        self.current.children.append(data)
+
+def _main_content(root: _Node) -> _Node:
+    """The element holding the page's documentation, without the site's navigation"""
+    nodes = list(root.iter())
+    for match in (
+        lambda n: n.attrs.get('itemprop') == 'articleBody',
+        lambda n: n.attrs.get('role') == 'main',
+        lambda n: n.tag == 'main',
+        lambda n: n.tag == 'article',
+        lambda n: n.tag == 'div' and n.classes & {'rst-content', 'document', 'body', 'content'},
+        lambda n: n.tag == 'body',
+    ):
+        for node in nodes:
+            if match(node):
+                return node
+    return root
+
+def _skipped(node: _Node) -> bool:
+    return (node.tag in SKIPPED_TAGS or node.attrs.get('role') == 'navigation'
+            or bool(node.classes & SKIPPED_CLASSES) or 'hidden' in node.attrs)
+
+def _text(node: _Node) -> str:
+    parts = []
+    for child in node.children:
+        if isinstance(child, str):
+            parts.append(child)
+        elif not _skipped(child):
+            parts.append('\n' if child.tag == 'br' else _text(child))
+    return ''.join(parts)
+
+def _code_language(node: _Node) -> str:
+    while node is not None:
+        match = CODE_LANGUAGE_RE.search(node.attrs.get('class', ''))
+        if match:
+            return match.group(1)
+        node = node.parent
+    return ''
+
+class _MarkdownRenderer:
+    def __init__(self):
+        self.out: List[str] = []
+
+    def block(self, text: str = ''):
+        self.out.append(f"\n\n{text}" if text else "\n\n")
+
+    def render(self, node: _Node, list_depth: int = 0):
+        for child in node.children:
+            if isinstance(child, str):
+                self.out.append(WHITESPACE_RE.sub(' ', child))
+                continue
+            if _skipped(child):
+                continue
+            tag = child.tag
+            if tag in HEADING_TAGS:
+                title = WHITESPACE_RE.sub(' ', _text(child)).strip()
+                if title:
+                    self.block(f"{'#' * HEADING_TAGS[tag]} {title}")
+                    self.block()
+            elif tag == 'pre':
+                code = _text(child).strip('\n')
+                code_child = next((c for c in child.children if isinstance(c, _Node) and c.tag == 'code'), None)
+                language = _code_language(code_child or child)
+                self.block(f"```{language}\n{code}\n```")
+                self.block()
+            elif tag == 'code':
+                code = WHITESPACE_RE.sub(' ', _text(child)).strip()
+                if code:
+                    self.out.append(f"`{code}`")
+            elif tag == 'br':
+                self.out.append('\n')
+            elif tag == 'li':
+                marker = '1.' if child.parent is not None and child.parent.tag == 'ol' else '-'
+                self.out.append(f"\n{'  ' * max(list_depth - 1, 0)}{marker} ")
+                self.render(child, list_depth)
+            elif tag in ('ul', 'ol'):
+                self.block()
+                self.render(child, list_depth + 1)
+                self.block()
+            elif tag in ('td', 'th'):
+                self.out.append(' | ')
+                self.render(child, list_depth)
+            elif tag == 'tr':
+                self.out.append('\n')
+                self.render(child, list_depth)
+                self.out.append(' |')
+            elif tag in BLOCK_TAGS:
+                self.block()
+                self.render(child, list_depth)
+                self.block()
+            else:
+                self.render(child, list_depth)
+
+    def markdown(self) -> str:
+        lines, in_code = [], False
+        for line in ''.join(self.out).split('\n'):
+            if line.startswith('```'):
+                in_code = not in_code
+            # Indentation only matters in code blocks and nested lists
+            lines.append(line.rstrip() if in_code or line.lstrip().startswith(('- ', '1. ')) else line.strip())
+        return BLANK_LINES_RE.sub('\n\n', '\n'.join(lines)).strip() + '\n'
+
+def html_to_markdown(html: str, base_url: str = '') -> Tuple[str, List[str]]:
+    """Main content of an HTML page as markdown, plus the absolute URLs the page links to.
+
+    Headings, code blocks and lists keep their markdown form, so the result
+    chunks like any markdown file; navigation, sidebars and scripts are dropped.
+    """
+    builder = _TreeBuilder()
+    builder.feed(html)
+    builder.close()
+    root = builder.root
+
+    base = next((n.attrs['href'] for n in root.iter() if n.tag == 'base' and n.attrs.get('href')), None)
+    base = urljoin(base_url, base) if base else base_url
+    links = [urljoin(base, n.attrs['href']) for n in root.iter() if n.tag == 'a' and n.attrs.get('href')]
+
+    renderer = _MarkdownRenderer()
+    content = _main_content(root)
+    if not any(n.tag == 'h1' for n in content.iter()):
+        title = next((n for n in root.iter() if n.tag == 'title'), None)
+        if title is not None and _text(title).strip():
+            renderer.block(f"# {WHITESPACE_RE.sub(' ', _text(title)).strip()}")
+            renderer.block()
+    renderer.render(content)
+    return renderer.markdown(), links
+
+def normalize_url(url: str) -> Optional[str]:
+    """Crawl key of a URL: http(s) only, without fragment and query"""
+    parsed = urlparse(url)
+    if parsed.scheme not in ('http', 'https') or not parsed.netloc:
+        return None
+    path = posixpath.normpath(parsed.path) if parsed.path not in ('', '/') else '/'
+    if parsed.path.endswith('/') and not path.endswith('/'):
+        path += '/'
+    # A directory and its index.html are the same page
+    if path.endswith('/index.html'):
+        path = path[:-len('index.html')]
+    return urlunparse((parsed.scheme, parsed.netloc.lower(), path, '', '', ''))
+
+def url_to_path(url: str, output_dir: str) -> str:
+    """Markdown file of a crawled page inside `output_dir`"""
+    parsed = urlparse(url)
+    path = parsed.path
+    if not path or path.endswith('/'):
+        path += 'index'
+    root, ext = posixpath.splitext(path)
+    if ext in ('.html', '.htm'):
+        path = root
+    relative = posixpath.normpath(f"{parsed.netloc.replace(':', '_')}/{path.lstrip('/')}")
+    if relative.startswith('..'):
+        raise ValueError(f"Unsafe page path: {url}")
+    return os.path.join(output_dir, *relative.split('/')) + '.md'
+
+@dataclass
+class CrawlResult:
+    changed: List[str] = field(default_factory=list)
+    deleted: List[str] = field(default_factory=list)
+    unchanged: int = 0
+    not_modified: int = 0
+    failed: Dict[str, str] = field(default_factory=dict)
+    truncated: bool = False
+
+class SiteCrawler:
+    """Mirror a documentation site as markdown files under `output_dir`.
+
+    Pages are discovered from `sitemap.xml` and from links, restricted to
+    the directory of `start_url` (e.g. one ReadTheDocs version). Fetches
+    share a keep-alive connection pool and at most `per_host_concurrency`
+    requests run against one host. With an index state, each page's ETag
+    and Last-Modified are recorded, refreshes send conditional GETs, and
+    pages that disappeared from the site are reported as deleted.
+    """
+
+    def __init__(self, start_url: str, output_dir: str, state=None, collection_name: Optional[str] = None,
+                 per_host_concurrency: int = 4, max_pages: int = 5000, timeout: float = REQUEST_TIMEOUT,
+                 use_sitemap: bool = True):
+        if httpx is None:
+            raise ImportError("Crawling documentation sites requires httpx")
+        self._set_start_url(start_url if urlparse(start_url).path else start_url + '/')
+        self.output_dir = output_dir
+        self.state = state
+        self.collection_name = collection_name or self.scope[0]
+        self.per_host_concurrency = per_host_concurrency
+        self.max_pages = max_pages
+        self.timeout = timeout
+        self.use_sitemap = use_sitemap
+        self._host_limits: Dict[str, asyncio.Semaphore] = {}
+
+    def _set_start_url(self, url: str):
+        self.start_url = normalize_url(url)
+        if self.start_url is None:
+            raise ValueError(f"Not an http(s) URL: {url}")
+        parsed = urlparse(self.start_url)
+        self.scope = (parsed.netloc, parsed.path[:parsed.path.rfind('/') + 1])
+
+    async def _follow_start_redirect(self, http: "httpx.AsyncClient"):
+        """Narrow the scope to where the start URL redirects, e.g. from a project root to its default version"""
+        try:
+            async with self._host_limit(self.start_url):
+                response = await http.head(self.start_url)
+        except httpx.HTTPError:
+            return
+        if response.history and normalize_url(str(response.url)) != self.start_url:
+            self._set_start_url(str(response.url))
+
+    def in_scope(self, url: str) -> bool:
+        parsed = urlparse(url)
+        if parsed.netloc != self.scope[0] or not parsed.path.startswith(self.scope[1]):
+            return False
+        if any(part in parsed.path for part in SKIPPED_PATH_PARTS):
+            return False
+        return posixpath.splitext(parsed.path)[1].lower() not in SKIPPED_EXTENSIONS
+
+    def _host_limit(self, url: str) -> asyncio.Semaphore:
+        host = urlparse(url).netloc
+        if host not in self._host_limits:
+            self._host_limits[host] = asyncio.Semaphore(self.per_host_concurrency)
+        return self._host_limits[host]
+
+    async def _sitemap_urls(self, http: "httpx.AsyncClient") -> List[str]:
+        scheme = urlparse(self.start_url).scheme
+        host, prefix = self.scope
+        pending = [f"{scheme}://{host}{prefix}sitemap.xml", f"{scheme}://{host}/sitemap.xml"]
+        seen, urls = set(), []
+        while pending and len(seen) < 20:
+            sitemap_url = pending.pop(0)
+            if sitemap_url in seen:
+                continue
+            seen.add(sitemap_url)
+            try:
+                async with self._host_limit(sitemap_url):
+                    response = await http.get(sitemap_url)
+                if response.status_code != 200:
+                    continue
+                root = ET.fromstring(response.content)
+            except (httpx.HTTPError, ET.ParseError):
+                continue
+            for element in root.iter():
+                if not element.tag.endswith('loc') or not element.text:
+                    continue
+                loc = element.text.strip()
+                # Sitemap indexes point at further sitemaps
+                if root.tag.endswith('sitemapindex'):
+                    pending.append(loc)
+                else:
+                    urls.append(loc)
+        return urls
+
+    def _write_page(self, url: str, markdown: str, result: CrawlResult) -> str:
+        file_path = url_to_path(url, self.output_dir)
+        data = markdown.encode('utf-8')
+        if os.path.exists(file_path):
+            with open(file_path, 'rb') as f:
+                if f.read() == data:
+                    result.unchanged += 1
+                    return file_path
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        tmp_path = f"{file_path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, file_path)
+        result.changed.append(file_path)
+        return file_path
+
+    def _remove_page(self, url: str, page: Dict, result: CrawlResult):
+        file_path = page.get('file_path')
+        if file_path and os.path.exists(file_path):
+            os.remove(file_path)
+            result.deleted.append(file_path)
+        if self.state is not None:
+            with self.state.transaction():
+                self.state.delete_page(self.collection_name, url)
+
+    async def crawl(self) -> CrawlResult:
+        result = CrawlResult()
+        known = self.state.get_pages(self.collection_name) if self.state is not None else {}
+        queue: asyncio.Queue = asyncio.Queue()
+        seen: Set[str] = set()
+        gone: Set[str] = set()
+
+        def enqueue(url: str):
+            url = normalize_url(url)
+            if url is None or url in seen or not self.in_scope(url):
+                return
+            if len(seen) >= self.max_pages:
+                result.truncated = True
+                return
+            seen.add(url)
+            queue.put_nowait(url)
+
+        async def fetch(http: "httpx.AsyncClient", url: str):
+            page = known.get(url)
+            headers = {}
+            # Conditional requests only make sense while the mirrored file is still there
+            if page and page.get('file_path') and os.path.exists(page['file_path']):
+                if page.get('etag'):
+                    headers['If-None-Match'] = page['etag']
+                if page.get('last_modified'):
+                    headers['If-Modified-Since'] = page['last_modified']
+            async with self._host_limit(url):
+                response = await http.get(url, headers=headers)
+
+            if response.status_code == 304:
+                result.not_modified += 1
+                for link in json.loads(page.get('links') or '[]'):
+                    enqueue(link)
+                return
+            if response.status_code in (404, 410):
+                gone.add(url)
+                return
+            response.raise_for_status()
+            content_type = response.headers.get('content-type', '')
+            if 'html' not in content_type:
+                return
+            final_url = str(response.url)
+            markdown, links = html_to_markdown(response.text, final_url)
+            links = sorted({normalize_url(link) for link in links} - {None})
+            links = [link for link in links if self.in_scope(link)]
+            file_path = self._write_page(url, markdown, result)
+            if self.state is not None:
+                with self.state.transaction():
+                    self.state.set_page(self.collection_name, url, file_path, response.headers.get('etag'),
+                                        response.headers.get('last-modified'), json.dumps(links))
+            for link in links:
+                enqueue(link)
+
+        async def worker(http: "httpx.AsyncClient"):
+            while True:
+                url = await queue.get()
+                try:
+                    await fetch(http, url)
+                except Exception as e:
+                    # One broken page must not stop the crawl
+                    result.failed[url] = str(e) or type(e).__name__
+                finally:
+                    queue.task_done()
+
+        limits = httpx.Limits(max_connections=self.per_host_concurrency * 2,
+                              max_keepalive_connections=self.per_host_concurrency * 2)
+        async with httpx.AsyncClient(timeout=self.timeout, limits=limits, follow_redirects=True,
+                                     headers={'User-Agent': USER_AGENT}) as http:
+            await self._follow_start_redirect(http)
+            enqueue(self.start_url)
+            if self.use_sitemap:
+                for url in await self._sitemap_urls(http):
+                    enqueue(url)
+            # Known pages are revalidated even if nothing links to them any more
+            for url in known:
+                enqueue(url)
+            workers = [asyncio.ensure_future(worker(http)) for _ in range(self.per_host_concurrency)]
+            try:
+                await queue.join()
+            finally:
+                for task in workers:
+                    task.cancel()
+                await asyncio.gather(*workers, return_exceptions=True)
+
+        for url in gone:
+            if url in known:
+                self._remove_page(url, known[url], result)
+        # Pages no longer reachable are gone too, unless the crawl stopped early
+        if not result.truncated:
+            for url, page in known.items():
+                if url not in seen:
+                    self._remove_page(url, page, result)
+        return result
+
+def crawl_site(start_url: str, output_dir: str, state=None, collection_name: Optional[str] = None,
+               **kwargs) -> CrawlResult:
+    """Synchronous wrapper around `SiteCrawler.crawl`"""
+    return asyncio.run(SiteCrawler(start_url, output_dir, state, collection_name, **kwargs).crawl())
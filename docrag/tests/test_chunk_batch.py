@@ -0,0 +1,33 @@
+import numpy as np
+import pytest
+
+from chunk_batch import ChunkBatch
+
+def _batch(n: int, offset: int = 0) -> ChunkBatch:
+    chunks = [{'text': f"text {i}", 'metadata': {'file_path': 'a.md', 'chunk_id': i, 'point_id': f"p{i}"}}
+              for i in range(offset, offset + n)]
+    return ChunkBatch.from_rows(chunks, [[float(i)] * 3 for i in range(offset, offset + n)])
+
+def test_vectors_are_one_float32_matrix():
+    batch = _batch(4)
+    assert batch.vectors.dtype == np.float32 and batch.vectors.shape == (4, 3)
+    assert batch.dimension == 3 and batch.nbytes == 4 * 3 * 4
+    chunk = batch[2]
+    assert chunk['text'] == 'text 2' and chunk['metadata']['chunk_id'] == 2
+    # Chunks see their row of the matrix, not a copy
+    assert np.shares_memory(chunk.vector, batch.vectors)
+
+def test_slicing_taking_and_concatenating_keep_columns_aligned():
+    batch = ChunkBatch.concat([_batch(3), ChunkBatch.empty(), _batch(2, offset=3)])
+    assert batch.point_ids == ['p0', 'p1', 'p2', 'p3', 'p4']
+    halves = batch[:2], batch[2:]
+    assert [len(half) for half in halves] == [2, 3]
+    assert halves[1].point_ids == ['p2', 'p3', 'p4'] and halves[1].vectors[0, 0] == 2.0
+    taken = batch.take([4, 0])
+    assert taken.point_ids == ['p4', 'p0'] and list(taken.vectors[:, 0]) == [4.0, 0.0]
+    assert [chunk.text for chunk in taken] == ['text 4', 'text 0']
+    assert len(ChunkBatch.from_rows([], [])) == 0
+
+def test_columns_must_have_the_same_length():
+    with pytest.raises(ValueError):
+        ChunkBatch(['a', 'b'], [{}], np.zeros((2, 3), dtype=np.float32))
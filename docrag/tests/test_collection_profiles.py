@@ -0,0 +1,23 @@
+import pytest
+
+from collection_profiles import PROFILES, create_collection_params, get_collection_profile, search_params
+
+def test_profiles_are_chosen_by_name_or_environment(monkeypatch):
+    assert get_collection_profile().name == 'default'
+    monkeypatch.setenv('DOCRAG_QDRANT_PROFILE', 'compact')
+    assert get_collection_profile().name == 'compact'
+    with pytest.raises(ValueError, match='Unknown collection profile'):
+        get_collection_profile('huge')
+
+def test_signatures_tell_every_profile_apart():
+    assert len({profile.signature() for profile in PROFILES.values()}) == len(PROFILES)
+    assert get_collection_profile('memory').signature() == get_collection_profile('memory').signature()
+
+def test_quantized_profiles_rescore_and_keep_vectors_on_disk():
+    assert search_params(get_collection_profile('default')) is None
+    params = search_params(get_collection_profile('compact'))
+    assert params.quantization.rescore and params.quantization.oversampling == 3.0 and params.hnsw_ef == 128
+    create = create_collection_params(get_collection_profile('memory'), 384)
+    assert create['vectors_config'].size == 384 and create['vectors_config'].on_disk
+    assert create['quantization_config'].scalar.always_ram
+    assert create_collection_params(get_collection_profile('default'), 384)['quantization_config'] is None
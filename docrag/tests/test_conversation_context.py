@@ -0,0 +1,40 @@
+from conversation_context import MESSAGE_OVERHEAD_TOKENS, ConversationContext
+from vector_store import ScoredPoint
+
+def _words(text: str) -> int:
+    return len(text.split())
+
+def _result(file_path: str, words: int, score: float) -> ScoredPoint:
+    return ScoredPoint(id=file_path, score=score, payload={'file_path': file_path, 'text': ' '.join(['w'] * words)})
+
+def _context(**kwargs) -> ConversationContext:
+    return ConversationContext("Answer from the docs.", count_tokens=_words, **kwargs)
+
+def test_documents_are_sent_once_and_evicted_by_relevance():
+    context = _context(max_tokens=1000, max_document_tokens=100, decay=0.5)
+    new = context.add_results([_result('a.md', 40, 0.9), _result('b.md', 40, 0.8)])
+    assert [doc.title for doc in new] == ['a.md', 'b.md']
+    # Retrieved again: already in context, nothing new to show
+    assert context.add_results([_result('a.md', 40, 0.7)]) == []
+
+    # b.md decayed to 0.2 and no longer fits next to a.md and c.md
+    new = context.add_results([_result('c.md', 40, 0.6)])
+    assert [doc.title for doc in new] == ['c.md']
+    assert [doc.title for doc in context.context_documents] == ['c.md', 'a.md']
+
+def test_history_is_trimmed_to_the_budget_and_summarized():
+    context = _context(max_tokens=120, summarize=True)
+    for i in range(6):
+        context.add_turn(' '.join(['question'] * 10), ' '.join(['answer'] * 10))
+    messages = context.build_messages('latest question')
+
+    assert sum(_words(m['content']) + MESSAGE_OVERHEAD_TOKENS for m in messages) <= 120
+    history = messages[1:-1]
+    assert len(history) % 2 == 0 and 0 < len(history) < 12
+    # The turns left out are the oldest ones, and they are offered for summarizing
+    dropped = context.turns_to_summarize()
+    assert len(dropped) + len(history) == 12
+    context.set_summary('They asked six questions.', dropped)
+    messages = context.build_messages('latest question')
+    assert messages[1]['content'].endswith('They asked six questions.')
+    assert context.turns_to_summarize() == []
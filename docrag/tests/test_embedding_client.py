@@ -0,0 +1,76 @@
+import asyncio
+from types import SimpleNamespace
+
+import httpx
+import openai
+import pytest
+
+from embedding_client import EmbeddingAborted, EmbeddingEngine
+
+def _error(cls, status: int, headers=None):
+    response = httpx.Response(status, headers=headers, request=httpx.Request('POST', 'https://api.test/embeddings'))
+    return cls(f"status {status}", response=response, body=None)
+
+class FakeEmbeddings:
+    """Stands in for `AsyncOpenAI().embeddings`; `fail(inputs, call)` returns an error to raise, or None"""
+
+    def __init__(self, fail=lambda inputs, call: None):
+        self.fail = fail
+        self.calls = []
+        self.embeddings = self
+
+    async def create(self, input, model, **kwargs):
+        self.calls.append(list(input))
+        error = self.fail(input, len(self.calls))
+        if error is not None:
+            raise error
+        data = [SimpleNamespace(index=i, embedding=[float(len(text)), 1.0]) for i, text in enumerate(input)]
+        return SimpleNamespace(data=data)
+
+def _engine(client, **kwargs) -> EmbeddingEngine:
+    options = dict(max_concurrency=1, base_delay=0.001, max_delay=0.001)
+    options.update(kwargs)
+    engine = EmbeddingEngine(client=client, **options)
+    engine.request_options = {}
+    return engine
+
+def test_packs_batches_by_inputs_and_tokens():
+    engine = _engine(FakeEmbeddings(), max_batch_inputs=3, max_batch_tokens=10)
+    assert engine.pack_batches(['a'] * 7, [1] * 7) == [[0, 1, 2], [3, 4, 5], [6]]
+    assert engine.pack_batches(['a'] * 4, [6, 6, 3, 20]) == [[0], [1, 2], [3]]
+
+def test_retries_throttled_requests():
+    client = FakeEmbeddings(lambda inputs, call: _error(openai.RateLimitError, 429, {'retry-after-ms': '1'})
+                            if call <= 2 else None)
+    result = asyncio.run(_engine(client).embed(['one', 'two']))
+    assert len(client.calls) == 3
+    assert result.retries == 2
+    assert not result.failed
+    assert [list(result.vectors[i]) for i in (0, 1)] == [[3.0, 1.0], [3.0, 1.0]]
+
+def test_reports_inputs_failing_after_all_retries():
+    client = FakeEmbeddings(lambda inputs, call: _error(openai.InternalServerError, 500))
+    result = asyncio.run(_engine(client, max_retries=2).embed(['one', 'two']))
+    assert len(client.calls) == 3
+    assert set(result.failed) == {0, 1}
+    assert not result.vectors
+
+@pytest.mark.parametrize('cls, status', [(openai.BadRequestError, 400), (openai.APIStatusError, 413)])
+def test_bisects_batches_rejected_for_their_inputs(cls, status):
+    client = FakeEmbeddings(lambda inputs, call: _error(cls, status) if 'bad' in inputs else None)
+    texts = ['a', 'b', 'c', 'bad', 'e', 'f', 'g', 'h']
+    result = asyncio.run(_engine(client, max_batch_inputs=8).embed(texts))
+    assert set(result.failed) == {3}
+    assert set(result.vectors) == set(range(8)) - {3}
+    # 8 -> 4 + 4 -> 2 + 2 -> 1 + 1
+    assert len(client.calls) == 7
+
+@pytest.mark.parametrize('cls, status', [(openai.AuthenticationError, 401), (openai.PermissionDeniedError, 403),
+                                         (openai.NotFoundError, 404)])
+def test_aborts_on_other_rejections_without_bisecting(cls, status):
+    client = FakeEmbeddings(lambda inputs, call: _error(cls, status))
+    engine = _engine(client, max_batch_inputs=2)
+    with pytest.raises(EmbeddingAborted):
+        asyncio.run(engine.embed(['a', 'b', 'c', 'd', 'e', 'f']))
+    # The first rejection stops the remaining batches from being sent
+    assert client.calls == [['a', 'b']]
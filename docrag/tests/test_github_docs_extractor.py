@@ -0,0 +1,48 @@
+import subprocess
+
+from github_docs_extractor import clone_docs_repo, find_markdown_files, get_changed_markdown_files, get_head_commit
+
+def _git(repo, *args):
+    subprocess.run(["git", "-c", "user.name=docrag", "-c", "user.email=docrag@example.com", *args],
+                   cwd=repo, check=True, capture_output=True)
+
+def _origin(tmp_path, files):
+    repo = tmp_path / 'origin'
+    for name, text in files.items():
+        path = repo / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(text)
+    _git(tmp_path, 'init', '-q', str(repo))
+    _git(repo, 'add', '.')
+    _git(repo, 'commit', '-q', '-m', 'docs')
+    return repo
+
+def test_clone_checks_out_only_the_docs_directories(tmp_path):
+    origin = _origin(tmp_path, {'README.md': '# Readme', 'docs/guide.md': '# Guide', 'docs/api/index.md': '# API',
+                                'src/notes.md': '# Notes', 'src/module.py': 'pass'})
+    clone = str(tmp_path / 'clone')
+
+    assert clone_docs_repo(f"file://{origin}", clone) == ['docs']
+    assert not (tmp_path / 'clone' / 'src').exists()
+    assert sorted(find_markdown_files(clone, ['docs'])) == [f"{clone}/docs/api/index.md", f"{clone}/docs/guide.md"]
+
+    # A repository that no longer has docs directories is checked out in full on update
+    _git(origin, 'rm', '-rq', 'docs')
+    _git(origin, 'commit', '-q', '-m', 'drop docs')
+    assert clone_docs_repo(f"file://{origin}", clone) is None
+    assert sorted(find_markdown_files(clone)) == [f"{clone}/README.md", f"{clone}/src/notes.md"]
+
+def test_changed_files_are_diffed_within_the_docs_paths(tmp_path):
+    origin = _origin(tmp_path, {'docs/old name.md': '# Old\n\nA page about renames.\n', 'docs/gone.md': '# Gone',
+                                'docs/kept.md': '# Kept', 'src/notes.md': '# Notes'})
+    old = get_head_commit(str(origin))
+    _git(origin, 'mv', 'docs/old name.md', 'docs/n\u00e9w "name".md')
+    _git(origin, 'rm', '-q', 'docs/gone.md')
+    (origin / 'docs' / 'kept.md').write_text('# Kept\n\nEdited.')
+    (origin / 'src' / 'notes.md').write_text('# Notes\n\nEdited.')
+    _git(origin, 'add', '.')
+    _git(origin, 'commit', '-q', '-m', 'edit')
+
+    changes = get_changed_markdown_files(str(origin), old, get_head_commit(str(origin)), ['docs'])
+    assert sorted(changes['changed']) == [f"{origin}/docs/kept.md", f"{origin}/docs/n\u00e9w \"name\".md"]
+    assert sorted(changes['deleted']) == [f"{origin}/docs/gone.md", f"{origin}/docs/old name.md"]
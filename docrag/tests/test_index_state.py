@@ -0,0 +1,23 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from index_state import IndexState
+
+def test_threads_share_the_state(tmp_path):
+    state = IndexState(str(tmp_path / 'state.sqlite'))
+
+    def index_file(i: int):
+        file_path = f"docs/page{i}.md"
+        with state.transaction():
+            state.add_chunks('docs', [(f"{i}-{c}", file_path, c, None) for c in range(20)])
+            state.add_postings('docs', [(f"{i}-{c}", {f"term{c}": 1, 'shared': 2}) for c in range(20)])
+            state.set_file('docs', file_path, f"hash{i}", 20)
+        assert len(state.get_file_chunks('docs', file_path)) == 20
+        return state.count_chunks('docs')
+
+    with ThreadPoolExecutor(8) as pool:
+        list(pool.map(index_file, range(200)))
+
+    assert state.count_chunks('docs') == 4000
+    assert len(state.get_file_hashes('docs')) == 200
+    assert state.get_lexical_stats('docs') == (4000, 3.0)
+    assert state.get_version('docs') == 400
@@ -0,0 +1,134 @@
+import os
+import asyncio
+import threading
+
+import pytest
+
+import ingest_pipeline
+from embedding_providers import HashingEmbeddingProvider
+from index_state import IndexState
+from repo_indexer import index_markdown_files, resume_run
+from vector_store import connect_vector_store
+
+COLLECTION = 'docs'
+
+def _write_docs(tmp_path, files: int = 3, sections: int = 8):
+    paths = []
+    for i in range(files):
+        path = tmp_path / 'docs' / f"page{i}.md"
+        path.parent.mkdir(exist_ok=True)
+        body = '\n\n'.join(f"## Section {s}\n\n" + f"page{i} section{s} explains option{s} in detail. " * 60
+                           for s in range(sections))
+        path.write_text(f"# Page {i}\n\n{body}\n")
+        paths.append(str(path))
+    return paths
+
+@pytest.fixture
+def store(tmp_path):
+    return connect_vector_store(f"local:{tmp_path / 'vectors'}")
+
+@pytest.fixture
+def state(tmp_path):
+    return IndexState(str(tmp_path / 'state.sqlite'))
+
+def _index(store, state, files, **kwargs):
+    return asyncio.run(index_markdown_files(store, COLLECTION, state, files, [],
+                                            embedding_provider=HashingEmbeddingProvider(), workers=1, **kwargs))
+
+def _reject_points(store, rejected):
+    """Make the store reject every upload that contains a point of `rejected`"""
+    upload = store.upload_collection
+
+    def upload_collection(collection_name, vectors, payload=None, ids=None, **kwargs):
+        if rejected & {str(point_id) for point_id in ids}:
+            raise RuntimeError("rejected")
+        return upload(collection_name, vectors, payload=payload, ids=ids, **kwargs)
+    store.upload_collection = upload_collection
+
+def test_rejected_upserts_are_bisected_and_journaled(tmp_path, store, state, monkeypatch):
+    files = _write_docs(tmp_path)
+    monkeypatch.setattr(ingest_pipeline, 'MIN_UPSERT_BATCH', 1)
+    # The chunker assigns point IDs deterministically: index once to learn one, then start over
+    _index(store, state, files[:1])
+    poisoned = sorted(state.get_point_ids(COLLECTION, files[0]))[0]
+    store.delete_collection(COLLECTION)
+    state.clear_collection(COLLECTION)
+
+    _reject_points(store, {poisoned})
+    stats = _index(store, state, files)
+
+    assert [chunk['metadata']['point_id'] for chunk in stats.failed_chunks] == [poisoned]
+    assert stats.files_incomplete == 1
+    assert stats.files_indexed == len(files) - 1
+    # Every other chunk was upserted and recorded, including the rest of the rejected batch
+    assert state.count_chunks(COLLECTION) == store.count(COLLECTION).count == stats.chunks_embedded
+    run = state.get_resumable_run(COLLECTION)
+    assert run['status'] == 'incomplete'
+    failures = state.get_run_failures(run['run_id'])
+    assert [failure['point_id'] for failure in failures] == [poisoned]
+    assert failures[0]['error'].startswith('Upsert failed')
+
+def test_resume_embeds_only_the_missing_chunks(tmp_path, store, state):
+    files = _write_docs(tmp_path)
+    _index(store, state, files[:1])
+    poisoned = sorted(state.get_point_ids(COLLECTION, files[0]))[0]
+    store.delete_collection(COLLECTION)
+    state.clear_collection(COLLECTION)
+    _reject_points(store, {poisoned})
+    first = _index(store, state, files)
+    total = first.chunks_embedded + len(first.failed_chunks)
+    del store.upload_collection
+
+    provider = HashingEmbeddingProvider()
+    embedded = []
+    embed = provider.embed
+
+    async def counting_embed(texts, progress=None):
+        embedded.extend(texts)
+        return await embed(texts, progress)
+    provider.embed = counting_embed
+    run = asyncio.run(resume_run(store, COLLECTION, state, provider, workers=1))
+
+    assert run is not None
+    # Only the incomplete file is processed again, and only its missing chunk is embedded
+    assert state.get_run_files(run['run_id']) == ([], [])
+    assert len(embedded) == len(first.failed_chunks)
+    assert state.get_resumable_run(COLLECTION) is None
+    assert state.count_chunks(COLLECTION) == store.count(COLLECTION).count == total
+    assert set(state.get_file_hashes(COLLECTION)) == set(files)
+
+class _RecordingLock:
+    """Stands in for the index state's lock and records the threads that take it"""
+
+    def __init__(self, lock):
+        self.lock = lock
+        self.threads = set()
+
+    def __enter__(self):
+        self.threads.add(threading.get_ident())
+        return self.lock.__enter__()
+
+    def __exit__(self, *exc):
+        return self.lock.__exit__(*exc)
+
+def test_pipeline_keeps_the_index_state_off_the_event_loop(tmp_path, store, state):
+    files = _write_docs(tmp_path)
+    _index(store, state, files[:2])
+    # One edited file, one deleted and one new
+    with open(files[0], 'a') as f:
+        f.write("\n## Appendix\n\nA new section.\n")
+    os.remove(files[1])
+    run_id = state.start_run(COLLECTION, [files[0], files[2]], [files[1]])
+    state._lock = lock = _RecordingLock(state._lock)
+
+    async def run():
+        stats = await ingest_pipeline.run_ingest_pipeline(
+            store, COLLECTION, state, [files[0], files[2]], [files[1]],
+            embedding_provider=HashingEmbeddingProvider(), workers=1, run_id=run_id
+        )
+        return stats, threading.get_ident()
+    stats, loop_thread = asyncio.run(run())
+
+    assert (stats.files_indexed, stats.files_deleted) == (2, 1)
+    assert lock.threads and loop_thread not in lock.threads
+    assert state.get_run_files(run_id) == ([], [])
@@ -0,0 +1,43 @@
+from lexical_index import chunk_terms
+from markdown_processor import chunk_markdown
+
+def test_pieces_of_an_oversized_block_keep_their_own_terms():
+    words = [f"word{i}" for i in range(3000)]
+    words[-5] = '`load_last_piece`'
+    chunks = chunk_markdown("# Guide\n\n" + ' '.join(words), target_tokens=100)
+
+    assert len(chunks) > 10
+    terms = [chunk_terms(chunk['raw'], chunk['heading_path']) for chunk in chunks]
+    # Every piece is indexed with roughly its own words, not just its heading
+    assert all(len(piece_terms) > 20 for piece_terms in terms)
+    assert sum(len(t) for t in terms) < len(chunk_terms(' '.join(words))) * 1.1
+    assert 'load_last_piece' in terms[-1]
+    assert not any('load_last_piece' in t for t in terms[:-1])
+    assert 'word0' in terms[0] and 'word0' not in terms[-1]
+
+def _words(count: int, prefix: str) -> str:
+    return ' '.join(f"{prefix}{i}" for i in range(count))
+
+def _count_words(text: str) -> int:
+    return len(text.split())
+
+def test_sections_start_new_chunks_unless_the_fragment_is_small():
+    content = (f"# Guide\n\n## Install\n\n{_words(60, 'inst')}\n\n## Usage\n\n{_words(60, 'use')}\n\n"
+               f"## Note\n\n{_words(5, 'note')}\n\n## API\n\n{_words(60, 'api')}\n\n```python\nload_config()\n```\n")
+    chunks = chunk_markdown(content, target_tokens=100, count_tokens=_count_words)
+
+    assert [chunk['heading_path'] for chunk in chunks] == [['Guide'], ['Guide', 'Usage'], ['Guide', 'Note']]
+    assert 'inst59' in chunks[0]['text'] and 'use0' not in chunks[0]['text']
+    # The short Note section starts the API chunk instead of becoming a chunk of its own
+    assert 'note4' in chunks[2]['text'] and 'api0' in chunks[2]['text']
+    # Code is left out of the embedded text but kept for the lexical index
+    assert 'load_config' not in chunks[2]['text'] and 'load_config()' in chunks[2]['raw']
+
+def test_overlap_repeats_the_trailing_blocks_of_the_section():
+    content = "# Guide\n\n" + "\n\n".join(_words(15, f"p{j}_") for j in range(12))
+    chunks = chunk_markdown(content, target_tokens=50, overlap_tokens=20, count_tokens=_count_words)
+
+    assert len(chunks) > 3
+    for previous, chunk in zip(chunks, chunks[1:]):
+        last_block = previous['text'].split('\n\n')[-1]
+        assert chunk['text'].startswith(last_block)
@@ -0,0 +1,28 @@
+from index_state import IndexState
+from qdrant_uploader import assign_point_ids, chunk_point_id, plan_chunk_updates
+
+def _chunks(file_path: str, *texts: str):
+    return [{'text': text, 'metadata': {'file_path': file_path, 'chunk_id': i}} for i, text in enumerate(texts)]
+
+def test_point_ids_derive_from_content():
+    first = assign_point_ids('docs', _chunks('a.md', 'intro', 'boilerplate', 'usage', 'boilerplate'))
+    ids = [chunk['metadata']['point_id'] for chunk in first]
+    # Repeated text within a file gets its own point
+    assert len(set(ids)) == 4
+    # Inserting a chunk shifts chunk IDs but keeps the points of unchanged text
+    second = assign_point_ids('docs', _chunks('a.md', 'new', 'intro', 'boilerplate', 'usage', 'boilerplate'))
+    assert [chunk['metadata']['point_id'] for chunk in second[1:]] == ids
+    assert ids[0] != chunk_point_id('other', 'a.md', first[0]['metadata']['chunk_hash'])
+    assert ids[0] != chunk_point_id('docs', 'b.md', first[0]['metadata']['chunk_hash'])
+
+def test_plan_splits_new_retained_and_stale_chunks(tmp_path):
+    state = IndexState(str(tmp_path / 'state.sqlite'))
+    old = assign_point_ids('docs', _chunks('a.md', 'intro', 'install', 'usage'))
+    with state.transaction():
+        state.add_chunks('docs', [(c['metadata']['point_id'], 'a.md', c['metadata']['chunk_id'], None) for c in old])
+
+    new_chunks, retained, stale = plan_chunk_updates(state, 'docs', _chunks('a.md', 'intro', 'usage', 'faq'),
+                                                     {'a.md'})
+    assert [chunk['text'] for chunk in new_chunks] == ['faq']
+    assert [chunk['text'] for chunk in retained] == ['intro', 'usage']
+    assert stale == {'a.md': [old[1]['metadata']['point_id']]}
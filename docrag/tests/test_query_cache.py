@@ -0,0 +1,45 @@
+from query_cache import QueryCache
+
+def test_query_vectors_are_cached_by_normalized_text():
+    cache = QueryCache(max_queries=2)
+    embedded = []
+
+    def embed(query):
+        embedded.append(query)
+        return [float(len(embedded))]
+
+    assert cache.get_vector('How to  Install', embed) == [1.0]
+    assert cache.get_vector('how to install', embed) == [1.0]
+    assert embedded == ['How to  Install']
+    # Uncached queries of a batch are embedded with one call
+    calls = []
+    vectors = cache.get_vectors(['how to install', 'usage', 'api'],
+                                lambda queries: calls.append(queries) or [[2.0], [3.0]])
+    assert calls == [['usage', 'api']] and vectors == [[1.0], [2.0], [3.0]]
+    # At most `max_queries` vectors are kept, least recently used first out
+    assert cache.get_vector('how to install', embed) == [2.0]
+    assert embedded == ['How to  Install', 'how to install']
+
+def test_results_are_dropped_when_the_collection_version_changes():
+    versions = {'docs': 1}
+    cache = QueryCache(version_source=versions.get, version_check_interval=0)
+    searches = []
+
+    def search():
+        searches.append(1)
+        return [f"result {len(searches)}"]
+
+    assert cache.get_results('docs', 'install', 5, None, search) == ['result 1']
+    assert cache.get_results('docs', ' Install ', 5, None, search) == ['result 1']
+    # Another limit or filter is another entry
+    assert cache.get_results('docs', 'install', 10, None, search) == ['result 2']
+    versions['docs'] = 2
+    assert cache.get_results('docs', 'install', 5, None, search) == ['result 3']
+    assert cache.report()['result_hits'] == 1
+
+def test_results_expire_after_their_ttl():
+    cache = QueryCache(result_ttl=0)
+    searches = []
+    cache.get_results('docs', 'install', 5, None, lambda: searches.append(1))
+    cache.get_results('docs', 'install', 5, None, lambda: searches.append(1))
+    assert len(searches) == 2
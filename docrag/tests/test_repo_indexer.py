@@ -0,0 +1,81 @@
+import asyncio
+
+import pytest
+
+import embedding_providers
+from embedding_providers import EmbeddingMismatch, HashingEmbeddingProvider
+from index_state import IndexState
+from qdrant_query_interface import async_search_qdrant, search_qdrant, search_qdrant_batch
+from collection_profiles import get_collection_profile
+from repo_indexer import index_markdown_files, migrate_collection_profile, prepare_collection
+from vector_store import connect_vector_store
+
+COLLECTION = 'docs'
+
+@pytest.fixture
+def indexed(tmp_path):
+    path = tmp_path / 'guide.md'
+    path.write_text("# Guide\n\n## Install\n\n" + "Run pip install docrag in a virtual environment. " * 40 +
+                    "\n\n## Search\n\n" + "Query the collection with a question to find passages. " * 40 +
+                    "\n\n## Configuration\n\n" + "Settings are read by `load_settings` from the environment. " * 40 +
+                    "\n")
+    store = connect_vector_store(f"local:{tmp_path / 'vectors'}")
+    state = IndexState(str(tmp_path / 'state.sqlite'))
+    asyncio.run(index_markdown_files(store, COLLECTION, state, [str(path)], [],
+                                     embedding_provider=HashingEmbeddingProvider(), workers=1))
+    return store, state
+
+def test_mismatched_provider_keeps_the_collection_unless_rebuilding(indexed):
+    store, state = indexed
+    points = store.count(COLLECTION).count
+    other = HashingEmbeddingProvider(dimension=128)
+
+    with pytest.raises(EmbeddingMismatch, match='hashing:hashing-384.*hashing:hashing-128'):
+        prepare_collection(store, COLLECTION, state, other, state.get_collection_info(COLLECTION))
+    assert store.count(COLLECTION).count == points
+    assert state.count_chunks(COLLECTION) == points
+
+    assert prepare_collection(store, COLLECTION, state, other, state.get_collection_info(COLLECTION), rebuild=True)
+    assert COLLECTION not in {c.name for c in store.get_collections().collections}
+    assert state.count_chunks(COLLECTION) == 0
+
+def test_search_refuses_a_mismatched_provider(indexed, monkeypatch):
+    store, state = indexed
+    monkeypatch.setattr(embedding_providers, '_default_provider', HashingEmbeddingProvider())
+    assert search_qdrant(store, COLLECTION, 'install', limit=1, state=state)
+
+    monkeypatch.setattr(embedding_providers, '_default_provider', HashingEmbeddingProvider(dimension=128))
+    with pytest.raises(EmbeddingMismatch):
+        search_qdrant(store, COLLECTION, 'install', limit=1, state=state)
+    with pytest.raises(EmbeddingMismatch):
+        search_qdrant_batch(store, COLLECTION, ['install'], limit=1, state=state)
+    with pytest.raises(EmbeddingMismatch):
+        asyncio.run(async_search_qdrant(store, COLLECTION, 'install', limit=1, state=state))
+
+class _NoQueryEmbedding(HashingEmbeddingProvider):
+    def embed_query(self, query):
+        raise AssertionError("the query should not be embedded")
+
+def test_hybrid_search_answers_identifiers_lexically(indexed, monkeypatch):
+    store, state = indexed
+    assert state.count_chunks(COLLECTION) == 3
+    monkeypatch.setattr(embedding_providers, '_default_provider', _NoQueryEmbedding())
+    results = search_qdrant(store, COLLECTION, 'load_settings', limit=3, state=state)
+    # Inline code is left out of the embedded text, but found through the lexical index
+    assert len(results) == 1 and 'Settings are read by' in results[0].payload['text']
+
+    monkeypatch.setattr(embedding_providers, '_default_provider', HashingEmbeddingProvider())
+    # Vector and BM25 rankings are fused; the section about installing comes first
+    results = search_qdrant(store, COLLECTION, 'how do I pip install it', limit=3, state=state)
+    assert 'pip install' in results[0].payload['text']
+    assert len({result.id for result in results}) == 3
+
+def test_collections_are_migrated_to_the_configured_profile(indexed, monkeypatch):
+    store, state = indexed
+    info = state.get_collection_info(COLLECTION)
+    assert info['qdrant_profile'] == get_collection_profile('default').signature()
+
+    monkeypatch.setenv('DOCRAG_QDRANT_PROFILE', 'memory')
+    migrate_collection_profile(store, COLLECTION, state, info)
+    assert state.get_collection_info(COLLECTION)['qdrant_profile'] == get_collection_profile('memory').signature()
+    assert {'file_path', 'file_hash'} <= set(store.get_collection(COLLECTION).payload_schema)
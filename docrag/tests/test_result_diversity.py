@@ -0,0 +1,47 @@
+import numpy as np
+
+from near_duplicates import collapse_near_duplicates, minhash_similarity, text_minhash
+from result_diversity import diversify_results, merge_adjacent_chunks, mmr_select
+from vector_store import ScoredPoint
+
+TEXT = ("Install the package with pip, then create a client with your API key and call search "
+        "with the collection name and a query string to get the best matching chunks back.")
+
+def _point(i, score, text=TEXT, vector=None, **payload):
+    return ScoredPoint(id=str(i), score=score, payload={'text': text, **payload}, vector=vector)
+
+def test_near_duplicates_collapse_to_the_best_ranked():
+    copy = TEXT.replace("best matching", "best-matching")
+    other = "Configure logging through the standard library and set the level to debug for request traces."
+    assert minhash_similarity(text_minhash(TEXT), text_minhash(copy)) >= 0.8
+    assert minhash_similarity(text_minhash(TEXT), text_minhash(other)) < 0.3
+
+    results = [_point(0, 0.9), _point(1, 0.8, other), _point(2, 0.7, copy)]
+    assert [r.id for r in collapse_near_duplicates(results)] == ['0', '1']
+    # A signature stored in the payload is used instead of the text
+    results = [_point(0, 0.9, minhash=text_minhash(other)), _point(1, 0.8, other)]
+    assert [r.id for r in collapse_near_duplicates(results)] == ['0']
+
+def test_mmr_trades_relevance_for_novelty():
+    vectors = np.asarray([[1, 0, 0], [0.99, 0.1, 0], [0, 1, 0], [0, 0, 1]], dtype=np.float32)
+    relevance = np.asarray([1.0, 0.95, 0.6, 0.5])
+    assert mmr_select(relevance, vectors, 3, mmr_lambda=1.0) == [0, 1, 2]
+    assert mmr_select(relevance, vectors, 3, mmr_lambda=0.5) == [0, 2, 3]
+    assert mmr_select(relevance, vectors, 0) == []
+
+def test_diversified_results_drop_their_vectors():
+    texts = [f"Distinct passage number {i} about topic {i} with enough words to shingle." for i in range(4)]
+    vectors = [[1, 0, 0], [0.99, 0.1, 0], [0, 1, 0], [0, 0, 1]]
+    results = [_point(i, 1.0 - i / 10, texts[i], vectors[i]) for i in range(4)]
+    picked = diversify_results(results, 2, mmr_lambda=0.5)
+    assert [r.id for r in picked] == ['0', '2']
+    assert all(r.vector is None for r in picked)
+
+def test_adjacent_chunks_of_a_file_are_merged():
+    results = [_point(0, 0.9, 'second', file_path='a.md', chunk_id=2),
+               _point(1, 0.8, 'other', file_path='b.md', chunk_id=2),
+               _point(2, 0.7, 'first', file_path='a.md', chunk_id=1),
+               _point(3, 0.6, 'far', file_path='a.md', chunk_id=7)]
+    merged = merge_adjacent_chunks(results)
+    assert [r.payload['text'] for r in merged] == ['first\n\nsecond', 'other', 'far']
+    assert merged[0].payload['chunk_ids'] == [1, 2] and merged[0].score == 0.9
@@ -0,0 +1,131 @@
+import os
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from index_state import IndexState
+from site_crawler import SiteCrawler, url_to_path
+
+def _page(title: str, *links: str) -> bytes:
+    anchors = ''.join(f'<a href="{link}">{link}</a>' for link in links)
+    return (f"<html><head><title>{title}</title></head><body><nav>{anchors}</nav>"
+            f"<main><h1>{title}</h1><p>About {title}.</p>{anchors}</main></body></html>").encode()
+
+def _sitemap(tag: str, *urls: str) -> bytes:
+    inner = 'sitemap' if tag == 'sitemapindex' else 'url'
+    locs = ''.join(f"<{inner}><loc>{url}</loc></{inner}>" for url in urls)
+    return f'<?xml version="1.0"?><{tag} xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">{locs}</{tag}>'.encode()
+
+class _Handler(BaseHTTPRequestHandler):
+    """Serves `server.routes`: path -> (status, headers, body); answers If-None-Match with 304"""
+
+    def _respond(self, send_body: bool):
+        self.server.requests.append((self.command, self.path, self.headers.get('If-None-Match')))
+        status, headers, body = self.server.routes.get(self.path, (404, {}, b''))
+        if status == 200 and headers.get('ETag') and self.headers.get('If-None-Match') == headers['ETag']:
+            status, body = 304, b''
+        self.send_response(status)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if send_body:
+            self.wfile.write(body)
+
+    def do_GET(self):
+        self._respond(True)
+
+    def do_HEAD(self):
+        self._respond(False)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def site():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+    server.routes, server.requests = {}, []
+    server.url = f"http://127.0.0.1:{server.server_address[1]}"
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def _serve_docs(site):
+    html = {'Content-Type': 'text/html; charset=utf-8'}
+    site.routes.update({
+        # The project root redirects to its default version
+        '/': (302, {'Location': '/docs/latest/'}, b''),
+        '/docs/latest/': (200, {**html, 'ETag': '"index-1"'},
+                          _page('Home', 'guide.html', 'removed.html', '/docs/v1/old.html', 'logo.png')),
+        '/docs/latest/guide.html': (200, {**html, 'ETag': '"guide-1"'}, _page('Guide', 'index.html')),
+        '/docs/latest/removed.html': (200, html, _page('Removed')),
+        # Only listed in the sitemap
+        '/docs/latest/orphan.html': (200, html, _page('Orphan')),
+        '/docs/v1/old.html': (200, html, _page('Old')),
+        '/docs/latest/sitemap.xml': (200, {'Content-Type': 'application/xml'},
+                                     _sitemap('sitemapindex', f"{site.url}/docs/latest/sitemap-pages.xml")),
+        '/docs/latest/sitemap-pages.xml': (200, {'Content-Type': 'application/xml'},
+                                           _sitemap('urlset', f"{site.url}/docs/latest/orphan.html",
+                                                    f"{site.url}/docs/v1/old.html")),
+    })
+
+def _crawl(site, tmp_path, state):
+    crawler = SiteCrawler(f"{site.url}/", str(tmp_path / 'site'), state, 'docs')
+    return crawler, asyncio.run(crawler.crawl())
+
+def test_first_crawl_follows_redirect_scope_and_sitemap_index(site, tmp_path):
+    _serve_docs(site)
+    state = IndexState(str(tmp_path / 'state.sqlite'))
+    crawler, result = _crawl(site, tmp_path, state)
+
+    assert crawler.scope == (f"127.0.0.1:{site.server_address[1]}", '/docs/latest/')
+    pages = {f"{site.url}/docs/latest/{name}" for name in ('', 'guide.html', 'removed.html', 'orphan.html')}
+    assert set(state.get_pages('docs')) == pages
+    assert sorted(result.changed) == sorted(url_to_path(url, str(tmp_path / 'site')) for url in pages)
+    assert not result.failed and not result.deleted
+    fetched = {path for method, path, _ in site.requests if method == 'GET'}
+    assert '/docs/v1/old.html' not in fetched
+    assert '/docs/latest/logo.png' not in fetched
+    with open(url_to_path(f"{site.url}/docs/latest/guide.html", str(tmp_path / 'site'))) as f:
+        assert f.read().startswith('# Guide\n')
+
+def test_refresh_revalidates_and_removes_gone_pages(site, tmp_path):
+    _serve_docs(site)
+    state = IndexState(str(tmp_path / 'state.sqlite'))
+    _crawl(site, tmp_path, state)
+
+    site.routes['/docs/latest/removed.html'] = (410, {}, b'')
+    del site.routes['/docs/latest/orphan.html']
+    site.requests.clear()
+    _, result = _crawl(site, tmp_path, state)
+
+    # Pages with an ETag are revalidated and not downloaded again
+    assert ('GET', '/docs/latest/guide.html', '"guide-1"') in site.requests
+    assert result.not_modified == 2
+    assert result.changed == []
+    removed = {url_to_path(f"{site.url}/docs/latest/{name}", str(tmp_path / 'site'))
+               for name in ('removed.html', 'orphan.html')}
+    assert set(result.deleted) == removed
+    assert not any(os.path.exists(path) for path in removed)
+    assert set(state.get_pages('docs')) == {f"{site.url}/docs/latest/", f"{site.url}/docs/latest/guide.html"}
+
+def test_changed_page_is_rewritten(site, tmp_path):
+    _serve_docs(site)
+    state = IndexState(str(tmp_path / 'state.sqlite'))
+    _crawl(site, tmp_path, state)
+
+    site.routes['/docs/latest/guide.html'] = (200, {'Content-Type': 'text/html', 'ETag': '"guide-2"'},
+                                              _page('Guide', 'index.html', 'new.html'))
+    site.routes['/docs/latest/new.html'] = (200, {'Content-Type': 'text/html'}, _page('New'))
+    _, result = _crawl(site, tmp_path, state)
+
+    site_dir = str(tmp_path / 'site')
+    assert set(result.changed) == {url_to_path(f"{site.url}/docs/latest/guide.html", site_dir),
+                                   url_to_path(f"{site.url}/docs/latest/new.html", site_dir)}
+    # Pages without an ETag are downloaded again, but unchanged content is not rewritten
+    assert result.unchanged == 2
+    assert state.get_pages('docs')[f"{site.url}/docs/latest/guide.html"]['etag'] == '"guide-2"'
@@ -0,0 +1,54 @@
+import asyncio
+import threading
+
+import numpy as np
+from qdrant_client.models import Distance, FieldCondition, Filter, MatchValue, PointIdsList, VectorParams
+
+from vector_store import AsyncLocalVectorStore, LocalVectorStore
+
+def _store(tmp_path, points: int = 200, **kwargs) -> LocalVectorStore:
+    store = LocalVectorStore(str(tmp_path / 'vectors'), **kwargs)
+    store.create_collection('docs', VectorParams(size=16, distance=Distance.COSINE), initial_capacity=8)
+    vectors = np.random.default_rng(0).normal(size=(points, 16)).astype(np.float32)
+    store.upload_collection('docs', vectors, payload=[{'file_path': f"f{i % 4}.md"} for i in range(points)],
+                            ids=list(range(points)))
+    return store
+
+def test_search_ranks_live_points_and_applies_filters(tmp_path):
+    store = _store(tmp_path)
+    query = store.retrieve('docs', [7], with_vectors=True)[0].vector
+
+    results = store.search('docs', query, limit=5)
+    assert results[0].id == '7' and abs(results[0].score - 1) < 1e-5
+    assert [r.score for r in results] == sorted((r.score for r in results), reverse=True)
+
+    store.delete('docs', PointIdsList(points=[7]))
+    assert '7' not in {r.id for r in store.search('docs', query, limit=5)}
+    filtered = store.search('docs', query, limit=10,
+                            query_filter=Filter(must=[FieldCondition(key='file_path', match=MatchValue(value='f1.md'))]))
+    assert len(filtered) == 10 and all(r.payload['file_path'] == 'f1.md' for r in filtered)
+
+def test_non_positive_limits_return_no_results(tmp_path):
+    store = _store(tmp_path)
+    assert store.search('docs', [1.0] * 16, limit=0) == []
+    assert store.search('docs', [1.0] * 16, limit=-3) == []
+
+def test_ivf_search_finds_the_nearest_point(tmp_path):
+    store = _store(tmp_path, points=2000, ivf_min_points=500, nprobe=4)
+    query = store.retrieve('docs', [1234], with_vectors=True)[0].vector
+    assert store.search('docs', query, limit=1)[0].id == '1234'
+    assert store.count('docs').count == 2000
+
+def test_async_search_runs_on_a_worker_thread(tmp_path):
+    store = _store(tmp_path)
+    threads = []
+    search = store.search
+
+    def recording_search(*args, **kwargs):
+        threads.append(threading.get_ident())
+        return search(*args, **kwargs)
+    store.search = recording_search
+
+    results = asyncio.run(AsyncLocalVectorStore(store).search('docs', [1.0] * 16, limit=3))
+    assert len(results) == 3
+    assert threads and threads[0] != threading.get_ident()
@@ -0,0 +1,24 @@
+from typing import Callable
+
+try:
+    import tiktoken
+except ImportError:  # pragma: no cover - optional dependency
+    tiktoken = None
+
+_counters = {}
+
+def make_token_counter(model: str = "text-embedding-ada-002") -> Callable[[str], int]:
+    """Exact token counts with tiktoken when available, ~4 characters per token otherwise"""
+    if model in _counters:
+        return _counters[model]
+    counter = None
+    if tiktoken is not None:
+        try:
+            encoding = tiktoken.encoding_for_model(model)
+            counter = lambda text: len(encoding.encode(text, disallowed_special=()))
+        except KeyError:
+            pass
+    if counter is None:
+        counter = lambda text: len(text) // 4 + 1
+    _counters[model] = counter
+    return counter
@@ -0,0 +1,625 @@
+import os
+import json
+import shutil
+import sqlite3
+import asyncio
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - optional dependency
+    np = None
+
+DEFAULT_QDRANT_ADDRESS = "localhost:6333"
+
+@dataclass
+class CollectionDescription:
+    name: str
+
+@dataclass
+class CollectionsResponse:
+    collections: List[CollectionDescription]
+
+@dataclass
+class CollectionInfo:
+    points_count: int
+    payload_schema: Dict[str, str]
+    # Writes are applied synchronously, so the collection is always optimized
+    status: str = "green"
+
+@dataclass
+class CountResult:
+    count: int
+
+@dataclass
+class Record:
+    id: str
+    payload: Optional[Dict] = None
+    vector: Optional[List[float]] = None
+
+@dataclass
+class ScoredPoint:
+    id: str
+    score: float
+    payload: Optional[Dict] = None
+    vector: Optional[List[float]] = None
+    version: int = 0
+
+@dataclass
+class _Collection:
+    """Open files of one local collection"""
+    path: str
+    dimension: int
+    distance: str
+    count: int
+    capacity: int
+    vectors: Any = None
+    alive: Any = None
+    db: Optional[sqlite3.Connection] = None
+    ivf: Optional[Dict] = None
+    ivf_dirty: bool = False
+    meta: Dict = field(default_factory=dict)
+
+class LocalVectorStore:
+    """Embedded, single-process vector store with the subset of the QdrantClient API docrag uses.
+
+    Each collection is a directory holding the vectors as a float32 matrix in
+    a memory-mapped file (normalized for cosine distance), a matching
+    memory-mapped byte per row marking live points, and a SQLite sidecar
+    with the point IDs and JSON payloads. Opening a collection maps the
+    files without reading them.
+
+    Search is a brute-force matrix product over the live rows. Collections
+    with at least `ivf_min_points` points are searched through an IVF index
+    instead: k-means centroids over the vectors, and only the rows in the
+    `nprobe` lists nearest to the query are scored. Filters on payload
+    fields (`must` / `must_not` with MatchValue or MatchAny) are resolved in
+    the sidecar before scoring.
+    """
+
+    def __init__(self, path: str, ivf_min_points: int = 50_000, nprobe: int = 8):
+        if np is None:
+            raise ImportError("The local vector store requires numpy")
+        self.path = path
+        self.ivf_min_points = ivf_min_points
+        self.nprobe = nprobe
+        self._collections: Dict[str, _Collection] = {}
+        self._lock = threading.RLock()
+        os.makedirs(path, exist_ok=True)
+
+    # Collections
+
+    def _collection_path(self, collection_name: str) -> str:
+        return os.path.join(self.path, collection_name)
+
+    def _open(self, collection_name: str) -> _Collection:
+        collection = self._collections.get(collection_name)
+        if collection is not None:
+            return collection
+        path = self._collection_path(collection_name)
+        meta_path = os.path.join(path, "meta.json")
+        if not os.path.exists(meta_path):
+            raise ValueError(f"Collection {collection_name} not found")
+        with open(meta_path) as f:
+            meta = json.load(f)
+        db = sqlite3.connect(os.path.join(path, "payloads.sqlite"), isolation_level=None, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        # Rows written after the last metadata update are still valid
+        max_row = db.execute("SELECT MAX(row) FROM points").fetchone()[0]
+        count = max(meta['count'], max_row + 1 if max_row is not None else 0)
+        collection = _Collection(
+            path=path, dimension=meta['dimension'], distance=meta['distance'],
+            count=count, capacity=meta['capacity'], db=db, meta=meta
+        )
+        self._map(collection)
+        ivf_path = os.path.join(path, "ivf.npz")
+        if os.path.exists(ivf_path):
+            with np.load(ivf_path) as ivf:
+                collection.ivf = {key: ivf[key] for key in ivf.files}
+        self._collections[collection_name] = collection
+        return collection
+
+    def _map(self, collection: _Collection):
+        collection.vectors = np.memmap(os.path.join(collection.path, "vectors.f32"), dtype=np.float32, mode='r+',
+                                       shape=(collection.capacity, collection.dimension))
+        collection.alive = np.memmap(os.path.join(collection.path, "alive.u8"), dtype=np.uint8, mode='r+',
+                                     shape=(collection.capacity,))
+
+    def _grow(self, collection: _Collection, rows: int):
+        """Extend the mapped files to hold at least `rows` rows"""
+        capacity = collection.capacity
+        while capacity < rows:
+            capacity *= 2
+        collection.vectors.flush()
+        collection.alive.flush()
+        collection.vectors = collection.alive = None
+        for name, row_bytes in (("vectors.f32", collection.dimension * 4), ("alive.u8", 1)):
+            with open(os.path.join(collection.path, name), "r+b") as f:
+                f.truncate(capacity * row_bytes)
+        collection.capacity = capacity
+        self._map(collection)
+
+    def _write_meta(self, collection: _Collection):
+        collection.meta.update(
+            dimension=collection.dimension, distance=collection.distance,
+            count=collection.count, capacity=collection.capacity
+        )
+        tmp_path = os.path.join(collection.path, "meta.json.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(collection.meta, f)
+        os.replace(tmp_path, os.path.join(collection.path, "meta.json"))
+
+    def get_collections(self) -> CollectionsResponse:
+        names = sorted(
+            name for name in os.listdir(self.path)
+            if os.path.exists(os.path.join(self._collection_path(name), "meta.json"))
+        )
+        return CollectionsResponse(collections=[CollectionDescription(name=name) for name in names])
+
+    def collection_exists(self, collection_name: str) -> bool:
+        return os.path.exists(os.path.join(self._collection_path(collection_name), "meta.json"))
+
+    def create_collection(self, collection_name: str, vectors_config, initial_capacity: int = 1024, **kwargs) -> bool:
+        distance = str(getattr(vectors_config.distance, 'value', vectors_config.distance)).lower()
+        if distance not in ("cosine", "dot"):
+            raise ValueError(f"Unsupported distance for the local vector store: {distance}")
+        with self._lock:
+            if self.collection_exists(collection_name):
+                raise ValueError(f"Collection {collection_name} already exists")
+            path = self._collection_path(collection_name)
+            os.makedirs(path, exist_ok=True)
+            for name, row_bytes in (("vectors.f32", vectors_config.size * 4), ("alive.u8", 1)):
+                with open(os.path.join(path, name), "wb") as f:
+                    f.truncate(initial_capacity * row_bytes)
+            db = sqlite3.connect(os.path.join(path, "payloads.sqlite"))
+            db.execute("CREATE TABLE IF NOT EXISTS points (id TEXT PRIMARY KEY, row INTEGER UNIQUE NOT NULL, payload TEXT)")
+            db.commit()
+            db.close()
+            collection = _Collection(path=path, dimension=vectors_config.size, distance=distance,
+                                     count=0, capacity=initial_capacity)
+            self._write_meta(collection)
+        return True
+
+    def delete_collection(self, collection_name: str, **kwargs) -> bool:
+        with self._lock:
+            collection = self._collections.pop(collection_name, None)
+            if collection is not None:
+                collection.db.close()
+                collection.vectors = collection.alive = None
+            path = self._collection_path(collection_name)
+            if not os.path.exists(path):
+                return False
+            shutil.rmtree(path)
+        return True
+
+    def recreate_collection(self, collection_name: str, vectors_config, **kwargs) -> bool:
+        self.delete_collection(collection_name)
+        return self.create_collection(collection_name, vectors_config, **kwargs)
+
+    def get_collection(self, collection_name: str, **kwargs) -> CollectionInfo:
+        with self._lock:
+            collection = self._open(collection_name)
+            indexes = [name for (name,) in collection.db.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'index' AND name LIKE 'payload\\_%' ESCAPE '\\'"
+            )]
+            return CollectionInfo(
+                points_count=collection.db.execute("SELECT COUNT(*) FROM points").fetchone()[0],
+                payload_schema={name[len('payload_'):]: 'keyword' for name in indexes}
+            )
+
+    def create_payload_index(self, collection_name: str, field_name: str, field_schema=None, **kwargs):
+        """Index a payload field in the sidecar, which speeds up filtered deletes and searches"""
+        if not field_name.isidentifier():
+            raise ValueError(f"Unsupported payload field name: {field_name}")
+        with self._lock:
+            collection = self._open(collection_name)
+            collection.db.execute(
+                f"CREATE INDEX IF NOT EXISTS payload_{field_name} ON points (json_extract(payload, '$.{field_name}'))"
+            )
+
+    def update_collection(self, collection_name: str, optimizers_config=None, **kwargs) -> bool:
+        """Quantization, HNSW and on-disk settings do not apply to the local store;
+        an optimizers config (even an empty one) compacts the collection"""
+        self._open(collection_name)
+        if optimizers_config is not None:
+            self.compact(collection_name)
+        return True
+
+    def compact(self, collection_name: str) -> int:
+        """Move the live points to the front of the map and shrink the files to fit them.
+
+        Deleted rows are reused by later upserts, but after large deletions the
+        files keep their size until compacted. Returns the number of rows freed.
+        """
+        with self._lock:
+            collection = self._open(collection_name)
+            points = collection.db.execute("SELECT id, row FROM points ORDER BY row").fetchall()
+            live = np.asarray([row for _, row in points], dtype=np.intp)
+            freed = collection.count - len(live)
+            if live.size:
+                collection.vectors[:len(live)] = collection.vectors[live]
+            collection.alive[:len(live)] = 1
+            collection.alive[len(live):collection.count] = 0
+            # Rows only move down, so updating in ascending order never collides
+            collection.db.execute("BEGIN IMMEDIATE")
+            collection.db.executemany("UPDATE points SET row = ? WHERE id = ?",
+                                      ((new_row, point_id) for new_row, (point_id, _) in enumerate(points)))
+            collection.db.execute("COMMIT")
+            collection.count = len(live)
+
+            capacity = 1024
+            while capacity < collection.count:
+                capacity *= 2
+            collection.vectors.flush()
+            collection.alive.flush()
+            if capacity < collection.capacity:
+                collection.vectors = collection.alive = None
+                for name, row_bytes in (("vectors.f32", collection.dimension * 4), ("alive.u8", 1)):
+                    with open(os.path.join(collection.path, name), "r+b") as f:
+                        f.truncate(capacity * row_bytes)
+                collection.capacity = capacity
+                self._map(collection)
+            self._write_meta(collection)
+
+            # Row numbers changed: the IVF assignments are rebuilt on the next search that needs them
+            collection.ivf = None
+            ivf_path = os.path.join(collection.path, "ivf.npz")
+            if os.path.exists(ivf_path):
+                os.remove(ivf_path)
+            return freed
+
+    def count(self, collection_name: str, **kwargs) -> CountResult:
+        with self._lock:
+            collection = self._open(collection_name)
+            return CountResult(count=collection.db.execute("SELECT COUNT(*) FROM points").fetchone()[0])
+
+    # Points
+
+    def _normalize(self, collection: _Collection, vectors: "np.ndarray") -> "np.ndarray":
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if vectors.shape[-1] != collection.dimension:
+            raise ValueError(f"Vector dimension {vectors.shape[-1]} does not match collection dimension {collection.dimension}")
+        if collection.distance == "cosine":
+            norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+            vectors = vectors / np.maximum(norms, 1e-12)
+        return vectors
+
+    def _rows_for_ids(self, collection: _Collection, ids: Sequence[str]) -> Dict[str, int]:
+        rows = {}
+        for i in range(0, len(ids), 500):
+            part = list(ids[i:i + 500])
+            placeholders = ','.join('?' * len(part))
+            rows.update(collection.db.execute(f"SELECT id, row FROM points WHERE id IN ({placeholders})", part))
+        return rows
+
+    def upsert(self, collection_name: str, points, wait: bool = True, **kwargs):
+        self._upsert(collection_name, [str(point.id) for point in points], [point.vector for point in points],
+                     [point.payload for point in points], wait)
+
+    def upload_collection(self, collection_name: str, vectors, payload=None, ids=None, wait: bool = True, **kwargs):
+        """Qdrant's bulk upload: `vectors` may be an (n, dimension) matrix, which is written to the map as is"""
+        ids = [str(point_id) for point_id in ids]
+        payloads = list(payload) if payload is not None else [None] * len(ids)
+        self._upsert(collection_name, ids, vectors, payloads, wait)
+
+    def _upsert(self, collection_name: str, ids: List[str], vectors, payloads: List[Optional[Dict]], wait: bool):
+        with self._lock:
+            collection = self._open(collection_name)
+            existing = self._rows_for_ids(collection, ids)
+            free_rows = iter(np.flatnonzero(collection.alive[:collection.count] == 0).tolist())
+            rows, assigned = [], {}
+            for point_id in ids:
+                row = existing.get(point_id, assigned.get(point_id))
+                if row is None:
+                    row = next(free_rows, None)
+                    if row is None:
+                        row = collection.count
+                        collection.count += 1
+                    assigned[point_id] = row
+                rows.append(row)
+            if collection.count > collection.capacity:
+                self._grow(collection, collection.count)
+
+            vectors = self._normalize(collection, vectors)
+            row_index = np.asarray(rows, dtype=np.intp)
+            collection.vectors[row_index] = vectors
+            collection.alive[row_index] = 1
+            if collection.ivf is not None:
+                self._ivf_assign(collection, row_index, vectors)
+            if wait:
+                collection.vectors.flush()
+                collection.alive.flush()
+
+            collection.db.execute("BEGIN IMMEDIATE")
+            try:
+                collection.db.executemany(
+                    "INSERT OR REPLACE INTO points (id, row, payload) VALUES (?, ?, ?)",
+                    ((point_id, row, json.dumps(payload or {})) for point_id, row, payload in zip(ids, rows, payloads))
+                )
+            except BaseException:
+                collection.db.execute("ROLLBACK")
+                raise
+            collection.db.execute("COMMIT")
+            self._write_meta(collection)
+
+    def _filter_rows(self, collection: _Collection, query_filter) -> "np.ndarray":
+        """Rows of points whose payload matches a Filter of MatchValue / MatchAny conditions"""
+        clauses, params = [], []
+        for conditions, negate in ((getattr(query_filter, 'must', None), False),
+                                   (getattr(query_filter, 'must_not', None), True)):
+            for condition in conditions or []:
+                match = condition.match
+                values = getattr(match, 'any', None)
+                if values is None:
+                    values = [match.value]
+                if not condition.key.isidentifier():
+                    raise ValueError(f"Unsupported payload field name: {condition.key}")
+                placeholders = ','.join('?' * len(values))
+                # The path is inlined so that payload indexes on the same expression are used
+                clause = f"json_extract(payload, '$.{condition.key}') IN ({placeholders})"
+                clauses.append(f"NOT ({clause})" if negate else clause)
+                params.extend(values)
+        if getattr(query_filter, 'should', None):
+            raise NotImplementedError("The local vector store supports must and must_not filters only")
+        where = " AND ".join(clauses) or "1"
+        return np.fromiter((row for (row,) in collection.db.execute(f"SELECT row FROM points WHERE {where}", params)),
+                           dtype=np.intp)
+
+    def delete(self, collection_name: str, points_selector, wait: bool = True, **kwargs):
+        with self._lock:
+            collection = self._open(collection_name)
+            point_ids = getattr(points_selector, 'points', None)
+            if point_ids is not None:
+                rows = np.fromiter(self._rows_for_ids(collection, [str(i) for i in point_ids]).values(), dtype=np.intp)
+            else:
+                rows = self._filter_rows(collection, getattr(points_selector, 'filter', points_selector))
+            if not len(rows):
+                return
+            collection.alive[rows] = 0
+            collection.alive.flush()
+            collection.db.execute("BEGIN IMMEDIATE")
+            collection.db.executemany("DELETE FROM points WHERE row = ?", ((int(row),) for row in rows))
+            collection.db.execute("COMMIT")
+
+    def set_payload(self, collection_name: str, payload: Dict, points, wait: bool = True, **kwargs):
+        with self._lock:
+            collection = self._open(collection_name)
+            point_ids = getattr(points, 'points', points)
+            collection.db.execute("BEGIN IMMEDIATE")
+            collection.db.executemany(
+                "UPDATE points SET payload = json_patch(payload, ?) WHERE id = ?",
+                ((json.dumps(payload), str(point_id)) for point_id in point_ids)
+            )
+            collection.db.execute("COMMIT")
+
+    def batch_update_points(self, collection_name: str, update_operations, wait: bool = True, **kwargs) -> List:
+        """Apply set-payload and delete operations in order"""
+        for operation in update_operations:
+            if getattr(operation, 'set_payload', None) is not None:
+                self.set_payload(collection_name, operation.set_payload.payload, operation.set_payload.points)
+            elif getattr(operation, 'delete', None) is not None:
+                self.delete(collection_name, operation.delete)
+            else:
+                raise NotImplementedError("The local vector store supports set_payload and delete operations only")
+        return []
+
+    def scroll(self, collection_name: str, limit: int = 10, offset: Optional[str] = None,
+               with_payload: bool = True, with_vectors: bool = False, **kwargs) -> Tuple[List[Record], Optional[str]]:
+        with self._lock:
+            collection = self._open(collection_name)
+            rows = collection.db.execute(
+                "SELECT id, row, payload FROM points WHERE id >= ? ORDER BY id LIMIT ?", (offset or "", limit + 1)
+            ).fetchall()
+            records = [
+                Record(
+                    id=point_id,
+                    payload=json.loads(payload) if with_payload else None,
+                    vector=collection.vectors[row].tolist() if with_vectors else None
+                )
+                for point_id, row, payload in rows[:limit]
+            ]
+        next_offset = rows[limit][0] if len(rows) > limit else None
+        return records, next_offset
+
+    def retrieve(self, collection_name: str, ids: Sequence, with_payload: bool = True,
+                 with_vectors: bool = False, **kwargs) -> List[Record]:
+        with self._lock:
+            collection = self._open(collection_name)
+            ids = [str(point_id) for point_id in ids]
+            records = []
+            for i in range(0, len(ids), 500):
+                part = ids[i:i + 500]
+                placeholders = ','.join('?' * len(part))
+                records.extend(
+                    Record(
+                        id=point_id,
+                        payload=json.loads(payload) if with_payload else None,
+                        vector=collection.vectors[row].tolist() if with_vectors else None
+                    )
+                    for point_id, row, payload in collection.db.execute(
+                        f"SELECT id, row, payload FROM points WHERE id IN ({placeholders})", part
+                    )
+                )
+            return records
+
+    # Search
+
+    def _ivf_assign(self, collection: _Collection, rows: "np.ndarray", vectors: "np.ndarray"):
+        assignments = collection.ivf['assignments']
+        if len(assignments) < collection.capacity:
+            grown = np.full(collection.capacity, -1, dtype=np.int32)
+            grown[:len(assignments)] = assignments
+            collection.ivf['assignments'] = assignments = grown
+        assignments[rows] = np.argmax(vectors @ collection.ivf['centroids'].T, axis=1)
+        collection.ivf_dirty = True
+
+    def build_ivf_index(self, collection_name: str, iterations: int = 10, seed: int = 0):
+        """Cluster the live vectors with spherical k-means into ~sqrt(n) lists and persist the index"""
+        with self._lock:
+            collection = self._open(collection_name)
+            live = np.flatnonzero(collection.alive[:collection.count])
+            n_lists = max(1, int(np.sqrt(len(live))))
+            rng = np.random.default_rng(seed)
+            sample = collection.vectors[rng.choice(live, size=min(len(live), n_lists * 64), replace=False)]
+            centroids = sample[rng.choice(len(sample), size=n_lists, replace=False)].copy()
+            for _ in range(iterations):
+                labels = np.argmax(sample @ centroids.T, axis=1)
+                for k in range(n_lists):
+                    members = sample[labels == k]
+                    if len(members):
+                        centroids[k] = members.mean(axis=0)
+                centroids /= np.maximum(np.linalg.norm(centroids, axis=1, keepdims=True), 1e-12)
+            assignments = np.full(collection.capacity, -1, dtype=np.int32)
+            for start in range(0, len(live), 65536):
+                rows = live[start:start + 65536]
+                assignments[rows] = np.argmax(collection.vectors[rows] @ centroids.T, axis=1)
+            collection.ivf = {'centroids': centroids, 'assignments': assignments,
+                              'trained_count': np.asarray(len(live))}
+            self._save_ivf(collection)
+
+    def _save_ivf(self, collection: _Collection):
+        np.savez(os.path.join(collection.path, "ivf.npz"), **collection.ivf)
+        collection.ivf_dirty = False
+
+    def _candidate_rows(self, collection: _Collection, query: "np.ndarray") -> Optional["np.ndarray"]:
+        """Rows in the IVF lists nearest to the query, or None for an exhaustive search"""
+        live = int(collection.count)
+        if live < self.ivf_min_points:
+            return None
+        if collection.ivf is None or live > 2 * int(collection.ivf['trained_count']):
+            name = os.path.basename(collection.path)
+            self.build_ivf_index(name)
+        centroids = collection.ivf['centroids']
+        lists = np.argsort(-(centroids @ query))[:self.nprobe]
+        return np.flatnonzero(np.isin(collection.ivf['assignments'][:collection.count], lists))
+
+    def search(self, collection_name: str, query_vector, query_filter=None, limit: int = 10,
+               with_payload: bool = True, with_vectors: bool = False, **kwargs) -> List[ScoredPoint]:
+        if limit <= 0:
+            return []
+        with self._lock:
+            collection = self._open(collection_name)
+            query = self._normalize(collection, query_vector)
+            if query_filter is not None:
+                rows = self._filter_rows(collection, query_filter)
+            else:
+                rows = self._candidate_rows(collection, query)
+            if rows is None:
+                scores = collection.vectors[:collection.count] @ query
+                scores[collection.alive[:collection.count] == 0] = -np.inf
+                rows = np.arange(collection.count)
+            else:
+                rows = rows[collection.alive[rows] == 1]
+                scores = collection.vectors[rows] @ query
+            if not len(rows):
+                return []
+
+            k = min(limit, len(rows))
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            top = top[np.isfinite(scores[top])]
+            top_rows = [int(rows[i]) for i in top]
+            placeholders = ','.join('?' * len(top_rows))
+            found = {
+                row: (point_id, payload) for point_id, row, payload in collection.db.execute(
+                    f"SELECT id, row, payload FROM points WHERE row IN ({placeholders})", top_rows
+                )
+            }
+            return [
+                ScoredPoint(
+                    id=found[row][0],
+                    score=float(scores[i]),
+                    payload=json.loads(found[row][1]) if with_payload else None,
+                    vector=collection.vectors[row].tolist() if with_vectors else None
+                )
+                for i, row in zip(top, top_rows) if row in found
+            ]
+
+    def search_batch(self, collection_name: str, requests, **kwargs) -> List[List[ScoredPoint]]:
+        """Run several searches; `requests` are Qdrant `SearchRequest`s or objects with the same fields"""
+        return [
+            self.search(collection_name, request.vector, query_filter=getattr(request, 'filter', None),
+                        limit=request.limit, with_payload=bool(getattr(request, 'with_payload', True)))
+            for request in requests
+        ]
+
+    def close(self, **kwargs):
+        with self._lock:
+            for collection in self._collections.values():
+                if collection.ivf is not None and collection.ivf_dirty:
+                    self._save_ivf(collection)
+                collection.vectors.flush()
+                collection.alive.flush()
+                self._write_meta(collection)
+                collection.db.close()
+            self._collections.clear()
+
+class AsyncLocalVectorStore:
+    """AsyncQdrantClient-style wrapper; every call, searches included, runs on a worker thread"""
+
+    def __init__(self, store: LocalVectorStore):
+        self.store = store
+
+    async def close(self, **kwargs):
+        self.store.close()
+
+    def __getattr__(self, name: str):
+        method = getattr(self.store, name)
+
+        async def call(*args, **kwargs):
+            return await asyncio.get_running_loop().run_in_executor(None, lambda: method(*args, **kwargs))
+        return call
+
+class AsyncMemoryVectorStore(AsyncLocalVectorStore):
+    """Async wrapper of the in-memory Qdrant the sync client uses; closing leaves the shared client open"""
+
+    async def close(self, **kwargs):
+        pass
+
+_local_stores: Dict[str, LocalVectorStore] = {}
+# The in-process Qdrant of ":memory:", created on first use: each client would otherwise start empty
+_memory_store = None
+
+def _vector_store_address() -> str:
+    return os.getenv("DOCRAG_VECTOR_STORE", DEFAULT_QDRANT_ADDRESS)
+
+def _local_store(address: str) -> LocalVectorStore:
+    path = os.path.abspath(address[len("local:"):] or ".docrag_vectors")
+    if path not in _local_stores:
+        _local_stores[path] = LocalVectorStore(path)
+    return _local_stores[path]
+
+def _memory_client():
+    global _memory_store
+    if _memory_store is None:
+        from qdrant_client import QdrantClient
+        _memory_store = QdrantClient(":memory:")
+    return _memory_store
+
+def connect_vector_store(address: Optional[str] = None):
+    """Client for `address` or DOCRAG_VECTOR_STORE: a Qdrant "host:port" (default), "local:<directory>",
+    or ":memory:" for Qdrant's in-process mode"""
+    address = address or _vector_store_address()
+    if address.startswith("local:"):
+        return _local_store(address)
+    if address == ":memory:":
+        return _memory_client()
+    from qdrant_client import QdrantClient
+    from collection_profiles import get_collection_profile
+    host, _, port = address.partition(":")
+    return QdrantClient(host, port=int(port or 6333), prefer_grpc=get_collection_profile().prefer_grpc)
+
+def connect_async_vector_store():
+    """Async counterpart of `connect_vector_store`, sharing the same local or in-memory store"""
+    address = _vector_store_address()
+    if address.startswith("local:"):
+        return AsyncLocalVectorStore(_local_store(address))
+    if address == ":memory:":
+        return AsyncMemoryVectorStore(_memory_client())
+    from qdrant_client import AsyncQdrantClient
+    from collection_profiles import get_collection_profile
+    host, _, port = address.partition(":")
+    return AsyncQdrantClient(host, port=int(port or 6333), prefer_grpc=get_collection_profile().prefer_grpc)